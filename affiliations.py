@@ -0,0 +1,220 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import INSTITUTION_GAZETTEER_PATH, GAZETTEER_MIN_WORDS
+
+# ===================== KEYWORD EXTRACTOR =====================
+
+# Abbreviated keywords, words, "&", or single punctuation marks (which end a phrase).
+_TOKEN_RE = re.compile(r"(?:Dept|Univ|Inst)\.|[^\W_][\w'’\-]*|&|[^\w\s]")
+_WORD_RE = re.compile(r"[^\W_]+")
+
+_KEYWORDS = {
+    "university", "universität", "universite", "université", "universidad", "universita", "università",
+    "institute", "institut", "instituto", "college", "laboratory", "laboratories", "lab", "labs",
+    "department", "dept", "dept.", "univ.", "inst.", "school", "centre", "center", "hospital", "faculty", "academy", "polytechnic",
+}
+# Lowercase words allowed inside a phrase ("University of ...", "Centre for ...").
+_CONNECTORS = {"of", "for", "and", "&", "the", "de", "di", "du", "des", "der", "für", "at", "in"}
+# Publishers named after universities ("Cambridge University Press") are not affiliations.
+_PUBLISHER_WORDS = {"press", "publishing", "publishers", "verlag"}
+_MAX_SIDE_WORDS = 6
+
+
+def _phrase_word(token: str) -> bool:
+    return token[0].isupper() or token.lower() in _CONNECTORS
+
+
+def _keyword_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Character spans of phrases that look like affiliations: a keyword
+    (University, Institute, Department, ...) with up to six capitalized or
+    connecting words on each side, not crossing punctuation. One pass over
+    the tokens.
+    """
+    tokens = [(m.start(), m.end(), m.group()) for m in _TOKEN_RE.finditer(text or "")]
+    found: List[Tuple[int, int]] = []
+    covered = -1
+    for i, (_, _, token) in enumerate(tokens):
+        if i <= covered or token.lower() not in _KEYWORDS or not token[0].isupper():
+            continue
+        first = i
+        while first > 0 and i - first < _MAX_SIDE_WORDS and _phrase_word(tokens[first - 1][2]):
+            first -= 1
+        last = i
+        while last + 1 < len(tokens) and last - i < _MAX_SIDE_WORDS and _phrase_word(tokens[last + 1][2]):
+            last += 1
+        covered = last
+        while first < i and tokens[first][2].lower() in _CONNECTORS:
+            first += 1
+        while last > i and tokens[last][2].lower() in _CONNECTORS:
+            last -= 1
+        if any(tokens[k][2].lower() in _PUBLISHER_WORDS for k in range(first, last + 2) if k < len(tokens)):
+            continue
+        found.append((tokens[first][0], tokens[last][1]))
+    return found
+
+
+def keyword_affiliations(text: str) -> List[str]:
+    """Affiliation-like phrases found by keyword (see _keyword_spans)."""
+    return [text[start:end] for start, end in _keyword_spans(text)]
+
+
+# ===================== GAZETTEER =====================
+
+def _fold(word: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", word)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def _word_spans(text: str) -> List[Tuple[int, int, str]]:
+    """(start, end, accent-folded casefolded word) for each word; words are the gazetteer's alphabet."""
+    return [(m.start(), m.end(), _fold(m.group())) for m in _WORD_RE.finditer(text or "")]
+
+
+def _words(text: str) -> List[str]:
+    return [word for _, _, word in _word_spans(text)]
+
+
+class Gazetteer:
+    """
+    Aho-Corasick automaton over institution names, word by word: every
+    known name in a text is found in one pass over its words, whatever the
+    number of names. Matches are reported leftmost-longest, as canonical
+    names.
+    """
+
+    def __init__(self, names: Iterable[Tuple[str, str]] = ()) -> None:
+        self.names: List[str] = []
+        self._name_index: Dict[str, int] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [-1]  # canonical name index ending at this node
+        self._depth: List[int] = [0]
+        self._fail: List[int] = [0]
+        self._link: List[int] = [0]  # nearest proper suffix node with an output (0 = none)
+        for alias, canonical in names:
+            self._add(alias, canonical)
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _add(self, alias: str, canonical: str) -> None:
+        words = _words(alias)
+        if len(words) < GAZETTEER_MIN_WORDS:
+            return  # single words ("Apple", "Science") match too much ordinary text
+        idx = self._name_index.get(canonical)
+        if idx is None:
+            idx = self._name_index[canonical] = len(self.names)
+            self.names.append(canonical)
+        node = 0
+        for word in words:
+            nxt = self._goto[node].get(word)
+            if nxt is None:
+                nxt = self._goto[node][word] = len(self._goto)
+                self._goto.append({})
+                self._out.append(-1)
+                self._depth.append(self._depth[node] + 1)
+            node = nxt
+        if self._out[node] < 0:
+            self._out[node] = idx
+
+    def _build(self) -> None:
+        self._fail = [0] * len(self._goto)
+        self._link = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for node in queue:  # breadth-first; the list grows while iterating
+            for word, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._link[child] = fail if self._out[fail] >= 0 else self._link[fail]
+                queue.append(child)
+
+    def spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, canonical name) of the names in text, leftmost-longest and non-overlapping."""
+        words = _word_spans(text)
+        matches: List[Tuple[int, int, int]] = []  # (start word, end word, name index)
+        node = 0
+        for pos, (_, _, word) in enumerate(words):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            hit = node if self._out[node] >= 0 else self._link[node]
+            while hit:
+                matches.append((pos - self._depth[hit] + 1, pos, self._out[hit]))
+                hit = self._link[hit]
+        found: List[Tuple[int, int, str]] = []
+        last_end = -1
+        for start, end, idx in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+            if start > last_end:
+                last_end = end
+                found.append((words[start][0], words[end][1], self.names[idx]))
+        return found
+
+    def find(self, text: str) -> List[str]:
+        """Canonical names found in text, in order of appearance."""
+        return list(dict.fromkeys(name for _, _, name in self.spans(text)))
+
+
+def load_gazetteer(path: str) -> Gazetteer:
+    """
+    Read a gazetteer file: one name per line, optionally "alias<TAB>canonical
+    name" (see `openalex_index.py institutions` for building one from an
+    OpenAlex snapshot).
+    """
+    def entries() -> Iterable[Tuple[str, str]]:
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                alias, _, canonical = line.rstrip("\n").partition("\t")
+                if alias.strip():
+                    yield alias, (canonical or alias).strip()
+
+    return Gazetteer(entries())
+
+
+_gazetteer_path: Optional[str] = INSTITUTION_GAZETTEER_PATH
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def configure_gazetteer(path: Optional[str] = INSTITUTION_GAZETTEER_PATH) -> None:
+    """Use the gazetteer file at path (loaded on first use), or none."""
+    global _gazetteer_path, _gazetteer
+    with _gazetteer_lock:
+        if path != _gazetteer_path:
+            _gazetteer_path, _gazetteer = path, None
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    global _gazetteer
+    if _gazetteer is None and _gazetteer_path:
+        with _gazetteer_lock:
+            if _gazetteer is None and _gazetteer_path:
+                _gazetteer = load_gazetteer(_gazetteer_path)
+    return _gazetteer
+
+
+def extract_affiliations(text: str) -> List[str]:
+    """
+    Affiliations mentioned in a reference, in order of appearance:
+    institutions from the gazetteer (when configured, as canonical names)
+    and keyword phrases that do not overlap one of them.
+    """
+    gazetteer = get_gazetteer()
+    spans = gazetteer.spans(text) if gazetteer is not None else []
+    for start, end in _keyword_spans(text):
+        if not any(start < g_end and g_start < end for g_start, g_end, _ in spans):
+            spans.append((start, end, text[start:end]))
+    found: List[str] = []
+    seen = set()
+    for _, _, name in sorted(spans):
+        key = " ".join(_words(name))
+        if key not in seen:
+            seen.add(key)
+            found.append(name)
+    return found
@@ -0,0 +1,742 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from config import DEFAULT_WORKERS, PARSER, S2_MODE
+from matching import normalize_title, title_similarity
+
+# ===================== SYNTHETIC CORPUS =====================
+
+_WORDS = (
+    "adaptive bayesian clustering deep dynamic efficient embedding estimation federated graph "
+    "hierarchical inference kernel latent learning linear manifold markov network neural online "
+    "optimization probabilistic pruning reinforcement representation robust scalable segmentation "
+    "semantic sparse spectral statistical stochastic temporal tensor transfer transformer variational "
+    "attention retrieval ranking compression sampling regression detection generation alignment"
+).split()
+_SURNAMES = (
+    "Smith Chen Garcia Müller Rossi Kim Nguyen Patel Ivanova Silva Cohen Tanaka Okafor Larsen Dubois "
+    "Novak Haddad Kowalski Moreau Fischer Santos Wang Li Zhang Ahmed Kaur Olsen Brown Jones Lopez"
+).split()
+_GIVEN = "Anna Ben Carla David Elena Farid Grace Hiro Ines Jonas Kofi Lena Marco Nadia Omar Priya".split()
+_INSTITUTIONS = (
+    "University of Oslo|ETH Zurich|Tsinghua University|MIT|University of Toronto|Max Planck Institute|"
+    "University of Cape Town|KAIST|Sorbonne University|University of São Paulo"
+).split("|")
+_VENUES = {
+    "journal-article": ["Journal of Machine Learning Research", "Pattern Recognition Letters",
+                        "IEEE Transactions on Neural Networks"],
+    "proceedings-article": ["Proceedings of the International Conference on Machine Learning",
+                            "Advances in Neural Information Processing Systems"],
+    "book": ["Springer", "MIT Press", "Cambridge University Press"],
+}
+
+
+def make_corpus(n_refs: int,
+                seed: int = 0,
+                doi_fraction: float = 0.3,
+                messy_fraction: float = 0.1,
+                ambiguous_fraction: float = 0.1) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Build n_refs cited works plus distractors. Returns (works, cited) where
+    works is everything the stub APIs know about and cited[i] is the work
+    behind reference i (its "indexed_in" says which services have it).
+    """
+    rng = random.Random(seed)
+    works: List[Dict[str, Any]] = []
+    cited: List[Dict[str, Any]] = []
+    titles = set()
+
+    def new_work(title: str, year: int, indexed_in: str) -> Dict[str, Any]:
+        n = len(works)
+        work_type = rng.choice(list(_VENUES))
+        authors = []
+        for _ in range(rng.randint(1, 6)):
+            initials = " ".join(f"{c}." for c in rng.sample("ABCDEFGHJKLMNPRSTW", rng.randint(1, 2)))
+            authors.append({
+                "surname": rng.choice(_SURNAMES),
+                "initials": initials,
+                "given": rng.choice(_GIVEN),
+                "institution": rng.choice(_INSTITUTIONS),
+            })
+        work = {
+            "n": n,
+            "openalex_id": f"https://openalex.org/W{100000 + n}",
+            "s2_id": f"bench{n:07d}",
+            "title": title,
+            "year": year,
+            "type": work_type,
+            "venue": rng.choice(_VENUES[work_type]),
+            "authors": authors,
+            "doi": f"10.5555/bench.{n}" if rng.random() < doi_fraction else None,
+            "indexed_in": indexed_in,
+            "messy": rng.random() < messy_fraction,
+            "cited_by_count": rng.randint(0, 5000),
+        }
+        works.append(work)
+        return work
+
+    for _ in range(n_refs):
+        title = ""
+        while not title or title in titles:
+            title = " ".join(rng.sample(_WORDS, rng.randint(4, 9))).capitalize()
+        titles.add(title)
+        r = rng.random()
+        indexed_in = "both" if r < 0.85 else "s2" if r < 0.95 else "none"
+        year = rng.randint(1985, 2024)
+        cited.append(new_work(title, year, indexed_in))
+        if rng.random() < ambiguous_fraction:
+            # same title, different year/authors: the local scorer should hesitate
+            new_work(title, year + rng.choice([-2, -1, 1, 2]), "both")
+    return works, cited
+
+
+def format_reference(work: Dict[str, Any]) -> str:
+    """Bracketed-label reference text; "messy" works use an MLA-like layout the rules parser doubts."""
+    authors = work["authors"]
+    first = authors[0]
+    label = f"[{first['surname']} '{work['year'] % 100:02d}]"
+    if work["messy"]:
+        names = [f"{first['surname']}, {first['given']}"] + [f"{a['given']} {a['surname']}" for a in authors[1:]]
+        text = f"{label} {', and '.join(names)}. {work['title']}. {work['venue']} {work['n'] % 40 + 1}.2 ({work['year']}): 1-20."
+    else:
+        names = [f"{a['surname']}, {a['initials']}" for a in authors]
+        joined = names[0] if len(names) == 1 else ", ".join(names[:-1]) + ", & " + names[-1]
+        text = f"{label} {joined} ({work['year']}). {work['title']}. {work['venue']}, {work['n'] % 40 + 1}(2), 1-20."
+    if work["doi"]:
+        text += f" https://doi.org/{work['doi']}"
+    return text
+
+
+def _openalex_work(work: Dict[str, Any]) -> Dict[str, Any]:
+    # Full work objects carry abstracts, concepts and reference lists the pipeline
+    # never reads; they are generated here so `select=` shows up in the byte counts.
+    words = normalize_title(work["title"]).split() * 25
+    rng = random.Random(work["n"])
+    return {
+        "id": work["openalex_id"],
+        "doi": f"https://doi.org/{work['doi']}" if work["doi"] else None,
+        "title": work["title"],
+        "display_name": work["title"],
+        "publication_year": work["year"],
+        "type": work["type"],
+        "cited_by_count": work["cited_by_count"],
+        "authorships": [
+            {
+                "author": {"id": f"https://openalex.org/A{zlib.crc32(a['surname'].encode()) % 10**7}",
+                           "display_name": f"{a['initials']} {a['surname']}"},
+                "institutions": [{"display_name": a["institution"]}],
+                "countries": ["US"],
+                "raw_affiliation_strings": [f"Department of Computing, {a['institution']}"],
+            }
+            for a in work["authors"]
+        ],
+        "abstract_inverted_index": {w: [i for i, x in enumerate(words) if x == w] for w in set(words)},
+        "concepts": [{"id": f"https://openalex.org/C{rng.randrange(10**8)}", "display_name": w, "level": 1,
+                      "score": round(rng.random(), 3)} for w in words[:10]],
+        "referenced_works": [f"https://openalex.org/W{rng.randrange(10**9)}" for _ in range(40)],
+    }
+
+
+def _s2_paper(work: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "paperId": work["s2_id"],
+        "title": work["title"],
+        "year": work["year"],
+        "externalIds": {"DOI": work["doi"]} if work["doi"] else {},
+        "authors": [
+            {"name": f"{a['given']} {a['surname']}", "affiliations": [a["institution"]]}
+            for a in work["authors"]
+        ],
+    }
+
+
+# ===================== PDF WRITER =====================
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_bibliography_pdf(references: List[str], path: str, lines_per_page: int = 66, width: int = 100) -> int:
+    """Write references as a plain-text (Helvetica) PDF; returns the page count."""
+    lines = ["Bibliography"]
+    for ref in references:
+        lines.extend(textwrap.wrap(ref, width))
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, page in enumerate(pages):
+        content = "BT /F1 9 Tf 11 TL 36 806 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in page) + " ET"
+        data = content.encode("cp1252", "replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as fh:
+        fh.write(out)
+    return len(pages)
+
+
+# ===================== STUB API SERVER =====================
+
+class StubState:
+    """Corpus indexes, latency / 429 settings and request counters for the stub server."""
+
+    def __init__(self,
+                 works: List[Dict[str, Any]],
+                 latency_ms: Dict[str, float],
+                 error_rate: Dict[str, float],
+                 jitter: float = 0.5,
+                 seed: int = 0,
+                 recorded: Optional[Dict[Tuple[str, str], Tuple[int, Any]]] = None):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.recorded = recorded or {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+        self.openalex = [w for w in works if w["indexed_in"] == "both"]
+        self.s2 = [w for w in works if w["indexed_in"] in ("both", "s2")]
+        self.oa_doi = {w["doi"]: w for w in self.openalex if w["doi"]}
+        self.s2_doi = {w["doi"]: w for w in self.s2 if w["doi"]}
+        self.oa_index = self._index(self.openalex)
+        self.s2_index = self._index(self.s2)
+
+    @staticmethod
+    def _index(works: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        index: Dict[str, List[Dict[str, Any]]] = {}
+        for w in works:
+            for token in set(normalize_title(w["title"]).split()):
+                index.setdefault(token, []).append(w)
+        return index
+
+    def delay(self, service: str) -> None:
+        median = self.latency_ms.get(service, 0.0)
+        if median > 0:
+            with self.lock:
+                factor = self.rng.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            time.sleep(median * factor / 1000)
+
+    def throttled(self, service: str) -> bool:
+        with self.lock:
+            self.counts[f"{service}_requests"] += 1
+            hit = self.rng.random() < self.error_rate.get(service, 0.0)
+            if hit:
+                self.counts[f"{service}_429"] += 1
+            return hit
+
+    @staticmethod
+    def search(index: Dict[str, List[Dict[str, Any]]], query: str, require_all: bool, limit: int) -> List[Dict[str, Any]]:
+        tokens = normalize_title(query).split()
+        if not tokens:
+            return []
+        scores: Counter = Counter()
+        by_n: Dict[int, Dict[str, Any]] = {}
+        for token in set(tokens):
+            for w in index.get(token, []):
+                scores[w["n"]] += 1
+                by_n[w["n"]] = w
+        needed = len(set(tokens)) if require_all else max(1, len(set(tokens)) // 2)
+        ranked = [by_n[n] for n, score in scores.most_common() if score >= needed]
+        return ranked[:limit]
+
+
+def _openalex_works(state: StubState, params: Dict[str, str]) -> Dict[str, Any]:
+    limit = int(params.get("per_page", 25))
+    results: List[Dict[str, Any]] = []
+    filters: Dict[str, str] = {}
+    for part in re.split(r",(?=[a-z_.]+:)", params.get("filter", "")):
+        if ":" in part:
+            key, value = part.split(":", 1)
+            filters[key] = value
+
+    if "doi" in filters:
+        for doi in filters["doi"].split("|"):
+            work = state.oa_doi.get(doi.lower())
+            if work:
+                results.append(work)
+    elif "title.search" in filters:
+        results = state.search(state.oa_index, filters["title.search"], require_all=True, limit=limit)
+    elif params.get("search"):
+        results = state.search(state.oa_index, params["search"], require_all=False, limit=limit)
+
+    if "type" in filters:
+        results = [w for w in results if w["type"] == filters["type"]]
+    if "from_publication_date" in filters:
+        low = int(filters["from_publication_date"][:4])
+        high = int(filters.get("to_publication_date", "9999")[:4])
+        results = [w for w in results if low <= w["year"] <= high]
+    works = [_openalex_work(w) for w in results[:limit]]
+    if params.get("select"):
+        fields = params["select"].split(",")
+        works = [{f: w.get(f) for f in fields} for w in works]
+    return {"meta": {"count": len(results)}, "results": works}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    state: StubState  # set on the subclass made by start_stub_server
+
+    def log_message(self, format: str, *args: Any) -> None:  # keep benchmark output readable
+        pass
+
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, body: Optional[Dict[str, Any]] = None) -> None:
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        service = "openalex" if url.path.startswith("/openalex/") else "s2"
+        state = self.state
+
+        state.delay(service)
+        if state.throttled(service):
+            self._send(429, {"message": "Too Many Requests"}, {"Retry-After": "1"})
+            return
+
+        recorded_key = (url.path, json.dumps({k: v for k, v in sorted(params.items()) if k != "mailto"}))
+        if recorded_key in state.recorded:
+            self._send(*state.recorded[recorded_key])
+            return
+
+        path = url.path.split("/", 2)[-1]
+        if service == "openalex" and path == "works":
+            self._send(200, _openalex_works(state, params))
+        elif path.endswith("paper/search/match"):
+            found = state.search(state.s2_index, params.get("query", ""), require_all=True, limit=1)
+            if found:
+                self._send(200, {"data": [_s2_paper(found[0])]})
+            else:
+                self._send(404, {"error": "Title match not found"})
+        elif path.endswith("paper/search"):
+            found = state.search(state.s2_index, params.get("query", ""), require_all=False,
+                                 limit=int(params.get("limit", 10)))
+            self._send(200, {"total": len(found), "data": [_s2_paper(w) for w in found]})
+        elif path.endswith("paper/batch"):
+            ids = (body or {}).get("ids", [])
+            papers = [state.s2_doi.get(pid[4:].lower()) if pid.upper().startswith("DOI:") else None for pid in ids]
+            self._send(200, [_s2_paper(w) if w else None for w in papers])
+        else:
+            self._send(404, {"error": f"unknown endpoint {url.path}"})
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        self._handle(json.loads(raw) if raw else {})
+
+
+def load_recorded(path: str) -> Dict[Tuple[str, str], Tuple[int, Any]]:
+    """
+    Recorded responses, one JSON object per line:
+    {"path": "/openalex/works", "params": {...}, "status": 200, "body": {...}}
+    (params without mailto). They take precedence over synthetic answers.
+    """
+    recorded: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                entry = json.loads(line)
+                params = {k: str(v) for k, v in sorted(entry.get("params", {}).items()) if k != "mailto"}
+                recorded[(entry["path"], json.dumps(params))] = (entry.get("status", 200), entry["body"])
+    return recorded
+
+
+def start_stub_server(state: StubState) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve the stub APIs on 127.0.0.1 (random port) in a daemon thread; returns (server, base url)."""
+    handler = type("StubHandler", (_StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ===================== FAKE LLM =====================
+
+_PROMPT_FIELD_RE = re.compile(r"\[\[ ## (\w+) ## \]\]\n(.*?)(?=\n\n\[\[ ## |\n\nRespond with|\Z)", re.DOTALL)
+_WANTED_FIELD_RE = re.compile(r"`\[\[ ## (\w+) ## \]\]`")
+
+
+def make_fake_lm(oracle: Dict[str, Dict[str, Any]], latency_ms: float, jitter: float = 0.5, seed: int = 0) -> Any:
+    """
+    Deterministic stand-in for the DSPy LM (install with dspy_models.configure_lm).
+    Parse answers come from oracle (reference text -> true fields) or the
+    rule-based parser; matches pick the candidate with the closest title.
+    Each call sleeps for a lognormal latency around latency_ms.
+    """
+    from dspy.utils.dummies import DummyLM
+    from reference_parser import parse_reference_rules
+
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class FakeLM(DummyLM):
+        def __init__(self) -> None:
+            super().__init__([], follow_examples=True)
+            self.model = "benchmark/fake-lm"
+            self.calls: Counter = Counter()
+            self.prompt_chars = 0
+
+        def _use_example(self, messages: List[Dict[str, str]]) -> str:
+            prompt = messages[-1]["content"]
+            inputs = {name: value.strip() for name, value in _PROMPT_FIELD_RE.findall(prompt)}
+            wanted = [f for f in _WANTED_FIELD_RE.findall(prompt) if f != "completed"]
+            with lock:
+                self.prompt_chars += sum(len(m.get("content") or "") for m in messages)
+                delay = latency_ms * (rng.lognormvariate(0, jitter) if jitter else 1.0) / 1000
+            time.sleep(delay)
+
+            if "chosen_id" in wanted:
+                self.calls["match"] += 1
+                answer = self._choose(inputs)
+            elif "parsed_json" in wanted:
+                self.calls["parse_batch"] += 1
+                answer = {"parsed_json": self._parse_batch(inputs.get("refs_json") or "[]")}
+            else:
+                self.calls["parse" if "paper_title" in wanted else "work_type"] += 1
+                answer = self._parse(inputs.get("ref_text", ""))
+            return self._format_answer_fields({f: answer.get(f, "") for f in wanted})
+
+        @staticmethod
+        def _parse(ref_text: str) -> Dict[str, Any]:
+            truth = oracle.get(" ".join(ref_text.split()))
+            parsed = truth or parse_reference_rules(ref_text)
+            return {
+                "paper_title": parsed["paper_title"],
+                "year": str(parsed["year"] or "null"),
+                "authors_json": json.dumps(parsed["authors"]),
+                "emails_json": "[]",
+                "authors_structured_json": "[]",
+                "work_type": parsed.get("work_type") or "unknown",
+            }
+
+        @classmethod
+        def _parse_batch(cls, refs_json: str) -> str:
+            items = []
+            for ref in json.loads(refs_json):
+                answer = cls._parse(ref["ref_text"])
+                items.append({
+                    "index": ref["index"],
+                    "paper_title": answer["paper_title"],
+                    "year": None if answer["year"] == "null" else int(answer["year"]),
+                    "authors": json.loads(answer["authors_json"]),
+                    "emails": [],
+                    "authors_structured": [],
+                    "work_type": answer["work_type"],
+                })
+            return json.dumps(items)
+
+        @staticmethod
+        def _choose(inputs: Dict[str, str]) -> Dict[str, Any]:
+            try:
+                candidates = json.loads(inputs.get("candidates_json") or "[]")
+            except ValueError:
+                candidates = []
+            title = inputs.get("parsed_title", "")
+            year = inputs.get("parsed_year", "")
+            best = max(
+                candidates,
+                key=lambda c: (title_similarity(title, c.get("title") or ""), str(c.get("publication_year")) == year),
+                default=None,
+            )
+            if best and title_similarity(title, best.get("title") or "") >= 0.8:
+                return {"chosen_id": best.get("id", ""), "rationale": "closest title"}
+            return {"chosen_id": "none", "rationale": "no close title"}
+
+    return FakeLM()
+
+
+# ===================== MEASUREMENT =====================
+
+def _stage_name(row: Dict[str, Any]) -> str:
+    labels = ",".join(f"{k}={v}" for k, v in row["labels"].items())
+    return f"{row['name']}[{labels}]" if labels else row["name"]
+
+
+def _run_child(spec_path: str, result_path: str) -> None:
+    """Body of the per-size subprocess: patch endpoints + LM, run the pipeline, dump metrics."""
+    with open(spec_path, "r", encoding="utf-8") as fh:
+        spec = json.load(fh)
+
+    import pipeline
+    import pdf_utils
+    import openalex_client
+    import semantic_scholar_client
+    import dspy_models
+
+    openalex_client.OPENALEX_BASE_URL = spec["openalex_url"]
+    semantic_scholar_client.SEMANTIC_SCHOLAR_BASE_URL = spec["s2_url"]
+    semantic_scholar_client.SEMANTIC_SCHOLAR_API_KEY = "benchmark"  # sends x-api-key like a keyed run
+    fake_lm = make_fake_lm(spec["oracle"], spec["llm_latency_ms"], spec["jitter"], spec["seed"])
+    dspy_models.configure_lm(lm=fake_lm)
+
+    # Stage latencies come from the pipeline's own metrics spans; only time-to-first-reference is added here.
+    import metrics
+
+    logging.basicConfig(level=logging.ERROR)
+    extract = pipeline.iter_references_from_pdf
+    first_ref: List[float] = []
+
+    def timed_extract(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        for ref in extract(*args, **kwargs):
+            if not first_ref:
+                first_ref.append(time.perf_counter() - start)
+            yield ref
+        metrics.record_span("extract_total", time.perf_counter() - start)
+
+    pipeline.iter_references_from_pdf = timed_extract
+
+    work_dir = spec["work_dir"]
+    output_path = os.path.join(work_dir, "output.xlsx")
+    start = time.perf_counter()
+    pipeline.process_pdf_to_excel(
+        spec["pdf_path"],
+        output_path,
+        workers=spec["workers"],
+        cache_dir=os.path.join(work_dir, "cache"),
+        use_cache=spec["use_cache"],
+        parser=spec["parser"],
+        batch_openalex=spec["batch_openalex"],
+        parse_batch_size=spec["parse_batch_size"],
+        hedge_delay=spec["hedge_delay"],
+        s2_mode=spec["s2_mode"],
+        checkpoint_path=os.path.join(work_dir, "run.checkpoint.jsonl"),
+        metrics_path=os.path.join(work_dir, "run.metrics.json"),
+    )
+    elapsed = time.perf_counter() - start
+
+    # Accuracy against the generated truth (rows are in reference order).
+    expected = spec["expected_ids"]
+    correct = 0
+    with open(os.path.join(work_dir, "run.checkpoint.jsonl"), "r", encoding="utf-8") as fh:
+        entries = [json.loads(line) for line in fh if line.strip()]
+    rows = [entry["record"] for entry in entries if "record" in entry]  # not the batch stages' entries
+    matched = {}
+    for row in rows:
+        m = re.search(r"Matched to (\S+)", row.get("notes", ""))
+        matched[" ".join(row.get("reference_raw", "").split())] = m.group(1) if m else None
+    for ref_text, expected_id in expected:
+        if matched.get(ref_text) == expected_id:
+            correct += 1
+
+    if first_ref:
+        metrics.record_span("extract_first_ref", first_ref[0])
+    snapshot = metrics.snapshot()
+    peak = pdf_utils.peak_rss_bytes()
+    result = {
+        "references": len(rows),
+        "seconds": round(elapsed, 3),
+        "refs_per_sec": round(len(rows) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak / 2**20, 1) if peak else None,
+        "accuracy": round(correct / len(expected), 3) if expected else None,
+        "llm_calls": dict(fake_lm.calls),
+        "llm_prompt_chars": fake_lm.prompt_chars,
+        "stages": {
+            _stage_name(row): {"n": row["count"], "p50": row["p50_ms"], "p90": row["p90_ms"],
+                               "p99": row["p99_ms"], "max": row["max_ms"]}
+            for row in snapshot["spans"]
+        },
+        "counters": {_stage_name(row): row["value"] for row in snapshot["counters"]},
+    }
+    with open(result_path, "w", encoding="utf-8") as fh:
+        json.dump(result, fh)
+
+
+def run_size(size: int, args: argparse.Namespace, recorded: Optional[Dict] = None) -> Dict[str, Any]:
+    """Generate a bibliography of `size` references, serve its corpus and benchmark one pipeline run."""
+    works, cited = make_corpus(size, seed=args.seed, messy_fraction=args.messy_fraction,
+                               ambiguous_fraction=args.ambiguous_fraction)
+    references = [format_reference(w) for w in cited]
+    state = StubState(
+        works,
+        latency_ms={"openalex": args.openalex_latency_ms, "s2": args.s2_latency_ms},
+        error_rate={"openalex": args.openalex_429_rate, "s2": args.s2_429_rate},
+        jitter=args.jitter,
+        seed=args.seed,
+        recorded=recorded,
+    )
+    # One port per service: rate limiters are keyed by host:port, so injected
+    # S2 429s must not pause the OpenAlex stages.
+    servers = {service: start_stub_server(state) for service in ("openalex", "s2")}
+    try:
+        with tempfile.TemporaryDirectory(prefix="refbench-") as work_dir:
+            pdf_path = os.path.join(work_dir, "bibliography.pdf")
+            pages = write_bibliography_pdf(references, pdf_path)
+            oracle = {
+                " ".join(ref.split()): {
+                    "paper_title": w["title"],
+                    "year": w["year"],
+                    "authors": [f"{a['initials']} {a['surname']}" for a in w["authors"]],
+                    "work_type": w["type"],
+                }
+                for ref, w in zip(references, cited)
+            }
+            spec = {
+                "pdf_path": pdf_path,
+                "work_dir": work_dir,
+                "openalex_url": f"{servers['openalex'][1]}/openalex",
+                "s2_url": f"{servers['s2'][1]}/s2/graph/v1",
+                "oracle": oracle,
+                "expected_ids": [
+                    [" ".join(ref.split()), w["openalex_id"] if w["indexed_in"] == "both" else None]
+                    for ref, w in zip(references, cited)
+                ],
+                "llm_latency_ms": args.llm_latency_ms,
+                "jitter": args.jitter,
+                "seed": args.seed,
+                "workers": args.workers,
+                "use_cache": not args.no_cache,
+                "parser": args.parser,
+                "batch_openalex": args.batch_openalex,
+                "parse_batch_size": args.parse_batch_size,
+                "hedge_delay": args.hedge_delay,
+                "s2_mode": args.s2_mode,
+            }
+            spec_path = os.path.join(work_dir, "spec.json")
+            result_path = os.path.join(work_dir, "result.json")
+            with open(spec_path, "w", encoding="utf-8") as fh:
+                json.dump(spec, fh)
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--_child", spec_path, result_path],
+                           check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            with open(result_path, "r", encoding="utf-8") as fh:
+                result = json.load(fh)
+    finally:
+        for server, _ in servers.values():
+            server.shutdown()
+            server.server_close()
+
+    result.update({"size": size, "pages": pages, "http": dict(state.counts)})
+    return result
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    http = result["http"]
+    print(
+        f"{result['size']:>6} refs  {result['pages']:>4} pages  {result['seconds']:>8.2f} s  "
+        f"{result['refs_per_sec']:>8.2f} refs/s  peak {result['peak_rss_mb']} MB  "
+        f"accuracy {result['accuracy']}  LLM calls {sum(result['llm_calls'].values())} {result['llm_calls']}  "
+        f"OpenAlex {http.get('openalex_requests', 0)} req / {http.get('openalex_429', 0)} 429  "
+        f"S2 {http.get('s2_requests', 0)} req / {http.get('s2_429', 0)} 429"
+    )
+    counters = result.get("counters", {})
+    if counters:
+        print("         " + "  ".join(f"{name}={value:g}" for name, value in sorted(counters.items())))
+    for stage, p in result["stages"].items():
+        if p.get("n"):
+            print(f"         {stage:<34} n={p['n']:<6} p50={p['p50']:>9.1f} ms  p90={p['p90']:>9.1f} ms  "
+                  f"p99={p['p99']:>9.1f} ms  max={p['max']:>9.1f} ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for the reference pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Bibliography sizes to generate (10 to 5000 references).")
+    parser.add_argument("--workers", type=int, default=max(8, DEFAULT_WORKERS))
+    parser.add_argument("--parser", choices=["llm", "rules", "auto"], default=PARSER)
+    parser.add_argument("--batch_openalex", action="store_true")
+    parser.add_argument("--parse_batch_size", type=int, default=1)
+    parser.add_argument("--hedge_delay", type=float, default=None)
+    parser.add_argument("--s2_mode", choices=["fallback", "speculative", "bulk"], default=S2_MODE)
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="Disable the response / prediction caches (each run starts with an empty cache anyway).")
+    parser.add_argument("--llm_latency_ms", type=float, default=300.0)
+    parser.add_argument("--openalex_latency_ms", type=float, default=80.0)
+    parser.add_argument("--s2_latency_ms", type=float, default=150.0)
+    parser.add_argument("--jitter", type=float, default=0.5, help="Lognormal sigma of injected latencies (0 = fixed).")
+    parser.add_argument("--openalex_429_rate", type=float, default=0.0)
+    parser.add_argument("--s2_429_rate", type=float, default=0.05)
+    parser.add_argument("--messy_fraction", type=float, default=0.1,
+                        help="Share of references in a layout the rule-based parser is unsure about.")
+    parser.add_argument("--ambiguous_fraction", type=float, default=0.1,
+                        help="Share of references with a same-title distractor work.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--recorded", default=None, help="JSONL of recorded API responses (see load_recorded).")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Earlier --json output; exit 1 if refs/sec regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed refs/sec drop vs --baseline (fraction, default: %(default)s).")
+    parser.add_argument("--_child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args._child:
+        _run_child(*args._child)
+        return 0
+
+    recorded = load_recorded(args.recorded) if args.recorded else None
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking {size} references...")
+        result = run_size(size, args, recorded)
+        _print_result(result)
+        results.append(result)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("_child", "json_path", "baseline")},
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            baseline = {r["size"]: r for r in json.load(fh)["results"]}
+        regressed = False
+        for result in results:
+            before = baseline.get(result["size"])
+            if not before:
+                continue
+            floor = before["refs_per_sec"] * (1 - args.tolerance)
+            status = "ok" if result["refs_per_sec"] >= floor else "REGRESSED"
+            regressed = regressed or status != "ok"
+            print(f"{result['size']:>6} refs: {before['refs_per_sec']:.2f} -> {result['refs_per_sec']:.2f} refs/s ({status})")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from metrics import incr
+from http_client import json_loads
+from config import (
+    CACHE_DIR,
+    CACHE_TTL_SECONDS,
+    CACHE_NEGATIVE_TTL_SECONDS,
+    CACHE_MAX_ENTRIES,
+)
+
+# Query parameters that do not change the response (contact info etc.).
+_IGNORED_PARAMS = {"mailto"}
+
+
+class SqliteCache:
+    """
+    Small persistent key/value store on SQLite with TTL and LRU eviction.
+    Values are stored as JSON; safe to share between threads.
+    """
+
+    def __init__(self, path: str, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]  # metrics label
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)"
+            )
+            self._conn.commit()
+        self._trim()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value); expired entries count as misses and are dropped."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                incr("cache_misses", cache=self.name)
+                return False, None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        incr("cache_hits", cache=self.name)
+        return True, json_loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a JSON-serializable value; ttl=None keeps it until evicted."""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            self._conn.commit()
+            self._writes_since_trim += 1
+            should_trim = self._writes_since_trim >= 100
+        if should_trim:
+            self._trim()
+
+    def _trim(self) -> None:
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        with self._lock:
+            self._writes_since_trim = 0
+            self._conn.execute(
+                "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?",
+                (time.time(),),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)",
+                    (excess,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _normalize_param_value(value: Any) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def response_key(endpoint: str, params: Dict[str, Any]) -> str:
+    """Cache key from endpoint + normalized query params (order/case/whitespace-insensitive)."""
+    normalized = sorted(
+        (k, _normalize_param_value(v))
+        for k, v in (params or {}).items()
+        if k not in _IGNORED_PARAMS and v is not None
+    )
+    raw = json.dumps([endpoint, normalized], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ===================== RESPONSE CACHE =====================
+
+_response_cache: Optional[SqliteCache] = None
+_response_cache_enabled = True
+_response_cache_dir = CACHE_DIR
+_response_cache_lock = threading.Lock()
+
+
+def configure_response_cache(cache_dir: Optional[str] = CACHE_DIR, enabled: bool = True) -> None:
+    """Point the API response cache at cache_dir, or disable it."""
+    global _response_cache, _response_cache_enabled, _response_cache_dir
+    with _response_cache_lock:
+        if _response_cache is not None:
+            _response_cache.close()
+            _response_cache = None
+        _response_cache_enabled = enabled and bool(cache_dir)
+        _response_cache_dir = cache_dir or CACHE_DIR
+
+
+def get_response_cache() -> Optional[SqliteCache]:
+    """Return the shared response cache (opened lazily), or None if disabled."""
+    global _response_cache
+    if not _response_cache_enabled:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None and _response_cache_enabled:
+                _response_cache = SqliteCache(os.path.join(_response_cache_dir, "responses.sqlite3"))
+    return _response_cache
+
+
+def cached_response(endpoint: str, params: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Look up a cached API result; returns (hit, value)."""
+    cache = get_response_cache()
+    if cache is None:
+        return False, None
+    return cache.get(response_key(endpoint, params))
+
+
+def store_response(endpoint: str, params: Dict[str, Any], value: Any) -> None:
+    """Cache an API result; empty results get the shorter negative TTL."""
+    cache = get_response_cache()
+    if cache is None:
+        return
+    ttl = CACHE_TTL_SECONDS if value else CACHE_NEGATIVE_TTL_SECONDS
+    cache.set(response_key(endpoint, params), value, ttl=ttl)
+
+
+# ===================== PREDICTION CACHE =====================
+# LLM outputs are content-addressed (see dspy_models._prediction_key) and
+# never expire; stale entries simply stop being looked up.
+
+_prediction_cache: Optional[SqliteCache] = None
+_prediction_cache_enabled = True
+_prediction_cache_dir = CACHE_DIR
+_prediction_cache_lock = threading.Lock()
+
+
+def configure_prediction_cache(cache_dir: Optional[str] = CACHE_DIR, enabled: bool = True) -> None:
+    """Point the DSPy prediction cache at cache_dir, or disable it."""
+    global _prediction_cache, _prediction_cache_enabled, _prediction_cache_dir
+    with _prediction_cache_lock:
+        if _prediction_cache is not None:
+            _prediction_cache.close()
+            _prediction_cache = None
+        _prediction_cache_enabled = enabled and bool(cache_dir)
+        _prediction_cache_dir = cache_dir or CACHE_DIR
+
+
+def get_prediction_cache() -> Optional[SqliteCache]:
+    """Return the shared prediction cache (opened lazily), or None if disabled."""
+    global _prediction_cache
+    if not _prediction_cache_enabled:
+        return None
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None and _prediction_cache_enabled:
+                _prediction_cache = SqliteCache(os.path.join(_prediction_cache_dir, "predictions.sqlite3"))
+    return _prediction_cache
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def reference_key(ref_text: str) -> str:
+    """Stable key for a reference (whitespace-insensitive hash of its text)."""
+    normalized = " ".join((ref_text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """
+    Append-only JSONL file of finished output rows, one line per reference:
+    {"key": reference_key(ref_text), "record": {...}}.
+
+    The batch stages also save intermediate results per reference (its
+    parse, OpenAlex candidates or match) as
+    {"key": ..., "stage": "parsed", "value": ...}, so a run interrupted
+    before a reference's row is written keeps the stages already done.
+
+    Each line is flushed as soon as it is added, so an interrupted run can
+    be resumed without redoing finished references. Without resume, an
+    existing non-empty file is moved to <path>.bak rather than overwritten.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._stages: Dict[Tuple[str, str], Any] = {}  # (stage, key) -> value
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+        elif not resume and os.path.exists(path) and os.path.getsize(path) > 0:
+            os.replace(path, path + ".bak")
+            logger.warning("Moved the existing checkpoint to %s.bak (run with --resume to continue from it).", path)
+        self._fh = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                    if "stage" in entry:
+                        self._stages[(entry["stage"], entry["key"])] = entry["value"]
+                    else:
+                        self._records[entry["key"]] = entry["record"]
+                except (ValueError, KeyError, TypeError):
+                    # a line cut short by a crash; that reference is simply redone
+                    continue
+        # stage results of references with a finished row are not needed any more
+        self._stages = {sk: value for sk, value in self._stages.items() if sk[1] not in self._records}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, ref_text: str) -> Optional[Dict[str, Any]]:
+        return self._records.get(reference_key(ref_text))
+
+    def add(self, ref_text: str, record: Dict[str, Any]) -> None:
+        key = reference_key(ref_text)
+        line = json.dumps({"key": key, "record": record}, ensure_ascii=False, default=str)
+        with self._lock:
+            self._records[key] = record
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def get_stage(self, stage: str, ref_text: str) -> Optional[Any]:
+        """A saved intermediate result ("parsed", "candidates", "match") for a reference, or None."""
+        return self._stages.get((stage, reference_key(ref_text)))
+
+    def add_stage(self, stage: str, ref_text: str, value: Any) -> None:
+        key = reference_key(ref_text)
+        line = json.dumps({"key": key, "stage": stage, "value": value}, ensure_ascii=False, default=str)
+        with self._lock:
+            self._stages[(stage, key)] = value
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
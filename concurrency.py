@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+from config import (
+    LLM_MAX_CONCURRENCY,
+    OPENALEX_MAX_CONCURRENCY,
+    SEMANTIC_SCHOLAR_MAX_CONCURRENCY,
+)
+
+# Per-service caps on in-flight calls, shared by every worker thread.
+_limits: Dict[str, int] = {
+    "llm": LLM_MAX_CONCURRENCY,
+    "openalex": OPENALEX_MAX_CONCURRENCY,
+    "semantic_scholar": SEMANTIC_SCHOLAR_MAX_CONCURRENCY,
+}
+_slots: Dict[str, threading.BoundedSemaphore] = {
+    name: threading.BoundedSemaphore(max(1, n)) for name, n in _limits.items()
+}
+# asyncio semaphores are loop-bound; the async API gets its own set per loop.
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def configure_limits(llm: Optional[int] = None,
+                     openalex: Optional[int] = None,
+                     semantic_scholar: Optional[int] = None) -> None:
+    """
+    Override the per-service concurrency caps.
+    Call before starting workers; calls already holding a slot are unaffected.
+    """
+    for name, value in (("llm", llm), ("openalex", openalex), ("semantic_scholar", semantic_scholar)):
+        if value is None:
+            continue
+        _limits[name] = max(1, int(value))
+        _slots[name] = threading.BoundedSemaphore(_limits[name])
+    _async_slots.clear()
+
+
+def get_limits() -> Dict[str, int]:
+    """Return the current per-service caps."""
+    return dict(_limits)
+
+
+@contextmanager
+def slot(name: str) -> Iterator[None]:
+    """Hold one of the named service's concurrency slots for the duration of a call."""
+    sem = _slots[name]
+    sem.acquire()
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+@asynccontextmanager
+async def aslot(name: str) -> AsyncIterator[None]:
+    """Async counterpart of slot() for coroutines on the running event loop."""
+    loop = asyncio.get_running_loop()
+    loop_slots = _async_slots.get(loop)
+    if loop_slots is None:
+        loop_slots = {n: asyncio.Semaphore(limit) for n, limit in _limits.items()}
+        _async_slots[loop] = loop_slots
+    async with loop_slots[name]:
+        yield
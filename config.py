@@ -7,12 +7,149 @@ OPENALEX_MAILTO = "shinu.shibu1798@gmail.com"
 SEMANTIC_SCHOLAR_BASE_URL = "https://api.semanticscholar.org/graph/v1"
 SEMANTIC_SCHOLAR_TIMEOUT = 20
 SEMANTIC_SCHOLAR_API_KEY = ""
+SEMANTIC_SCHOLAR_BATCH_SIZE = 500  # max ids per /paper/batch request
+# How the Semantic Scholar fallback runs for references without an OpenAlex match:
+#   "fallback"    - search after OpenAlex matching fails (one reference at a time)
+#   "speculative" - start the search alongside OpenAlex; use it only if needed
+#   "bulk"        - after all references are matched, resolve the unmatched ones via
+#                   /paper/batch (DOIs) and /paper/search/match (titles)
+S2_MODE = "fallback"
 
 # Hugging Face or Ollama model config
 # Hugging Face is much more faster than ollama
 MODEL_NAME = "huggingface/meta-llama/Llama-3.3-70B-Instruct"
 
 #MODEL_NAME="ollama/llama3.1"
-#API_BASE="http://localhost:11434"
+API_BASE = None  # e.g. "http://localhost:11434" for a local Ollama server
 
 HUGGINGFACEHUB_API_TOKEN = ""
+
+# Parse the reference and infer its work type in one LLM call (ParseReferenceWithType)
+# instead of two (ParseReference + InferWorkType). Opt-in: --combined_parse.
+COMBINED_PARSE = False
+
+# Reference parser: "llm" (DSPy), "rules" (reference_parser.py only) or "auto" (rules
+# first, LLM only when the rule-based confidence is below RULE_PARSER_MIN_CONFIDENCE).
+PARSER = "llm"
+RULE_PARSER_MIN_CONFIDENCE = 0.8
+
+# Batched LLM parsing (--parse_batch_size): up to this many references per LLM call, packed
+# as a JSON array (1 = one call per reference). Batches are also kept within the model's
+# context window, counting LLM_PARSE_OUTPUT_TOKENS_PER_REF completion tokens per reference.
+LLM_PARSE_BATCH_SIZE = 1
+LLM_CONTEXT_TOKENS = 8192
+LLM_PARSE_OUTPUT_TOKENS_PER_REF = 160
+
+# PDF extraction: pages are split into chunks of PDF_PAGES_PER_CHUNK and extracted on a
+# process pool of this many processes (1 = extract in-process; None = one process per CPU).
+PDF_EXTRACT_PROCESSES = 1
+PDF_PAGES_PER_CHUNK = 8
+# Cheap first pass that finds the bibliography pages so only those get full extraction.
+# Worth it for full papers/theses; a PDF that is all bibliography gains nothing.
+DETECT_BIBLIOGRAPHY = False
+# Low-memory extraction: one page at a time in-process, releasing each page's parsed
+# layout after use. PDF_MEMORY_LIMIT_MB (None = no limit; ignored unless low-memory mode is
+# on) caps the RSS growth measured around each page's extraction and aborts it with a
+# MemoryError instead of letting the worker get OOM-killed.
+PDF_LOW_MEMORY = False
+PDF_MEMORY_LIMIT_MB = None
+
+# Concurrency (used when processing references with --workers > 1)
+# Caps apply across all worker threads; keep OpenAlex under its polite-pool limit
+# and Semantic Scholar low when running without an API key.
+DEFAULT_WORKERS = 1
+LLM_MAX_CONCURRENCY = 4
+OPENALEX_MAX_CONCURRENCY = 8
+SEMANTIC_SCHOLAR_MAX_CONCURRENCY = 1
+
+# Outbound rate limiting (rate_limit.py), shared by OpenAlex, Semantic Scholar and the LLM.
+# Starting/maximum calls per second per host ("llm" = the LLM provider); None = unlimited
+# until the first 429, whose observed rate then becomes the maximum. The rate adapts (AIMD): +RATE_LIMIT_INCREASE calls/s per second of
+# successes, x RATE_LIMIT_DECREASE on a 429. Retry-After is honored, with jitter.
+RATE_LIMITS = {
+    "api.openalex.org": 10.0,  # polite pool limit
+    "api.semanticscholar.org": 1.0,  # API key limit (unauthenticated callers share a lower one)
+    "llm": None,
+}
+RATE_LIMIT_BURST = 3
+RATE_LIMIT_MIN_RATE = 0.2
+RATE_LIMIT_INCREASE = 0.5
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_MAX_RETRIES = 3  # retries after 429 / 5xx / connection errors
+RATE_LIMIT_BACKOFF_BASE = 0.5
+RATE_LIMIT_BACKOFF_MAX = 30.0
+# Circuit breaker: after this many consecutive failures a host is skipped (callers go
+# straight to their fallbacks) for the cooldown, then probed with a single call.
+CIRCUIT_BREAKER_FAILURES = 5
+CIRCUIT_BREAKER_COOLDOWN = 30.0
+
+# Shared HTTP client (keep-alive pools for OpenAlex / Semantic Scholar)
+HTTP_POOL_MAXSIZE = 32
+HTTP2_ENABLED = True  # async client only; needs the optional `h2` package
+HTTP_USER_AGENT = "reference-extractor/1.0"
+
+# On-disk cache for OpenAlex / Semantic Scholar search responses
+CACHE_DIR = ".cache"
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+CACHE_NEGATIVE_TTL_SECONDS = 3 * 24 * 3600  # empty results are re-checked sooner
+CACHE_MAX_ENTRIES = 200_000  # least recently used entries are evicted beyond this
+
+# Local candidate scorer: accept a candidate without the ChooseOpenAlexMatch LLM call
+# when its score is at least this high and clearly ahead of the runner-up.
+MATCH_FAST_PATH_THRESHOLD = 0.85
+MATCH_FAST_PATH_MIN_TITLE_SIMILARITY = 0.9
+MATCH_FAST_PATH_MIN_MARGIN = 0.05
+
+# ChooseOpenAlexMatch prompt size: only the top-k locally ranked candidates are sent,
+# near-identical works (e.g. preprint + published version) collapse into one, and each
+# candidate with more than two authors lists its first/last author plus an author count.
+MATCH_PROMPT_TOP_K = 5
+MATCH_DEDUP_TITLE_SIMILARITY = 0.95
+MATCH_PROMPT_MAX_REF_CHARS = 600
+
+# Hedged OpenAlex search stages: start the next stage if the current one has not
+# answered within this many seconds (0 = fire all stages at once, None = strictly sequential).
+OPENALEX_HEDGE_DELAY = None
+
+# Batched OpenAlex lookups (--batch_openalex): DOIs OR-ed into one filter per request
+OPENALEX_BATCH_DOI_SIZE = 50
+
+# Logging: INFO prints run progress, DEBUG adds per-reference parse/search details
+LOG_LEVEL = "INFO"
+
+# Local OpenAlex snapshot index (openalex_index.py, --openalex_index): candidates come
+# from the index when one is at least this similar to the parsed title, else from the API.
+OPENALEX_INDEX_PATH = None
+OPENALEX_INDEX_MIN_TITLE_SIMILARITY = 0.75
+
+# Response projection: only the fields the pipeline reads are requested and kept per
+# candidate (OpenAlex `select=`, Semantic Scholar `fields=`). Authorships beyond
+# OPENALEX_MAX_AUTHORSHIPS are dropped from candidates (the last author is always kept).
+OPENALEX_SELECT_FIELDS = "id,doi,title,publication_year,type,cited_by_count,authorships"
+OPENALEX_MAX_AUTHORSHIPS = 20
+SEMANTIC_SCHOLAR_FIELDS = "title,year,authors.name,authors.affiliations"
+
+# Institution gazetteer for affiliation extraction (affiliations.py, --institutions): a text
+# file of institution names, one per line or "alias<TAB>name" (built from an OpenAlex
+# snapshot with `openalex_index.py institutions`). Names shorter than GAZETTEER_MIN_WORDS
+# words are skipped. None = keyword heuristics only.
+INSTITUTION_GAZETTEER_PATH = None
+GAZETTEER_MIN_WORDS = 2
+
+# Startup budget checked by startup_budget.py: seconds for `main.py --help` and for
+# `import pipeline` in a fresh interpreter, and modules that must not load at import.
+STARTUP_BUDGET_SECONDS = 0.5
+STARTUP_FORBIDDEN_MODULES = ("dspy", "litellm", "pandas")
+
+# Multi-PDF batch mode (--pdf_dir / --manifest): references are shared across documents
+# when their text, DOI or (rule-parsed) title + year agree. Title + year only counts for
+# confident rule parses of titles with at least this many words.
+DEDUP_MIN_TITLE_WORDS = 4
+
+# Service mode (serve.py): local HTTP server with a warm LM, caches and a shared worker
+# pool. Finished jobs beyond SERVE_MAX_JOBS are forgotten, oldest first.
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_WORKERS = 8
+SERVE_MAX_JOBS = 200
+SERVE_MAX_UPLOAD_MB = 100
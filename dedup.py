@@ -0,0 +1,88 @@
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from config import DEDUP_MIN_TITLE_WORDS, RULE_PARSER_MIN_CONFIDENCE
+from matching import normalize_title
+from reference_parser import extract_doi, parse_reference_rules, strip_label
+
+
+def text_key(ref_text: str) -> str:
+    """
+    Layout-insensitive form of a reference: label dropped, accents folded,
+    lowercased, and only letters/digits kept (so line breaks, hyphenation
+    and punctuation differences between PDFs do not matter).
+    """
+    decomposed = unicodedata.normalize("NFKD", strip_label(ref_text))
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+    return re.sub(r"[\W_]+", "", folded)
+
+
+def reference_keys(ref_text: str) -> List[str]:
+    """Keys under which two references count as the same work: text, DOI, title + year."""
+    text = text_key(ref_text)
+    keys = [f"text:{text}"] if len(text) >= 20 else []  # "Ibid." etc. are not the same work
+    doi = extract_doi(ref_text)
+    if doi:
+        keys.append(f"doi:{doi}")
+    parsed = parse_reference_rules(ref_text)
+    title = normalize_title(parsed["paper_title"])
+    if parsed["year"] and parsed["confidence"] >= RULE_PARSER_MIN_CONFIDENCE \
+            and len(title.split()) >= DEDUP_MIN_TITLE_WORDS:
+        keys.append(f"title:{title}|{parsed['year']}")
+    return keys
+
+
+class ReferenceDeduplicator:
+    """
+    Assigns each reference seen across documents to a unique-reference
+    index. The first occurrence of a work becomes its representative (the
+    text that is parsed, searched and matched); later occurrences sharing
+    any key with it map to the same index.
+    """
+
+    def __init__(self) -> None:
+        self.representatives: List[str] = []
+        self.occurrences: List[List[Tuple[str, int]]] = []  # per unique reference: (document, position)
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, ref_text: str, document: str, position: int) -> Tuple[int, bool]:
+        """Register one occurrence; returns (unique index, whether it is new)."""
+        keys = reference_keys(ref_text)
+        with self._lock:
+            found: Optional[int] = next((self._index[k] for k in keys if k in self._index), None)
+            is_new = found is None
+            if found is None:
+                found = len(self.representatives)
+                self.representatives.append(ref_text)
+                self.occurrences.append([])
+            for key in keys:
+                self._index.setdefault(key, found)
+            self.occurrences[found].append((document, position))
+            return found, is_new
+
+    def __len__(self) -> int:
+        return len(self.representatives)
+
+
+def list_documents(pdf_dir: Optional[str] = None, manifest: Optional[str] = None) -> List[str]:
+    """
+    PDF paths for batch mode: every *.pdf in pdf_dir (sorted), or the lines
+    of a manifest file (blank lines and "#" comments skipped; relative
+    paths are taken relative to the manifest).
+    """
+    if pdf_dir:
+        return sorted(
+            os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir)
+            if name.lower().endswith(".pdf") and os.path.isfile(os.path.join(pdf_dir, name))
+        )
+    paths: List[str] = []
+    base = os.path.dirname(os.path.abspath(manifest or ""))
+    with open(manifest or "", "r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
@@ -1,23 +1,81 @@
 import dspy
+from dspy.utils.exceptions import AdapterParseError
+import logging
 import re
 import json
+import hashlib
+import threading
+import time
+
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from config import (
+    MODEL_NAME,
+    API_BASE,
+    HUGGINGFACEHUB_API_TOKEN as HF_TOKEN,
+    MATCH_PROMPT_MAX_REF_CHARS,
+    RATE_LIMIT_MAX_RETRIES,
+    LLM_PARSE_BATCH_SIZE,
+    LLM_CONTEXT_TOKENS,
+    LLM_PARSE_OUTPUT_TOKENS_PER_REF,
+)
+from concurrency import slot
+from cache import get_prediction_cache
+from reference_parser import extract_doi, extract_emails
+from affiliations import extract_affiliations
+from matching import shortlist_candidates
+from metrics import incr, span
+from rate_limit import CircuitOpenError, backoff_delay, get_limiter, parse_retry_after
 
-from typing import List, Dict, Any, Optional, Tuple
-#from config import MODEL_NAME, API_BASE ## uncomment if using ollama local server
-from config import MODEL_NAME, HUGGINGFACEHUB_API_TOKEN as HF_TOKEN
+logger = logging.getLogger(__name__)
 
 # ===================== DSPY INITIALIZATION =====================
 
+# The LM is built on first use (get_lm) rather than at import, and is passed to
+# each module call explicitly, so it can be swapped at runtime with configure_lm.
+# Prediction cache keys use the configured model name, so cache hits never build it.
+_lm: Optional[dspy.LM] = None
+_lm_options: Dict[str, Any] = {}  # make_lm arguments for the LM not created yet
+_lm_model: str = MODEL_NAME  # model name of the active (or not yet created) LM, for cache keys
+_lm_lock = threading.Lock()
 
-lm = dspy.LM(
-    model=MODEL_NAME,
-    #api_base=API_BASE, ## uncomment if using ollama local server
-    api_key=HF_TOKEN,
-    temperature=0.0,
-    max_tokens=512,
-)
 
-dspy.configure(lm=lm)
+def make_lm(model: str = MODEL_NAME,
+            api_key: Optional[str] = HF_TOKEN,
+            api_base: Optional[str] = API_BASE,
+            **kwargs: Any) -> dspy.LM:
+    """
+    Build a dspy.LM for any LiteLLM provider string ("huggingface/...", "ollama/...", ...).
+    LiteLLM's own retries are off so rate-limit errors reach the shared "llm" limiter.
+    """
+    options: Dict[str, Any] = {"temperature": 0.0, "max_tokens": 512, "num_retries": 0}
+    options.update(kwargs)
+    if api_base:
+        options["api_base"] = api_base
+    return dspy.LM(model=model, api_key=api_key or None, **options)
+
+
+def configure_lm(lm: Optional[Any] = None, **kwargs: Any) -> None:
+    """
+    Switch the LM used by every module from now on: pass a ready LM object,
+    or make_lm arguments (e.g. configure_lm(model="ollama/llama3.1",
+    api_base="http://localhost:11434")), which are built into an LM on first use.
+    """
+    global _lm, _lm_options, _lm_model
+    with _lm_lock:
+        _lm = lm
+        _lm_options = {} if lm is not None else kwargs
+        _lm_model = getattr(lm, "model", None) or kwargs.get("model", MODEL_NAME)
+
+
+def get_lm() -> Any:
+    """The active LM, created on first use (from config.py or the configure_lm arguments)."""
+    global _lm
+    if _lm is None:
+        with _lm_lock:
+            if _lm is None:
+                _lm = make_lm(**_lm_options)
+    return _lm
+
 
 # ===================== DSPY SIGNATURES =====================
 
@@ -44,6 +102,41 @@ class InferWorkType(dspy.Signature):
     )
 
 
+class ParseReferenceWithType(dspy.Signature):
+    """Parse a bibliography reference into structured fields and infer its OpenAlex work type."""
+    ref_text = dspy.InputField(desc="One bibliographic reference as text.")
+    paper_title = dspy.OutputField(desc="Title of the work.")
+    year = dspy.OutputField(desc="Four-digit year or 'null' if unsure.")
+    authors_json = dspy.OutputField(desc='JSON array of author names, e.g. ["A. Author"].')
+    emails_json = dspy.OutputField(desc="JSON array of emails in the reference (empty if none).")
+    authors_structured_json = dspy.OutputField(
+        desc=(
+            "JSON array of authors with optional affiliations/emails, "
+            'e.g. [{"name":"A. Author","affiliations":["MIT"],"emails":["a@x.com"]}].'
+        )
+    )
+    work_type = dspy.OutputField(
+        desc='One of: "book", "journal-article", "proceedings-article", "book-chapter", "unknown".'
+    )
+
+
+class ParseReferenceBatch(dspy.Signature):
+    """
+    Parse several bibliography references at once into structured fields and
+    infer each one's OpenAlex work type. Return exactly one object per input
+    reference, with the same index.
+    """
+    refs_json = dspy.InputField(desc='JSON array of references: [{"index": 0, "ref_text": "..."}, ...].')
+    parsed_json = dspy.OutputField(
+        desc=(
+            'JSON array with one object per reference: {"index": 0, "paper_title": "...", '
+            '"year": 2020 or null, "authors": ["A. Author"], "emails": [], '
+            '"authors_structured": [{"name":"A. Author","affiliations":["MIT"],"emails":["a@x.com"]}], '
+            '"work_type": one of "book", "journal-article", "proceedings-article", "book-chapter", "unknown"}.'
+        )
+    )
+
+
 class ChooseOpenAlexMatch(dspy.Signature):
     """
     Given a reference and a list of OpenAlex candidates, choose the best match.
@@ -59,7 +152,8 @@ class ChooseOpenAlexMatch(dspy.Signature):
         - title
         - publication_year
         - type
-        - authors: list of author display_names.
+        - authors: author display_names (only the first and last when there are more than two)
+        - n_authors: total number of authors, present when the list was cut.
 
     Task:
     1) For each candidate, compare title, authors, year, and type.
@@ -87,49 +181,183 @@ class ChooseOpenAlexMatch(dspy.Signature):
 
 parse_ref_module = dspy.Predict(ParseReference)
 infer_type_module = dspy.Predict(InferWorkType)
+parse_with_type_module = dspy.Predict(ParseReferenceWithType)
+parse_batch_module = dspy.Predict(ParseReferenceBatch)
 choose_match_module = dspy.Predict(ChooseOpenAlexMatch)
 
+# ===================== PREDICTION CACHE =====================
+
+_prediction_stats: Dict[str, Dict[str, int]] = {}
+_prediction_stats_lock = threading.Lock()
+
+
+def signature_version(signature: type) -> str:
+    """
+    Fingerprint of a signature's instructions and fields.
+    Editing a signature's docstring or field descriptions changes it,
+    which invalidates that signature's cached predictions.
+    """
+    fields = [
+        (name, field.json_schema_extra.get("__dspy_field_type"),
+         field.json_schema_extra.get("desc"), field.json_schema_extra.get("prefix"))
+        for name, field in signature.fields.items()
+    ]
+    raw = json.dumps([signature.__name__, signature.instructions, fields], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _prediction_key(signature: type, inputs: Dict[str, Any]) -> str:
+    raw = json.dumps(
+        [signature.__name__, _lm_model, signature_version(signature), sorted(inputs.items())],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _record_prediction(signature_name: str, outcome: str) -> None:
+    with _prediction_stats_lock:
+        stats = _prediction_stats.setdefault(signature_name, {"hits": 0, "misses": 0})
+        stats[outcome] += 1
+
+
+def _predict(module: dspy.Predict,
+             lm_config: Optional[Dict[str, Any]] = None,
+             cache_if: Optional[Callable[[dspy.Prediction], bool]] = None,
+             **inputs: Any) -> dspy.Prediction:
+    """
+    Run a DSPy module through the persistent prediction cache.
+    Temperature is 0, so identical inputs to the same model/signature give the same outputs.
+    lm_config overrides LM settings for this call (e.g. a larger max_tokens).
+    cache_if, if given, decides whether a fresh prediction is usable enough to cache;
+    otherwise the same bad output would be replayed on every rerun.
+    """
+    signature = module.signature
+    cache = get_prediction_cache()
+    key = _prediction_key(signature, inputs) if cache is not None else ""
+    if cache is not None:
+        hit, outputs = cache.get(key)
+        if hit:
+            _record_prediction(signature.__name__, "hits")
+            return dspy.Prediction(**outputs)
+        _record_prediction(signature.__name__, "misses")
+
+    pred = _call_lm(module, signature.__name__, inputs, lm_config)
+    _record_usage(signature.__name__, pred)
+
+    if cache is not None and (cache_if is None or cache_if(pred)):
+        outputs = {name: getattr(pred, name, None) for name in signature.output_fields}
+        cache.set(key, outputs)
+    return pred
+
+
+# LiteLLM exception classes that mean the provider (not the request) is at fault.
+_LLM_FAILURE_ERRORS = {"APIConnectionError", "Timeout", "ServiceUnavailableError", "InternalServerError"}
+
+
+def _llm_error_kind(exc: BaseException) -> Tuple[Optional[str], Optional[float]]:
+    """
+    Classify a provider error (following wrapped causes): ("throttle",
+    retry_after) for rate limits, ("failure", None) for outages/timeouts,
+    (None, None) for anything else (bad output, programming errors).
+    """
+    seen = set()
+    err: Optional[BaseException] = exc
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        name = type(err).__name__
+        status = getattr(err, "status_code", None)
+        if status == 429 or "RateLimit" in name:
+            headers = getattr(getattr(err, "response", None), "headers", None) or {}
+            return "throttle", parse_retry_after(headers.get("retry-after"))
+        if (isinstance(status, int) and status >= 500) or name in _LLM_FAILURE_ERRORS \
+                or isinstance(err, (ConnectionError, TimeoutError)):
+            return "failure", None
+        err = err.__cause__ or err.__context__
+    return None, None
+
+
+def _call_lm(module: dspy.Predict,
+             signature_name: str,
+             inputs: Dict[str, Any],
+             lm_config: Optional[Dict[str, Any]] = None) -> dspy.Prediction:
+    """
+    One module call under the shared "llm" limiter: rate-limit errors are
+    retried after backoff, provider failures feed its circuit breaker. Other
+    errors (unparseable output, a rejected request) mean the provider
+    answered, and count as a success for the breaker.
+    """
+    limiter = get_limiter("llm")
+    for attempt in range(1, RATE_LIMIT_MAX_RETRIES + 2):
+        probe = limiter.acquire()
+        try:
+            with slot("llm"), span("llm_call", signature=signature_name), dspy.context(track_usage=True):
+                pred = module(lm=get_lm(), config=lm_config or {}, **inputs)
+        except Exception as e:
+            kind, retry_after = _llm_error_kind(e)
+            if kind == "throttle":
+                limiter.on_throttle(retry_after)
+                if attempt <= RATE_LIMIT_MAX_RETRIES:
+                    incr("llm_retries", signature=signature_name)
+                    time.sleep(backoff_delay(attempt, retry_after))
+                    continue
+            if kind is None:
+                limiter.on_success()
+            else:
+                limiter.on_failure()
+            raise
+        finally:
+            limiter.release_probe(probe)
+        limiter.on_success()
+        return pred
+    raise AssertionError("unreachable")
+
+
+def _record_usage(signature_name: str, pred: dspy.Prediction) -> None:
+    """Count the LLM call and its prompt/completion tokens (when the provider reports them)."""
+    incr("llm_calls", signature=signature_name)
+    try:
+        usage = pred.get_lm_usage() or {}
+    except Exception:
+        return
+    for model_usage in usage.values():
+        for field, counter in (("prompt_tokens", "llm_prompt_tokens"), ("completion_tokens", "llm_completion_tokens")):
+            tokens = (model_usage or {}).get(field)
+            if tokens:
+                incr(counter, tokens, signature=signature_name)
+
+
+def prediction_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Per-signature hit/miss counts for this process."""
+    with _prediction_stats_lock:
+        return {name: dict(stats) for name, stats in _prediction_stats.items()}
+
+
 # ===================== DSPY HELPERS =====================
 
 def parse_reference_with_dspy(ref_text: str) -> dict[str, Any]:
     """Parse a reference using DSPy."""
-    pred = parse_ref_module(ref_text=ref_text)
+    pred = _predict(parse_ref_module, ref_text=ref_text)
+    return _parsed_reference_from_prediction(ref_text, pred)
+
 
+def parse_reference_and_type(ref_text: str) -> dict[str, Any]:
+    """
+    Parse a reference and infer its work type in a single LLM call.
+    Returns the parse_reference_with_dspy dict plus a "work_type" key
+    (normalized like infer_work_type, or None).
+    """
+    pred = _predict(parse_with_type_module, ref_text=ref_text)
+    parsed = _parsed_reference_from_prediction(ref_text, pred)
+    parsed["work_type"] = _normalize_work_type(pred.work_type)
+    return parsed
+
+
+def _parsed_reference_from_prediction(ref_text: str, pred: dspy.Prediction) -> dict[str, Any]:
+    """Turn a ParseReference-style prediction into the parsed-reference dict."""
     paper_title = (pred.paper_title or "").strip()
     year_raw = (pred.year or "").strip()
 
-    def extract_emails(text: str) -> list[str]:
-        """Lightweight regex email catcher."""
-        pattern = r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\\.[A-Za-z]{2,}"
-        return re.findall(pattern, text)
-
-    def extract_affiliation_candidates(text: str) -> list[str]:
-        """
-        Grab phrases that look like affiliations (universities, institutes, departments).
-        Heuristic but helps when DSPy misses.
-        """
-        keywords = r"(university|institute|college|laboratory|lab\\b|department|dept\\b|school|centre|center|hospital)"
-        # capture up to ~8 words around the keyword
-        pattern = rf"(?:[A-Z][\\w,&'\\-]+\\s+){{0,6}}{keywords}(?:\\s+[A-Z][\\w,&'\\-]+){{0,6}}"
-        matches = re.findall(pattern, text, flags=re.IGNORECASE)
-        cleaned = []
-        for m in matches:
-            # re.findall with groups returns tuples; join parts
-            if isinstance(m, tuple):
-                joined = " ".join([p for p in m if p])
-                cleaned.append(joined.strip(" ,.;"))
-            else:
-                cleaned.append(str(m).strip(" ,.;"))
-        # de-duplicate while preserving order
-        seen = set()
-        result = []
-        for c in cleaned:
-            key = c.lower()
-            if key not in seen:
-                seen.add(key)
-                result.append(c)
-        return result
-
     # Parse JSON fields
     authors: list[str] = []
     emails: list[str] = []
@@ -185,7 +413,7 @@ def parse_reference_with_dspy(ref_text: str) -> dict[str, Any]:
         if not authors:
             authors = [a.get("name", "") for a in structured_authors if a.get("name")]
 
-    # Regex fallbacks if structured extraction failed
+    # Regex / gazetteer fallbacks if structured extraction failed
     regex_emails = extract_emails(ref_text)
     if regex_emails:
         # merge unique
@@ -200,7 +428,7 @@ def parse_reference_with_dspy(ref_text: str) -> dict[str, Any]:
             last_author_emails = regex_emails
 
     if not first_affiliations or not last_affiliations:
-        affs = extract_affiliation_candidates(ref_text)
+        affs = extract_affiliations(ref_text)
         if affs:
             if not first_affiliations:
                 first_affiliations = [affs[0]]
@@ -218,13 +446,19 @@ def parse_reference_with_dspy(ref_text: str) -> dict[str, Any]:
         "last_affiliations": last_affiliations,
         "first_author_emails": first_author_emails or emails,
         "last_author_emails": last_author_emails,
+        "doi": extract_doi(ref_text),
     }
 
 
 def infer_work_type(ref_text: str) -> Optional[str]:
     """Infer work type using DSPy."""
-    pred = infer_type_module(ref_text=ref_text)
-    raw = (pred.work_type or "").strip().lower()
+    pred = _predict(infer_type_module, ref_text=ref_text)
+    return _normalize_work_type(pred.work_type)
+
+
+def _normalize_work_type(work_type: Optional[str]) -> Optional[str]:
+    """Map a free-text work type onto the OpenAlex types we search with."""
+    raw = (work_type or "").strip().lower()
 
     mapping = {
         "book": "book", "books": "book",
@@ -239,48 +473,241 @@ def infer_work_type(ref_text: str) -> Optional[str]:
     return mapping.get(compact)
 
 
+# ===================== BATCHED PARSING =====================
+
+# Largest batch size still trusted after a batch came back unreadable (usually a
+# truncated completion); later batches are planned no larger than this.
+_parse_batch_cap: Optional[int] = None
+_parse_batch_cap_lock = threading.Lock()
+
+
+def reset_parse_batch_cap() -> None:
+    """Trust full batch sizes again (start of a run)."""
+    global _parse_batch_cap
+    with _parse_batch_cap_lock:
+        _parse_batch_cap = None
+
+
+def _batch_prompt_overhead() -> int:
+    """Estimated tokens of the batch prompt besides the references (instructions, field descriptions, framing)."""
+    descs = [field.json_schema_extra.get("desc") or "" for field in ParseReferenceBatch.fields.values()]
+    return estimate_tokens(ParseReferenceBatch.instructions + "".join(descs)) + 200
+
+
+def plan_parse_batches(ref_texts: List[str],
+                       batch_size: int = LLM_PARSE_BATCH_SIZE,
+                       context_tokens: int = LLM_CONTEXT_TOKENS) -> List[List[int]]:
+    """
+    Group reference positions into batches for parse_reference_batch: at most
+    batch_size references (fewer once a batch has come back unreadable), and
+    prompt plus expected completion within context_tokens.
+    """
+    limit = max(1, min(batch_size, _parse_batch_cap or batch_size))
+    budget = context_tokens - _batch_prompt_overhead()
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, text in enumerate(ref_texts):
+        cost = estimate_tokens(text) + LLM_PARSE_OUTPUT_TOKENS_PER_REF + 8  # + index/JSON framing
+        if current and (len(current) >= limit or used + cost > budget):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_items(raw: Optional[str], n: int) -> Optional[Dict[int, Dict[str, Any]]]:
+    """
+    Read the batch output into {index: item}. Returns None when it is not a
+    JSON array at all; items with a bad index or no title are left out.
+    """
+    text = (raw or "").strip()
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(items, list):
+        return None
+    found: Dict[int, Dict[str, Any]] = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("paper_title"), str):
+            continue
+        try:
+            index = int(item.get("index", position))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < n:
+            found.setdefault(index, item)
+    return found
+
+
+def _prediction_from_batch_item(item: Dict[str, Any]) -> dspy.Prediction:
+    """Recast one batch item as a ParseReferenceWithType prediction."""
+    def as_list(value: Any) -> list:
+        return value if isinstance(value, list) else []
+
+    return dspy.Prediction(
+        paper_title=item.get("paper_title") or "",
+        year=str(item.get("year") or "null"),
+        authors_json=json.dumps(as_list(item.get("authors")), ensure_ascii=False),
+        emails_json=json.dumps(as_list(item.get("emails")), ensure_ascii=False),
+        authors_structured_json=json.dumps(as_list(item.get("authors_structured")), ensure_ascii=False),
+        work_type=str(item.get("work_type") or "unknown"),
+    )
+
+
+def _parse_individually(ref_text: str) -> Optional[dict[str, Any]]:
+    incr("llm_parse_batch_retries")
+    try:
+        return parse_reference_and_type(ref_text)
+    except Exception as e:
+        logger.warning("  Parse error: %s", e)
+        return None
+
+
+def parse_reference_batch(ref_texts: List[str]) -> List[Optional[dict[str, Any]]]:
+    """
+    Parse several references in one LLM call (batches come from
+    plan_parse_batches). Each result has the parse_reference_and_type shape.
+
+    An unreadable output is re-split: both halves are retried as smaller
+    batches and later batches are capped at that size. References missing
+    from a readable output are parsed one by one; their entry is None only if
+    that fails too. Provider errors (rate limits, outages, an open circuit
+    breaker) are raised without splitting.
+    """
+    global _parse_batch_cap
+    if len(ref_texts) == 1:
+        return [_parse_individually(ref_texts[0])]
+
+    refs_json = json.dumps([{"index": i, "ref_text": t} for i, t in enumerate(ref_texts)], ensure_ascii=False)
+    max_tokens = LLM_PARSE_OUTPUT_TOKENS_PER_REF * len(ref_texts) + 64
+    unreadable = True  # the output came back but could not be read (usually truncated)
+    try:
+        pred = _predict(
+            parse_batch_module,
+            lm_config={"max_tokens": max_tokens},
+            cache_if=lambda p: _batch_items(p.parsed_json, len(ref_texts)) is not None,
+            refs_json=refs_json,
+        )
+        items = _batch_items(pred.parsed_json, len(ref_texts))
+    except Exception as e:
+        if isinstance(e, CircuitOpenError) or _llm_error_kind(e)[0] is not None:
+            raise
+        unreadable = isinstance(e, AdapterParseError)
+        logger.debug("  Batch parse failed: %s", e)
+        items = None
+    incr("llm_parse_batches")
+
+    if items is None:
+        half = len(ref_texts) // 2
+        if unreadable:
+            with _parse_batch_cap_lock:
+                _parse_batch_cap = max(2, min(_parse_batch_cap or half, half))
+        incr("llm_parse_batch_splits")
+        logger.debug("  Batch of %d unreadable, retrying as %d + %d", len(ref_texts), half, len(ref_texts) - half)
+        return parse_reference_batch(ref_texts[:half]) + parse_reference_batch(ref_texts[half:])
+
+    results: List[Optional[dict[str, Any]]] = []
+    for i, ref_text in enumerate(ref_texts):
+        item = items.get(i)
+        if item is None:
+            results.append(_parse_individually(ref_text))
+            continue
+        pred = _prediction_from_batch_item(item)
+        parsed = _parsed_reference_from_prediction(ref_text, pred)
+        parsed["work_type"] = _normalize_work_type(pred.work_type)
+        results.append(parsed)
+    return results
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt-token count (about 4 characters per token for English/JSON)."""
+    return (len(text) + 3) // 4
+
+
+def _candidate_for_prompt(candidate: dict[str, Any], all_authors: bool = False) -> dict[str, Any]:
+    names = [
+        (a.get("author") or {}).get("display_name", "")
+        for a in (candidate.get("authorships") or [])
+    ]
+    entry = {
+        "id": candidate.get("id", ""),
+        "title": candidate.get("title", ""),
+        "publication_year": candidate.get("publication_year"),
+        "type": candidate.get("type", ""),
+    }
+    if all_authors or len(names) <= 2:
+        entry["authors"] = names
+    else:
+        entry["authors"] = names[:1] + names[-1:]
+        entry["n_authors"] = len(names)
+    return entry
+
+
+def prompt_tokens(module: dspy.Predict, inputs: Dict[str, Any]) -> int:
+    """Estimated input tokens of the prompt the adapter renders for module and inputs (no demos)."""
+    adapter = dspy.settings.adapter or dspy.ChatAdapter()
+    messages = adapter.format(module.signature, demos=[], inputs=inputs)
+    return estimate_tokens("".join(str(m.get("content") or "") for m in messages))
+
+
 def pick_best_match(ref_text: str,
                     parsed_title: str,
                     parsed_year: Optional[int],
                     parsed_authors: list[str],
                     candidates: list[dict[str, Any]],
-                    work_type: Optional[str]) -> tuple[Optional[dict[str, Any]], str]:
+                    work_type: Optional[str]) -> tuple[Optional[dict[str, Any]], str, tuple[int, int]]:
     """
     Use DSPy to filter and choose the best OpenAlex candidate (or none).
-    Returns (best_work_dict_or_None, rationale_string).
+
+    Only the locally top-ranked, de-duplicated candidates are sent (see
+    matching.shortlist_candidates), longer author lists as first/last author
+    plus an author count, and ref_text is cut to MATCH_PROMPT_MAX_REF_CHARS.
+    Returns (best_work_dict_or_None, rationale_string, (estimated tokens of
+    the rendered prompt with every candidate and author, estimated tokens of
+    the rendered prompt sent)).
     """
     if not candidates:
-        return None, ""
-
-    simple = []
-    for c in candidates:
-        auth_names = [
-            (a.get("author") or {}).get("display_name", "")
-            for a in (c.get("authorships") or [])
-        ]
-        simple.append({
-            "id": c.get("id", ""),
-            "title": c.get("title", ""),
-            "publication_year": c.get("publication_year"),
-            "type": c.get("type", ""),
-            "authors": auth_names,
-        })
-
-    out = choose_match_module(
+        return None, "", (0, 0)
+
+    shortlist = shortlist_candidates(parsed_title, parsed_year, parsed_authors, candidates, work_type)
+    inputs = {
+        "ref_text": ref_text[:MATCH_PROMPT_MAX_REF_CHARS],
+        "parsed_title": parsed_title,
+        "parsed_year": str(parsed_year) if parsed_year else "null",
+        "parsed_authors_json": json.dumps(parsed_authors, ensure_ascii=False),
+        "inferred_work_type": work_type or "unknown",
+        "candidates_json": json.dumps([_candidate_for_prompt(c) for c in shortlist], ensure_ascii=False),
+    }
+    # Before: every candidate with every author and the whole ref_text, as sent without pre-ranking.
+    full_inputs = dict(
+        inputs,
         ref_text=ref_text,
-        parsed_title=parsed_title,
-        parsed_year=str(parsed_year) if parsed_year else "null",
-        parsed_authors_json=json.dumps(parsed_authors, ensure_ascii=False),
-        inferred_work_type=work_type or "unknown",
-        candidates_json=json.dumps(simple, ensure_ascii=False),
+        candidates_json=json.dumps([_candidate_for_prompt(c, all_authors=True) for c in candidates],
+                                   ensure_ascii=False),
     )
+    tokens_before = prompt_tokens(choose_match_module, full_inputs)
+    tokens_after = prompt_tokens(choose_match_module, inputs)
+    incr("match_prompt_tokens_full", tokens_before)
+    incr("match_prompt_tokens_sent", tokens_after)
+    logger.debug("  Match prompt: %d -> %d candidates, ~%d -> ~%d input tokens",
+                 len(candidates), len(shortlist), tokens_before, tokens_after)
+
+    out = _predict(choose_match_module, **inputs)
 
     chosen_id = (out.chosen_id or "").strip()
     rationale = (out.rationale or "").strip()
-    print("  DSPy rationale:", rationale)
+    logger.debug("  DSPy rationale: %s", rationale)
 
     if not chosen_id or chosen_id.lower() == "none":
-        return None, rationale
+        return None, rationale, (tokens_before, tokens_after)
 
-    best = next((c for c in candidates if c.get("id") == chosen_id), None)
-    return best, rationale
+    best = next((c for c in shortlist if c.get("id") == chosen_id), None)
+    return best, rationale, (tokens_before, tokens_after)
@@ -0,0 +1,235 @@
+import asyncio
+import importlib.util
+import json
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+try:
+    import orjson  # optional: several times faster than json for API payloads
+except ImportError:
+    orjson = None
+
+import requests
+from requests.adapters import HTTPAdapter
+from config import HTTP_POOL_MAXSIZE, HTTP2_ENABLED, HTTP_USER_AGENT, RATE_LIMIT_MAX_RETRIES
+from concurrency import aslot, slot
+from metrics import incr
+from rate_limit import Limiter, backoff_delay, get_limiter, parse_retry_after
+
+# One pooled session per process: connections to OpenAlex / Semantic Scholar
+# are kept alive and reused across stages, references and worker threads.
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# httpx.AsyncClient is bound to the loop that created it, so keep one per loop.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def http2_available() -> bool:
+    """True when the async client can negotiate HTTP/2 (httpx + h2 installed)."""
+    return (
+        HTTP2_ENABLED
+        and importlib.util.find_spec("httpx") is not None
+        and importlib.util.find_spec("h2") is not None
+    )
+
+
+def get_session() -> requests.Session:
+    """Return the shared keep-alive session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["User-Agent"] = HTTP_USER_AGENT
+                _session = session
+    return _session
+
+
+def json_loads(data: Any) -> Any:
+    """Decode JSON text or bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def response_json(resp: Any) -> Any:
+    """Decode a requests/httpx response body as JSON."""
+    return json_loads(resp.content)
+
+
+def _count(url: str, resp: Any) -> None:
+    host = urlsplit(url).netloc
+    incr("http_requests", host=host)
+    incr("http_bytes", len(resp.content or b""), host=host)
+    if resp.status_code == 429:
+        incr("http_429", host=host)
+
+
+# Responses worth retrying (after backoff); anything else is returned to the caller.
+_RETRY_STATUSES = {429, 502, 503, 504}
+
+# Exceptions that mean the host (or the network to it) failed, not the request.
+_TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def _retry_wait(limiter: Limiter, resp: Any, attempt: int, retries: int) -> Optional[float]:
+    """
+    Feed a response back to the host's limiter (any 5xx counts towards its
+    breaker). Returns the delay before the next attempt, or None when the
+    response should be returned as is.
+    """
+    status = resp.status_code
+    if status < 500 and status != 429:
+        limiter.on_success()
+        return None
+    retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+    if status == 429:
+        limiter.on_throttle(retry_after)
+        if attempt > retries:
+            limiter.on_failure()
+    else:
+        limiter.on_failure()
+    if attempt > retries or status not in _RETRY_STATUSES:
+        return None
+    incr("http_retries", host=limiter.name)
+    return backoff_delay(attempt, retry_after)
+
+
+def _request(method: str,
+             url: str,
+             retries: int = RATE_LIMIT_MAX_RETRIES,
+             service: Optional[str] = None,
+             **kwargs: Any) -> requests.Response:
+    """
+    Send through the shared session under the host's limiter (rate_limit.py):
+    429/502/503/504 responses and connection errors are retried with backoff,
+    and CircuitOpenError is raised while the host's breaker is open.
+    service names the concurrency slot (concurrency.py) held for each attempt;
+    it is released while waiting to retry, so a throttled call does not hold
+    up the other workers.
+    """
+    limiter = get_limiter(urlsplit(url).netloc)
+    for attempt in range(1, retries + 2):
+        probe = limiter.acquire()
+        try:
+            try:
+                with slot(service) if service else nullcontext():
+                    resp = get_session().request(method, url, **kwargs)
+            except _TRANSPORT_ERRORS:
+                limiter.on_failure()
+                if attempt > retries:
+                    raise
+                incr("http_retries", host=limiter.name)
+                wait = backoff_delay(attempt)
+            except requests.RequestException:
+                limiter.on_success()  # bad URL, redirect loop, ...: the request's fault, not the host's
+                raise
+            else:
+                _count(url, resp)
+                wait = _retry_wait(limiter, resp, attempt, retries)
+                if wait is None:
+                    return resp
+        finally:
+            limiter.release_probe(probe)
+        time.sleep(wait)
+    raise AssertionError("unreachable")
+
+
+def http_get(url: str,
+             params: Optional[Dict[str, Any]] = None,
+             timeout: float = 30,
+             headers: Optional[Dict[str, str]] = None,
+             service: Optional[str] = None) -> requests.Response:
+    """GET through the shared pooled session (rate limited, retried; see _request for service)."""
+    return _request("GET", url, params=params, timeout=timeout, headers=headers, service=service)
+
+
+def http_post(url: str,
+              params: Optional[Dict[str, Any]] = None,
+              json_body: Any = None,
+              timeout: float = 30,
+              headers: Optional[Dict[str, str]] = None,
+              service: Optional[str] = None) -> requests.Response:
+    """POST a JSON body through the shared pooled session (rate limited, retried; see _request for service)."""
+    return _request("POST", url, params=params, json=json_body, timeout=timeout, headers=headers, service=service)
+
+
+def get_async_client() -> Any:
+    """Return the pooled httpx.AsyncClient for the running event loop."""
+    import httpx  # only needed for the async API
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            ),
+            headers={"User-Agent": HTTP_USER_AGENT},
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def ahttp_get(url: str,
+                    params: Optional[Dict[str, Any]] = None,
+                    timeout: float = 30,
+                    headers: Optional[Dict[str, str]] = None,
+                    service: Optional[str] = None) -> Any:
+    """GET through the event loop's pooled async client (HTTP/2 when available), like http_get."""
+    import httpx
+
+    client = get_async_client()
+    limiter = get_limiter(urlsplit(url).netloc)
+    retries = RATE_LIMIT_MAX_RETRIES
+    for attempt in range(1, retries + 2):
+        probe = await limiter.aacquire()
+        try:
+            try:
+                async with aslot(service) if service else nullcontext():
+                    resp = await client.get(url, params=params, timeout=timeout, headers=headers)
+            except httpx.TransportError:
+                limiter.on_failure()
+                if attempt > retries:
+                    raise
+                incr("http_retries", host=limiter.name)
+                wait = backoff_delay(attempt)
+            except httpx.HTTPError:
+                limiter.on_success()  # decoding error, redirect loop, ...: the request's fault, not the host's
+                raise
+            else:
+                _count(url, resp)
+                wait = _retry_wait(limiter, resp, attempt, retries)
+                if wait is None:
+                    return resp
+        finally:
+            limiter.release_probe(probe)
+        await asyncio.sleep(wait)
+    raise AssertionError("unreachable")
+
+
+def close_session() -> None:
+    """Close the shared sync session (a new one is created on next use)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+async def aclose_async_client() -> None:
+    """Close the running loop's async client, if any."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -1,34 +1,265 @@
 import argparse
-from pipeline import process_pdf_to_excel
+import logging
+from config import (
+    DEFAULT_WORKERS,
+    CACHE_DIR,
+    MATCH_FAST_PATH_THRESHOLD,
+    OPENALEX_HEDGE_DELAY,
+    S2_MODE,
+    PARSER,
+    COMBINED_PARSE,
+    LLM_PARSE_BATCH_SIZE,
+    MODEL_NAME,
+    API_BASE,
+    LOG_LEVEL,
+    OPENALEX_INDEX_PATH,
+    INSTITUTION_GAZETTEER_PATH,
+    PDF_EXTRACT_PROCESSES,
+    DETECT_BIBLIOGRAPHY,
+    PDF_LOW_MEMORY,
+    PDF_MEMORY_LIMIT_MB,
+)
 
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Extract first/last author affiliation + contact info from a references PDF using DSPy + OpenAlex."
     )
-    parser.add_argument(
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
         "--pdf",
-        required=True,
         help="Path to the input PDF containing references.",
     )
+    inputs.add_argument(
+        "--pdf_dir",
+        help="Batch mode: process every PDF in this directory, sharing references across documents.",
+    )
+    inputs.add_argument(
+        "--manifest",
+        help="Batch mode: text file listing one PDF path per line.",
+    )
     parser.add_argument(
         "--out",
         required=True,
-        help="Path to the output Excel file (.xlsx).",
+        help="Path to the output Excel file (.xlsx); in batch mode the combined file of unique references.",
+    )
+    parser.add_argument(
+        "--per_document_dir",
+        default=None,
+        help="Batch mode: directory for the per-document Excel files (default: <out stem>_documents).",
     )
     parser.add_argument(
         "--max_refs",
         type=int,
         default=None,
-        help="Optional limit on number of references to process (for debugging).",
+        help="Optional limit on number of references to process (for debugging; per document in batch mode).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of references processed concurrently (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--llm_concurrency",
+        type=int,
+        default=None,
+        help="Max concurrent LLM calls across workers (default from config.py).",
+    )
+    parser.add_argument(
+        "--openalex_concurrency",
+        type=int,
+        default=None,
+        help="Max concurrent OpenAlex requests across workers (default from config.py).",
+    )
+    parser.add_argument(
+        "--s2_concurrency",
+        type=int,
+        default=None,
+        help="Max concurrent Semantic Scholar requests across workers (default from config.py).",
+    )
+    parser.add_argument(
+        "--combined_parse",
+        action=argparse.BooleanOptionalAction,
+        default=COMBINED_PARSE,
+        help="Parse the reference and infer its work type in one LLM call instead of two (default from config.py).",
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="LiteLLM model string overriding MODEL_NAME, e.g. ollama/llama3.1.",
+    )
+    parser.add_argument(
+        "--api_base",
+        default=None,
+        help="LLM API base URL (e.g. http://localhost:11434 for Ollama).",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=["llm", "rules", "auto"],
+        default=PARSER,
+        help="Reference parser: LLM only, rule-based only, or rules with LLM fallback when unsure (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--match_threshold",
+        type=float,
+        default=MATCH_FAST_PATH_THRESHOLD,
+        help="Local match score (0-1) above which the LLM matcher is skipped (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--no_fast_match",
+        action="store_true",
+        help="Always use the LLM to choose among OpenAlex candidates.",
+    )
+    parser.add_argument(
+        "--parse_batch_size",
+        type=int,
+        default=LLM_PARSE_BATCH_SIZE,
+        help="Parse up to this many references per LLM call (1 = one call each; default: %(default)s).",
+    )
+    parser.add_argument(
+        "--batch_openalex",
+        action="store_true",
+        help="Parse all references first, then resolve DOIs with batched OpenAlex requests.",
+    )
+    parser.add_argument(
+        "--hedge_delay",
+        type=float,
+        default=OPENALEX_HEDGE_DELAY,
+        help=(
+            "Start the next OpenAlex search stage after this many seconds without an answer "
+            "(0 = all stages at once; default: sequential)."
+        ),
+    )
+    parser.add_argument(
+        "--openalex_index",
+        default=OPENALEX_INDEX_PATH,
+        help="Local OpenAlex snapshot index (see openalex_index.py); the API is only asked on misses.",
+    )
+    parser.add_argument(
+        "--institutions",
+        default=INSTITUTION_GAZETTEER_PATH,
+        help="Institution gazetteer for affiliation extraction (see `openalex_index.py institutions`).",
+    )
+    parser.add_argument(
+        "--s2_mode",
+        choices=["fallback", "speculative", "bulk"],
+        default=S2_MODE,
+        help=(
+            "Semantic Scholar fallback: search after OpenAlex fails, start it alongside OpenAlex, "
+            "or resolve all unmatched references in bulk at the end (default: %(default)s)."
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip references already in the checkpoint from an earlier (interrupted) run.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Path of the JSONL checkpoint (default: <out>.checkpoint.jsonl).",
+    )
+    parser.add_argument(
+        "--extract_processes",
+        type=int,
+        default=PDF_EXTRACT_PROCESSES,
+        help="Processes used for PDF page extraction (1 = in-process, 0 = one per CPU; default from config.py).",
+    )
+    parser.add_argument(
+        "--detect_bibliography",
+        action=argparse.BooleanOptionalAction,
+        default=DETECT_BIBLIOGRAPHY,
+        help="Find the bibliography pages with a cheap first pass and extract only those "
+        "(papers/theses; default from config.py).",
+    )
+    parser.add_argument(
+        "--low_memory",
+        action=argparse.BooleanOptionalAction,
+        default=PDF_LOW_MEMORY,
+        help="Extract PDF pages one at a time, releasing each page's layout cache (very large PDFs; default from config.py).",
+    )
+    parser.add_argument(
+        "--memory_limit_mb",
+        type=float,
+        default=None,
+        help="With --low_memory: abort extraction if it grows RSS by more than this many MB (default from config.py).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=CACHE_DIR,
+        help="Directory for the OpenAlex/Semantic Scholar response cache (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the response cache (always query the APIs).",
+    )
+    parser.add_argument(
+        "--log_level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default=LOG_LEVEL,
+        help="Log verbosity; DEBUG shows per-reference parse/search details (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--metrics_json",
+        default=None,
+        help="Path of the run metrics summary (default: <out>.metrics.json).",
+    )
+    parser.add_argument(
+        "--prometheus_textfile",
+        default=None,
+        help="Also write metrics in Prometheus text format (node_exporter textfile collector).",
     )
 
     args = parser.parse_args()
+    if args.memory_limit_mb is not None and not args.low_memory:
+        parser.error("--memory_limit_mb requires --low_memory")
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    if args.memory_limit_mb is None and args.low_memory:
+        args.memory_limit_mb = PDF_MEMORY_LIMIT_MB
+
+    # Imported after argument parsing so --help and argument errors stay instant.
+    from pipeline import process_pdf_to_excel, process_pdfs_to_excel
+
+    if args.model or args.api_base:
+        from dspy_models import configure_lm
+        configure_lm(model=args.model or MODEL_NAME, api_base=args.api_base or API_BASE)
 
-    process_pdf_to_excel(
-        pdf_path=args.pdf,
-        output_path=args.out,
+    run_options = dict(
         max_refs=args.max_refs,
+        workers=args.workers,
+        llm_concurrency=args.llm_concurrency,
+        openalex_concurrency=args.openalex_concurrency,
+        s2_concurrency=args.s2_concurrency,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        combined_parse=args.combined_parse,
+        parser=args.parser,
+        match_threshold=None if args.no_fast_match else args.match_threshold,
+        batch_openalex=args.batch_openalex,
+        parse_batch_size=args.parse_batch_size,
+        hedge_delay=args.hedge_delay,
+        s2_mode=args.s2_mode,
+        resume=args.resume,
+        checkpoint_path=args.checkpoint,
+        extract_processes=args.extract_processes,
+        detect_bibliography=args.detect_bibliography,
+        low_memory=args.low_memory,
+        memory_limit_mb=args.memory_limit_mb,
+        metrics_path=args.metrics_json,
+        prometheus_path=args.prometheus_textfile,
+        openalex_index=args.openalex_index,
+        institutions=args.institutions,
     )
+    if args.pdf:
+        process_pdf_to_excel(pdf_path=args.pdf, output_path=args.out, **run_options)
+    else:
+        from dedup import list_documents
+        documents = list_documents(pdf_dir=args.pdf_dir, manifest=args.manifest)
+        if not documents:
+            parser.error("no PDFs found in " + (args.pdf_dir or args.manifest))
+        process_pdfs_to_excel(documents, output_path=args.out, per_document_dir=args.per_document_dir,
+                              **run_options)
 
 
 if __name__ == "__main__":
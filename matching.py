@@ -0,0 +1,184 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    MATCH_FAST_PATH_THRESHOLD,
+    MATCH_FAST_PATH_MIN_TITLE_SIMILARITY,
+    MATCH_FAST_PATH_MIN_MARGIN,
+    MATCH_PROMPT_TOP_K,
+    MATCH_DEDUP_TITLE_SIMILARITY,
+)
+
+# Work types that are earlier versions of a published work.
+_PREPRINT_TYPES = {"preprint", "posted-content"}
+
+# Component weights for score_candidate (sum to 1.0).
+_WEIGHTS = {"title": 0.55, "year": 0.15, "authors": 0.2, "type": 0.1}
+
+
+def _fold(text: str) -> str:
+    """Lowercase and strip accents."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def normalize_title(title: str) -> str:
+    cleaned = re.sub(r"[^\w\s]", " ", _fold(title))
+    return " ".join(cleaned.split())
+
+
+def title_similarity(a: str, b: str) -> float:
+    """Similarity of two titles in [0, 1] after normalization."""
+    na, nb = normalize_title(a), normalize_title(b)
+    if not na or not nb:
+        return 0.0
+    if na == nb:
+        return 1.0
+    return SequenceMatcher(None, na, nb).ratio()
+
+
+def surname(name: str) -> str:
+    """
+    Best-effort surname: text before a comma ("Hill, J."), otherwise the last
+    token longer than an initial ("J. R. Hill").
+    """
+    folded = _fold(name).strip()
+    if not folded:
+        return ""
+    if "," in folded:
+        folded = folded.split(",", 1)[0]
+        tokens = re.findall(r"[a-z][a-z'\-]*", folded)
+        return tokens[-1] if tokens else ""
+    tokens = [t for t in re.findall(r"[a-z][a-z'\-]*", folded) if len(t) > 1]
+    return tokens[-1] if tokens else ""
+
+
+def _candidate_author_names(candidate: Dict[str, Any]) -> List[str]:
+    return [
+        (a.get("author") or {}).get("display_name", "")
+        for a in (candidate.get("authorships") or [])
+    ]
+
+
+def _year_score(parsed_year: Optional[int], candidate_year: Optional[int]) -> float:
+    if not parsed_year or not candidate_year:
+        return 0.5
+    return {0: 1.0, 1: 0.7, 2: 0.4}.get(abs(int(parsed_year) - int(candidate_year)), 0.0)
+
+
+def _author_score(parsed_authors: List[str], candidate_authors: List[str]) -> float:
+    parsed = [s for s in (surname(a) for a in parsed_authors) if s]
+    found = [s for s in (surname(a) for a in candidate_authors) if s]
+    if not parsed or not found:
+        return 0.5
+    overlap = len(set(parsed) & set(found)) / min(len(set(parsed)), len(set(found)))
+    first_bonus = 1.0 if parsed[0] == found[0] else 0.0
+    return 0.6 * overlap + 0.4 * first_bonus
+
+
+def _type_score(work_type: Optional[str], candidate_type: Optional[str]) -> float:
+    if not work_type or work_type == "unknown" or not candidate_type:
+        return 0.5
+    return 1.0 if work_type == candidate_type else 0.0
+
+
+def score_candidate(parsed_title: str,
+                    parsed_year: Optional[int],
+                    parsed_authors: List[str],
+                    work_type: Optional[str],
+                    candidate: Dict[str, Any]) -> Tuple[float, float]:
+    """
+    Score one OpenAlex candidate against the parsed reference.
+    Returns (overall score, title similarity), both in [0, 1].
+    """
+    title_sim = title_similarity(parsed_title, candidate.get("title") or "")
+    score = (
+        _WEIGHTS["title"] * title_sim
+        + _WEIGHTS["year"] * _year_score(parsed_year, candidate.get("publication_year"))
+        + _WEIGHTS["authors"] * _author_score(parsed_authors, _candidate_author_names(candidate))
+        + _WEIGHTS["type"] * _type_score(work_type, candidate.get("type"))
+    )
+    return score, title_sim
+
+
+def local_best_match(parsed_title: str,
+                     parsed_year: Optional[int],
+                     parsed_authors: List[str],
+                     candidates: List[Dict[str, Any]],
+                     work_type: Optional[str],
+                     threshold: float = MATCH_FAST_PATH_THRESHOLD) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Deterministic fast path ahead of the LLM matcher.
+    Returns (candidate, score) when one candidate is a confident, unambiguous
+    match; otherwise (None, best score) and the caller should ask the LLM.
+    """
+    if not candidates or not parsed_title:
+        return None, 0.0
+
+    scored = sorted(
+        (score_candidate(parsed_title, parsed_year, parsed_authors, work_type, c) + (i,)
+         for i, c in enumerate(candidates)),
+        key=lambda s: s[0],
+        reverse=True,
+    )
+    best_score, best_title_sim, best_idx = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+
+    if (best_score >= threshold
+            and best_title_sim >= MATCH_FAST_PATH_MIN_TITLE_SIMILARITY
+            and best_score - runner_up >= MATCH_FAST_PATH_MIN_MARGIN):
+        return candidates[best_idx], best_score
+    return None, best_score
+
+
+_NUMBER_TOKEN_RE = re.compile(r"^(?:\d+|[ivx]+)$")
+
+
+def _number_tokens(title: str) -> set:
+    return {t for t in normalize_title(title).split() if _NUMBER_TOKEN_RE.match(t)}
+
+
+def _same_work(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """
+    Near-identical candidates: same title (numbers such as "Part II" must
+    agree), first author and (within 2 years) year.
+    """
+    title_a, title_b = a.get("title") or "", b.get("title") or ""
+    if title_similarity(title_a, title_b) < MATCH_DEDUP_TITLE_SIMILARITY \
+            or _number_tokens(title_a) != _number_tokens(title_b):
+        return False
+    names_a, names_b = _candidate_author_names(a), _candidate_author_names(b)
+    if names_a and names_b and surname(names_a[0]) != surname(names_b[0]):
+        return False
+    year_a, year_b = a.get("publication_year"), b.get("publication_year")
+    return not (year_a and year_b and abs(int(year_a) - int(year_b)) > 2)
+
+
+def shortlist_candidates(parsed_title: str,
+                         parsed_year: Optional[int],
+                         parsed_authors: List[str],
+                         candidates: List[Dict[str, Any]],
+                         work_type: Optional[str],
+                         top_k: int = MATCH_PROMPT_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Candidates worth showing the LLM matcher: ranked by score_candidate,
+    near-duplicates (preprint / published versions) reduced to the better
+    scored one (the published version on a tie), cut to top_k.
+    """
+    ranked = sorted(
+        enumerate(candidates),
+        key=lambda ic: (
+            -round(score_candidate(parsed_title, parsed_year, parsed_authors, work_type, ic[1])[0], 3),
+            ic[1].get("type") in _PREPRINT_TYPES,
+            ic[0],
+        ),
+    )
+    kept: List[Dict[str, Any]] = []
+    for _, candidate in ranked:
+        if any(_same_work(candidate, k) for k in kept):
+            continue
+        kept.append(candidate)
+        if len(kept) >= top_k:
+            break
+    return kept
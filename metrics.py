@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Spans keep at most this many samples each for percentiles (count/sum stay exact).
+_MAX_SAMPLES = 10_000
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_spans: Dict[_Key, Dict[str, Any]] = {}
+_counters: Dict[_Key, float] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def record_span(name: str, seconds: float, **labels: Any) -> None:
+    """Add one duration sample to a span (e.g. record_span("openalex_stage", 0.2, stage="1a"))."""
+    key = _key(name, labels)
+    with _lock:
+        span = _spans.get(key)
+        if span is None:
+            span = _spans[key] = {"count": 0, "sum": 0.0, "max": 0.0, "samples": []}
+        span["count"] += 1
+        span["sum"] += seconds
+        span["max"] = max(span["max"], seconds)
+        samples = span["samples"]
+        if len(samples) < _MAX_SAMPLES:
+            samples.append(seconds)
+        else:
+            # keep a spread of samples once full
+            samples[span["count"] % _MAX_SAMPLES] = seconds
+
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[None]:
+    """Time the enclosed block (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, **labels)
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    """Increase a counter (e.g. incr("http_requests", host="api.openalex.org"))."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def reset() -> None:
+    """Forget all spans and counters (start of a run)."""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def _quantile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Current metrics: {"spans": [{name, labels, count, total_s, mean_ms,
+    p50_ms, p90_ms, p99_ms, max_ms}], "counters": [{name, labels, value}]}.
+    """
+    with _lock:
+        spans = [(k, dict(v, samples=sorted(v["samples"]))) for k, v in _spans.items()]
+        counters = list(_counters.items())
+
+    span_rows = []
+    for (name, labels), s in sorted(spans):
+        ordered = s["samples"]
+        span_rows.append({
+            "name": name,
+            "labels": dict(labels),
+            "count": s["count"],
+            "total_s": round(s["sum"], 4),
+            "mean_ms": round(s["sum"] / s["count"] * 1000, 2),
+            "p50_ms": round(_quantile(ordered, 0.5) * 1000, 2),
+            "p90_ms": round(_quantile(ordered, 0.9) * 1000, 2),
+            "p99_ms": round(_quantile(ordered, 0.99) * 1000, 2),
+            "max_ms": round(s["max"] * 1000, 2),
+        })
+    counter_rows = [
+        {"name": name, "labels": dict(labels), "value": value}
+        for (name, labels), value in sorted(counters)
+    ]
+    return {"spans": span_rows, "counters": counter_rows}
+
+
+def counter_total(name: str) -> float:
+    """Sum of a counter over all label sets."""
+    with _lock:
+        return sum(v for (n, _), v in _counters.items() if n == name)
+
+
+def format_summary(data: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Human-readable lines for the end-of-run log."""
+    data = data or snapshot()
+    lines = []
+    for s in data["spans"]:
+        label = f"[{_label_text(tuple(s['labels'].items()))}]" if s["labels"] else ""
+        lines.append(
+            f"{s['name']}{label}: n={s['count']} total={s['total_s']:.2f}s "
+            f"p50={s['p50_ms']:.1f}ms p90={s['p90_ms']:.1f}ms p99={s['p99_ms']:.1f}ms max={s['max_ms']:.1f}ms"
+        )
+    for c in data["counters"]:
+        label = f"[{_label_text(tuple(c['labels'].items()))}]" if c["labels"] else ""
+        value = int(c["value"]) if float(c["value"]).is_integer() else round(c["value"], 3)
+        lines.append(f"{c['name']}{label}: {value}")
+    return lines
+
+
+def write_summary(path: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Write the metrics snapshot (plus extra run info) as JSON; returns what was written."""
+    data = dict(extra or {})
+    data.update(snapshot())
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, ensure_ascii=False, default=str)
+    return data
+
+
+def _prom_escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: Dict[str, Any], **more: Any) -> str:
+    merged = dict(labels, **more)
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in merged.items()) + "}"
+
+
+def write_prometheus(path: str, prefix: str = "refextract") -> None:
+    """
+    Export in the Prometheus text format for node_exporter's textfile
+    collector. The file is replaced atomically so the collector never reads
+    a partial write.
+    """
+    data = snapshot()
+    lines: List[str] = []
+    seen = set()
+    for s in data["spans"]:
+        metric = f"{prefix}_{s['name']}_seconds"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} summary")
+        for q, field in (("0.5", "p50_ms"), ("0.9", "p90_ms"), ("0.99", "p99_ms")):
+            lines.append(f"{metric}{_prom_labels(s['labels'], quantile=q)} {s[field] / 1000:.6f}")
+        lines.append(f"{metric}_sum{_prom_labels(s['labels'])} {s['total_s']:.6f}")
+        lines.append(f"{metric}_count{_prom_labels(s['labels'])} {s['count']}")
+    for c in data["counters"]:
+        metric = f"{prefix}_{c['name']}_total"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_prom_labels(c['labels'])} {c['value']}")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
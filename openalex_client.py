@@ -1,34 +1,68 @@
-import requests
+import asyncio
+import logging
 import re
-from typing import List, Dict, Any, Optional, Tuple
-from config import OPENALEX_BASE_URL, OPENALEX_MAILTO
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from config import (
+    OPENALEX_BASE_URL,
+    OPENALEX_MAILTO,
+    OPENALEX_HEDGE_DELAY,
+    OPENALEX_BATCH_DOI_SIZE,
+    OPENALEX_SELECT_FIELDS,
+    OPENALEX_MAX_AUTHORSHIPS,
+)
+from concurrency import get_limits
+from http_client import http_get, ahttp_get, response_json
+from cache import cached_response, store_response
+from metrics import span
+from rate_limit import CircuitOpenError
 
-def fetch_openalex_candidates(title: str,
-                              year: Optional[int] = None,
-                              first_author: Optional[str] = None,
-                              work_type: Optional[str] = None,
-                              per_page: int = 10) -> List[Dict[str, Any]]:
-    """
-    Two-stage OpenAlex search with robust fallbacks:
+logger = logging.getLogger(__name__)
 
-      Stage 1a: precise title.search + optional type
-      Stage 1b: title.search only (no type) if 1a returns nothing
+# Threads for hedged stage requests (shared by all references), created on first
+# use and sized from the OpenAlex concurrency cap (see _submit_stage).
+_stage_pool: Optional[ThreadPoolExecutor] = None
+_stage_pool_size = 0
+_stage_pool_lock = threading.Lock()
 
-      Stage 2a: broader 'search=' with year window
-      Stage 2b: 'search=' without year filter if 2a returns nothing
+
+def _submit_stage(fn: Callable[..., Any], *args: Any) -> Future:
     """
-    if not title:
-        return []
+    Submit to the hedged-stage pool, recreated when the OpenAlex cap has
+    changed since it was made. Submitting under the lock means a concurrent
+    resize cannot shut the pool down before the call is queued.
+    """
+    global _stage_pool, _stage_pool_size
+    size = max(4, get_limits()["openalex"] * 2)
+    with _stage_pool_lock:
+        if _stage_pool is None or _stage_pool_size != size:
+            if _stage_pool is not None:
+                _stage_pool.shutdown(wait=False)  # stages already submitted still run
+            _stage_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="openalex-stage")
+            _stage_pool_size = size
+        return _stage_pool.submit(fn, *args)
+
 
-    def normalize_last_name(name: str) -> str:
-        cleaned = re.sub(r"[^A-Za-z\s'-]", " ", name or "")
-        tokens = [t for t in cleaned.split() if t]
-        return tokens[-1] if tokens else ""
+def _normalize_last_name(name: str) -> str:
+    cleaned = re.sub(r"[^A-Za-z\s'-]", " ", name or "")
+    tokens = [t for t in cleaned.split() if t]
+    return tokens[-1] if tokens else ""
 
+
+def _openalex_stages(title: str,
+                     year: Optional[int],
+                     first_author: Optional[str],
+                     work_type: Optional[str],
+                     per_page: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Build the (label, params) list for each search stage, in precedence order.
+    Stages that would repeat an earlier query are left out.
+    """
     clean_title = re.sub(r"[^\w\s]", " ", title)
     clean_title = " ".join(clean_title.split())
 
-    base_url = f"{OPENALEX_BASE_URL}/works"
+    stages: List[Tuple[str, Dict[str, Any]]] = []
 
     # ---------- Stage 1a: title.search + type (if given) ----------
     filter_parts = [f"title.search:{clean_title}"]
@@ -37,50 +71,30 @@ def fetch_openalex_candidates(title: str,
 
     params1 = {
         "mailto": OPENALEX_MAILTO,
+        "select": OPENALEX_SELECT_FIELDS,
         "per_page": per_page,
         "sort": "cited_by_count:desc",
         "filter": ",".join(filter_parts),
     }
-
-    print("  OpenAlex Stage 1a query:", params1)
-    try:
-        resp1 = requests.get(base_url, params=params1, timeout=30)
-        resp1.raise_for_status()
-        results1 = resp1.json().get("results", []) or []
-    except Exception as e:
-        print("  Stage 1a OpenAlex error:", e)
-        results1 = []
-
-    # If we got hits, we're done
-    if results1:
-        return results1
+    stages.append(("Stage 1a", params1))
 
     # ---------- Stage 1b: title.search only (no type filter) ----------
     if work_type:
         params1b = params1.copy()
         # rebuild filter without type
         params1b["filter"] = f"title.search:{clean_title}"
-        print("  OpenAlex Stage 1b query (no type):", params1b)
-        try:
-            resp1b = requests.get(base_url, params=params1b, timeout=30)
-            resp1b.raise_for_status()
-            results1b = resp1b.json().get("results", []) or []
-        except Exception as e:
-            print("  Stage 1b OpenAlex error:", e)
-            results1b = []
-
-        if results1b:
-            return results1b
+        stages.append(("Stage 1b (no type)", params1b))
 
     # ---------- Stage 2a: broader 'search=' with year window ----------
     search_query = clean_title
     if first_author:
         # still append only last token, but this is just a hint
-        last_name = normalize_last_name(first_author)
+        last_name = _normalize_last_name(first_author)
         search_query = f"{clean_title} {last_name}"
 
     params2 = {
         "search": search_query,
+        "select": OPENALEX_SELECT_FIELDS,
         "per_page": per_page,
         "mailto": OPENALEX_MAILTO,
     }
@@ -90,38 +104,274 @@ def fetch_openalex_candidates(title: str,
             f"from_publication_date:{year-3}-01-01,"
             f"to_publication_date:{year+3}-12-31"
         )
-
-    print("  OpenAlex Stage 2a query:", params2)
-    try:
-        resp2 = requests.get(base_url, params=params2, timeout=30)
-        resp2.raise_for_status()
-        results2 = resp2.json().get("results", []) or []
-    except Exception as e:
-        print("  Stage 2a OpenAlex error:", e)
-        results2 = []
-
-    if results2:
-        return results2
+    stages.append(("Stage 2a", params2))
 
     # ---------- Stage 2b: 'search=' with NO year filter ----------
     if year and "filter" in params2:
         params2b = params2.copy()
         params2b.pop("filter", None)
-        print("  OpenAlex Stage 2b query (no year filter):", params2b)
-        try:
-            resp2b = requests.get(base_url, params=params2b, timeout=30)
-            resp2b.raise_for_status()
-            results2b = resp2b.json().get("results", []) or []
-        except Exception as e:
-            print("  Stage 2b OpenAlex error:", e)
-            results2b = []
+        stages.append(("Stage 2b (no year filter)", params2b))
 
-        return results2b
+    return stages
+
+
+def compact_work(work: Dict[str, Any], max_authorships: int = OPENALEX_MAX_AUTHORSHIPS) -> Dict[str, Any]:
+    """
+    Candidate record with only what matching and author extraction read
+    (id, doi, title, year, type, citations, authorships with author and
+    institution names). Beyond max_authorships, the middle authors are dropped.
+    """
+    authorships = work.get("authorships") or []
+    if len(authorships) > max_authorships:
+        authorships = authorships[:max_authorships - 1] + authorships[-1:]
+    return {
+        "id": work.get("id", ""),
+        "doi": work.get("doi"),
+        "title": work.get("title") or work.get("display_name") or "",
+        "publication_year": work.get("publication_year"),
+        "type": work.get("type"),
+        "cited_by_count": work.get("cited_by_count"),
+        "authorships": [
+            {
+                "author": {
+                    "id": (a.get("author") or {}).get("id", ""),
+                    "display_name": (a.get("author") or {}).get("display_name", ""),
+                },
+                "institutions": [
+                    {"display_name": i["display_name"]}
+                    for i in (a.get("institutions") or [])
+                    if i.get("display_name")
+                ],
+            }
+            for a in authorships
+        ],
+    }
+
+
+def _stage_name(label: str) -> str:
+    """Metric label for a stage: "Stage 1b (no type)" -> "Stage 1b", "batch DOI (50 refs)" -> "batch DOI"."""
+    return label.split(" (", 1)[0]
+
+
+def _openalex_get_results(label: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Run one stage query; errors are logged and treated as no results.
+    Successful responses (including empty ones) go through the response cache.
+    """
+    url = f"{OPENALEX_BASE_URL}/works"
+    hit, cached = cached_response(url, params)
+    if hit:
+        logger.debug("  OpenAlex %s (cached): %d results", label, len(cached))
+        return cached
+    logger.debug("  OpenAlex %s query: %s", label, params)
+    try:
+        with span("openalex_stage", stage=_stage_name(label)):
+            resp = http_get(url, params=params, timeout=30, service="openalex")
+        resp.raise_for_status()
+        results = [compact_work(w) for w in response_json(resp).get("results", []) or []]
+    except CircuitOpenError:
+        logger.debug("  %s OpenAlex circuit open; skipping.", label)
+        return []
+    except Exception as e:
+        logger.warning("  %s OpenAlex error: %s", label, e)
+        return []
+    store_response(url, params, results)
+    return results
+
+
+async def _aopenalex_get_results(label: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Async counterpart of _openalex_get_results."""
+    url = f"{OPENALEX_BASE_URL}/works"
+    hit, cached = cached_response(url, params)
+    if hit:
+        logger.debug("  OpenAlex %s (cached): %d results", label, len(cached))
+        return cached
+    logger.debug("  OpenAlex %s query: %s", label, params)
+    try:
+        with span("openalex_stage", stage=_stage_name(label)):
+            resp = await ahttp_get(url, params=params, timeout=30, service="openalex")
+        resp.raise_for_status()
+        results = [compact_work(w) for w in response_json(resp).get("results", []) or []]
+    except CircuitOpenError:
+        logger.debug("  %s OpenAlex circuit open; skipping.", label)
+        return []
+    except Exception as e:
+        logger.warning("  %s OpenAlex error: %s", label, e)
+        return []
+    store_response(url, params, results)
+    return results
+
+
+def _fetch_stages_hedged(stages: List[Tuple[str, Dict[str, Any]]],
+                         hedge_delay: float) -> List[Dict[str, Any]]:
+    """
+    Run the stages with hedging: stage i+1 starts once stage i has been
+    pending for hedge_delay seconds (or has come back empty). The answer is
+    still the highest-priority non-empty result; lower stages are cancelled
+    once it is known (requests already on the wire finish and are cached).
+    """
+    futures: List[Optional[Future]] = [None] * len(stages)
+
+    def launch(i: int) -> None:
+        if futures[i] is None:
+            futures[i] = _submit_stage(_openalex_get_results, *stages[i])
+
+    launch(0)
+    current = 0
+    try:
+        while current < len(stages):
+            launch(current)
+            pending_launch = next((i for i, f in enumerate(futures) if f is None), None)
+            timeout = hedge_delay if pending_launch is not None else None
+            wait([futures[current]], timeout=timeout, return_when=FIRST_COMPLETED)
+            if futures[current].done():
+                results = futures[current].result()
+                if results:
+                    return results
+                current += 1
+            elif pending_launch is not None:
+                launch(pending_launch)
+        return []
+    finally:
+        for f in futures:
+            if f is not None:
+                f.cancel()
+
+
+async def _afetch_stages_hedged(stages: List[Tuple[str, Dict[str, Any]]],
+                                hedge_delay: float) -> List[Dict[str, Any]]:
+    """Async counterpart of _fetch_stages_hedged; losing requests are cancelled on the wire."""
+    tasks: List[Optional[asyncio.Task]] = [None] * len(stages)
+
+    def launch(i: int) -> None:
+        if tasks[i] is None:
+            tasks[i] = asyncio.ensure_future(_aopenalex_get_results(*stages[i]))
+
+    launch(0)
+    current = 0
+    try:
+        while current < len(stages):
+            launch(current)
+            pending_launch = next((i for i, t in enumerate(tasks) if t is None), None)
+            timeout = hedge_delay if pending_launch is not None else None
+            await asyncio.wait([tasks[current]], timeout=timeout)
+            if tasks[current].done():
+                results = tasks[current].result()
+                if results:
+                    return results
+                current += 1
+            elif pending_launch is not None:
+                launch(pending_launch)
+        return []
+    finally:
+        for t in tasks:
+            if t is not None and not t.done():
+                t.cancel()
+
+
+def fetch_openalex_candidates(title: str,
+                              year: Optional[int] = None,
+                              first_author: Optional[str] = None,
+                              work_type: Optional[str] = None,
+                              per_page: int = 10,
+                              hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY) -> List[Dict[str, Any]]:
+    """
+    Two-stage OpenAlex search with robust fallbacks:
+
+      Stage 1a: precise title.search + optional type
+      Stage 1b: title.search only (no type) if 1a returns nothing
+
+      Stage 2a: broader 'search=' with year window
+      Stage 2b: 'search=' without year filter if 2a returns nothing
+
+    The first stage with hits wins. With hedge_delay set, later stages are
+    started speculatively instead of waiting for earlier ones to fail.
+    """
+    if not title:
+        return []
+
+    stages = _openalex_stages(title, year, first_author, work_type, per_page)
+    if hedge_delay is not None:
+        return _fetch_stages_hedged(stages, hedge_delay)
+
+    for label, params in stages:
+        results = _openalex_get_results(label, params)
+        if results:
+            return results
 
     # If absolutely nothing worked, return empty list
     return []
 
 
+async def afetch_openalex_candidates(title: str,
+                                     year: Optional[int] = None,
+                                     first_author: Optional[str] = None,
+                                     work_type: Optional[str] = None,
+                                     per_page: int = 10,
+                                     hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY) -> List[Dict[str, Any]]:
+    """Async version of fetch_openalex_candidates (same stages and precedence)."""
+    if not title:
+        return []
+
+    stages = _openalex_stages(title, year, first_author, work_type, per_page)
+    if hedge_delay is not None:
+        return await _afetch_stages_hedged(stages, hedge_delay)
+
+    for label, params in stages:
+        results = await _aopenalex_get_results(label, params)
+        if results:
+            return results
+
+    return []
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _bare_doi(doi: Optional[str]) -> str:
+    doi = (doi or "").strip().lower()
+    for prefix in ("https://doi.org/", "http://doi.org/", "doi:"):
+        if doi.startswith(prefix):
+            doi = doi[len(prefix):]
+    return doi
+
+
+def resolve_openalex_batch(parsed_refs: List[Dict[str, Any]],
+                           doi_batch_size: int = OPENALEX_BATCH_DOI_SIZE) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Resolve many parsed references by DOI ahead of the per-reference search:
+    DOIs are OR-ed into `doi:a|b|c` filters, doi_batch_size per request.
+    Titles are left to the staged search; OpenAlex only ORs attribute filters
+    such as doi:, so a title request here would save nothing.
+
+    Returns one entry per input: a candidate list for resolved references,
+    or None for leftovers that still need fetch_openalex_candidates.
+    """
+    resolved: List[Optional[List[Dict[str, Any]]]] = [None] * len(parsed_refs)
+
+    by_doi: Dict[str, List[int]] = {}
+    for i, parsed in enumerate(parsed_refs):
+        doi = _bare_doi(parsed.get("doi"))
+        # ',' and '|' would break the filter syntax
+        if doi and "," not in doi and "|" not in doi:
+            by_doi.setdefault(doi, []).append(i)
+
+    for chunk in _chunks(sorted(by_doi), doi_batch_size):
+        params = {
+            "mailto": OPENALEX_MAILTO,
+            "select": OPENALEX_SELECT_FIELDS,
+            "per_page": 200,
+            "filter": "doi:" + "|".join(chunk),
+        }
+        for work in _openalex_get_results(f"batch DOI ({len(chunk)} refs)", params):
+            for i in by_doi.get(_bare_doi(work.get("doi")), []):
+                resolved[i] = [work]
+
+    hits = sum(1 for r in resolved if r is not None)
+    logger.info("  OpenAlex batch lookup resolved %d/%d references", hits, len(parsed_refs))
+    return resolved
+
 
 def extract_authors_from_work(work: dict[str, Any]) -> tuple[dict, dict]:
     """Extract first and last author info from an OpenAlex work."""
@@ -0,0 +1,385 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from config import OPENALEX_INDEX_PATH, OPENALEX_INDEX_MIN_TITLE_SIMILARITY, OPENALEX_MAX_AUTHORSHIPS
+from http_client import json_loads
+from matching import normalize_title, surname, title_similarity
+from metrics import incr, span
+from openalex_client import compact_work
+from reference_parser import extract_doi
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = [
+    # rowid = numeric part of the OpenAlex id (W2741809807 -> 2741809807), so a
+    # newer snapshot record for the same work replaces the old one in place.
+    "CREATE TABLE IF NOT EXISTS works ("
+    " rowid INTEGER PRIMARY KEY,"
+    " id TEXT NOT NULL,"
+    " doi TEXT,"
+    " title TEXT NOT NULL,"
+    " norm_title TEXT NOT NULL,"
+    " publication_year INTEGER,"
+    " type TEXT,"
+    " cited_by_count INTEGER,"
+    " authorships TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS works_doi ON works(doi)",
+    "CREATE INDEX IF NOT EXISTS works_norm_title ON works(norm_title)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5("
+    " title, surnames, tokenize='unicode61 remove_diacritics 2')",
+]
+
+
+# ===================== BUILD =====================
+
+def _snapshot_files(paths: List[str]) -> List[str]:
+    """Expand directories into their *.gz / *.jsonl / *.json shards (sorted, recursive)."""
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, n) for n in names if n.endswith((".gz", ".jsonl", ".json"))
+                )
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def _iter_snapshot_works(path: str) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning("Skipping malformed line in %s", path)
+
+
+def _work_row(work: Dict[str, Any], max_authors: int) -> Optional[tuple]:
+    work = compact_work(work, max_authors)
+    numeric = work["id"].rsplit("/", 1)[-1].lstrip("W")
+    if not work["title"] or not numeric.isdigit():
+        return None
+    surnames = " ".join(
+        s for s in (surname(a["author"]["display_name"]) for a in work["authorships"]) if s
+    )
+    return (
+        int(numeric),
+        work["id"],
+        extract_doi(work["doi"] or ""),
+        work["title"],
+        normalize_title(work["title"]),
+        work["publication_year"],
+        work["type"],
+        work["cited_by_count"],
+        json.dumps(work["authorships"], ensure_ascii=False, separators=(",", ":")),
+        surnames,
+    )
+
+
+def _write_batch(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    rows = list({r[0]: r for r in rows}.values())  # a work repeated within the batch: keep the later record
+    rowids = [r[0] for r in rows]
+    existing = []
+    for i in range(0, len(rowids), 500):
+        chunk = rowids[i:i + 500]
+        existing += [r[0] for r in conn.execute(
+            f"SELECT rowid FROM works WHERE rowid IN ({','.join('?' * len(chunk))})", chunk
+        )]
+    if existing:
+        conn.executemany("DELETE FROM works_fts WHERE rowid = ?", [(r,) for r in existing])
+    conn.executemany(
+        "INSERT OR REPLACE INTO works (rowid, id, doi, title, norm_title, publication_year, type,"
+        " cited_by_count, authorships) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [r[:9] for r in rows],
+    )
+    conn.executemany(
+        "INSERT INTO works_fts (rowid, title, surnames) VALUES (?, ?, ?)",
+        [(r[0], r[3], r[9]) for r in rows],
+    )
+
+
+def build_index(paths: List[str],
+                db_path: str,
+                min_year: Optional[int] = None,
+                types: Optional[List[str]] = None,
+                max_authors: int = OPENALEX_MAX_AUTHORSHIPS,
+                batch_size: int = 5000) -> Dict[str, int]:
+    """
+    Ingest snapshot shards into the index at db_path (created or updated).
+    Works without a title, older than min_year or not of one of types are
+    skipped. Returns {"files", "read", "indexed"}.
+    """
+    files = _snapshot_files(paths)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    for statement in _SCHEMA:
+        conn.execute(statement)
+
+    stats = {"files": len(files), "read": 0, "indexed": 0}
+    wanted_types = set(types or [])
+    start = time.perf_counter()
+    batch: List[tuple] = []
+    for path in files:
+        logger.info("Indexing %s", path)
+        for work in _iter_snapshot_works(path):
+            stats["read"] += 1
+            if min_year and (work.get("publication_year") or 0) < min_year:
+                continue
+            if wanted_types and work.get("type") not in wanted_types:
+                continue
+            row = _work_row(work, max_authors)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _write_batch(conn, batch)
+                conn.commit()
+                stats["indexed"] += len(batch)
+                batch = []
+    if batch:
+        _write_batch(conn, batch)
+        stats["indexed"] += len(batch)
+    conn.execute("INSERT INTO works_fts (works_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=DELETE")  # single file, opens read-only anywhere
+    conn.close()
+    logger.info("Indexed %d of %d works from %d files in %.1f s",
+                stats["indexed"], stats["read"], stats["files"], time.perf_counter() - start)
+    return stats
+
+
+def build_institution_gazetteer(paths: List[str], out_path: str) -> Dict[str, int]:
+    """
+    Write an institution gazetteer for affiliations.py from snapshot
+    institution shards (openalex-snapshot/data/institutions): one
+    "alias<TAB>display name" line per display name and alternative name.
+    Returns {"files", "institutions", "names"}.
+    """
+    files = _snapshot_files(paths)
+    stats = {"files": len(files), "institutions": 0, "names": 0}
+    with open(out_path, "w", encoding="utf-8") as out:
+        for path in files:
+            logger.info("Reading %s", path)
+            for inst in _iter_snapshot_works(path):
+                name = " ".join((inst.get("display_name") or "").split())
+                if not name:
+                    continue
+                stats["institutions"] += 1
+                aliases = [name] + [" ".join(a.split()) for a in inst.get("display_name_alternatives") or []]
+                for alias in dict.fromkeys(a for a in aliases if a):
+                    out.write(f"{alias}\t{name}\n")
+                    stats["names"] += 1
+    logger.info("Wrote %d names of %d institutions to %s", stats["names"], stats["institutions"], out_path)
+    return stats
+
+
+# ===================== QUERY =====================
+
+def _fts_phrase(tokens: List[str], operator: str) -> str:
+    return f" {operator} ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+
+
+class OpenAlexIndex:
+    """
+    Read-only access to an index built by build_index. Results are work dicts
+    in the same compact shape as the API candidates (see
+    openalex_client.compact_work). Safe to share
+    between threads (one SQLite connection per thread).
+    """
+
+    _COLUMNS = "w.id, w.doi, w.title, w.publication_year, w.type, w.cited_by_count, w.authorships"
+
+    def __init__(self, path: str) -> None:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"OpenAlex index not found: {path}")
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            uri = "file:" + os.path.abspath(self.path) + "?mode=ro"
+            conn = self._local.conn = sqlite3.connect(uri, uri=True)
+        return conn
+
+    def _works(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        works = []
+        for work_id, doi, title, year, work_type, cited_by, authorships in self._conn().execute(sql, params):
+            works.append({
+                "id": work_id,
+                "doi": f"https://doi.org/{doi}" if doi else None,
+                "title": title,
+                "publication_year": year,
+                "type": work_type,
+                "cited_by_count": cited_by,
+                "authorships": json_loads(authorships),
+            })
+        return works
+
+    def lookup_doi(self, doi: str) -> List[Dict[str, Any]]:
+        bare = extract_doi(doi or "")
+        if not bare:
+            return []
+        return self._works(f"SELECT {self._COLUMNS} FROM works w WHERE w.doi = ?", (bare,))
+
+    def search(self,
+               title: str,
+               year: Optional[int] = None,
+               first_author: Optional[str] = None,
+               per_page: int = 10) -> List[Dict[str, Any]]:
+        """
+        Mirrors the API stages: exact normalized title, then all title words
+        (most cited first), then any title word within +/-3 years ranked by
+        BM25 with the first author's surname as a bonus term.
+        """
+        norm = normalize_title(title)
+        tokens = norm.split()
+        if not tokens:
+            return []
+        works = self._works(
+            f"SELECT {self._COLUMNS} FROM works w WHERE w.norm_title = ?"
+            " ORDER BY w.cited_by_count DESC LIMIT ?",
+            (norm, per_page),
+        )
+        if works:
+            return works
+        works = self._works(
+            f"SELECT {self._COLUMNS} FROM works_fts f JOIN works w ON w.rowid = f.rowid"
+            " WHERE works_fts MATCH ? ORDER BY w.cited_by_count DESC LIMIT ?",
+            (f"title : ({_fts_phrase(tokens, 'AND')})", per_page),
+        )
+        if works:
+            return works
+        query = f"title : ({_fts_phrase(tokens, 'OR')})"
+        last_name = surname(first_author or "")
+        if last_name:
+            query = f"({query}) OR surnames : {_fts_phrase([last_name], 'OR')}"
+        year_filter, params = "", [query]
+        if year:
+            year_filter = " AND w.publication_year BETWEEN ? AND ?"
+            params += [int(year) - 3, int(year) + 3]
+        return self._works(
+            f"SELECT {self._COLUMNS} FROM works_fts f JOIN works w ON w.rowid = f.rowid"
+            f" WHERE works_fts MATCH ?{year_filter} ORDER BY bm25(works_fts) LIMIT ?",
+            tuple(params + [per_page]),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        (count,) = self._conn().execute("SELECT COUNT(*) FROM works").fetchone()
+        return {"works": count}
+
+
+_index: Optional[OpenAlexIndex] = None
+_index_path: Optional[str] = OPENALEX_INDEX_PATH
+_index_lock = threading.Lock()
+
+
+def configure_openalex_index(path: Optional[str] = OPENALEX_INDEX_PATH) -> None:
+    """Use the index at path for candidate retrieval (None: live API only)."""
+    global _index, _index_path
+    with _index_lock:
+        _index = None
+        _index_path = path
+
+
+def get_openalex_index() -> Optional[OpenAlexIndex]:
+    """Return the configured index (opened lazily), or None."""
+    global _index
+    if _index_path is None:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None and _index_path is not None:
+                _index = OpenAlexIndex(_index_path)
+    return _index
+
+
+def local_candidates(parsed: Dict[str, Any], per_page: int = 10) -> List[Dict[str, Any]]:
+    """
+    Candidates for a parsed reference from the local index: the DOI's work,
+    or title search results. Returns [] (a miss, so the caller asks the API)
+    when no index is configured or nothing is close enough to the parsed title.
+    """
+    index = get_openalex_index()
+    if index is None:
+        return []
+    with span("openalex_local"):
+        works = index.lookup_doi(parsed.get("doi") or "")
+        if not works:
+            authors = parsed.get("authors") or []
+            title = parsed.get("paper_title") or ""
+            works = [
+                w for w in index.search(title, parsed.get("year"), authors[0] if authors else None, per_page)
+                if title_similarity(title, w["title"]) >= OPENALEX_INDEX_MIN_TITLE_SIMILARITY
+            ]
+    incr("openalex_index_hits" if works else "openalex_index_misses")
+    return works
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query a local OpenAlex works index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Ingest snapshot shards (files or directories).")
+    build.add_argument("paths", nargs="+", help="Snapshot .gz/.jsonl files or directories of them.")
+    build.add_argument("--db", required=True, help="Index file to create or update.")
+    build.add_argument("--min_year", type=int, default=None, help="Skip works published before this year.")
+    build.add_argument("--types", nargs="+", default=None,
+                       help="Only index these work types (e.g. journal-article book).")
+    build.add_argument("--max_authors", type=int, default=OPENALEX_MAX_AUTHORSHIPS,
+                       help="Authors kept per work (the last author is always kept).")
+
+    institutions = commands.add_parser(
+        "institutions", help="Write an institution gazetteer (for --institutions) from institution shards."
+    )
+    institutions.add_argument("paths", nargs="+", help="Snapshot institution .gz/.jsonl files or directories.")
+    institutions.add_argument("--out", required=True, help="Gazetteer file to write.")
+
+    query = commands.add_parser("query", help="Show the candidates the pipeline would get for a title.")
+    query.add_argument("title")
+    query.add_argument("--db", required=True)
+    query.add_argument("--year", type=int, default=None)
+    query.add_argument("--author", default=None, help="First author name.")
+    query.add_argument("--doi", default=None)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "build":
+        build_index(args.paths, args.db, min_year=args.min_year, types=args.types, max_authors=args.max_authors)
+        return 0
+    if args.command == "institutions":
+        build_institution_gazetteer(args.paths, args.out)
+        return 0
+
+    configure_openalex_index(args.db)
+    start = time.perf_counter()
+    works = local_candidates({
+        "paper_title": args.title,
+        "year": args.year,
+        "authors": [args.author] if args.author else [],
+        "doi": args.doi,
+    })
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    for w in works:
+        print(f"{w['id']}  {w['publication_year']}  {w['type']}  {w['title']}")
+    print(f"{len(works)} candidates in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,509 @@
+import gc
+import logging
+import os
 import re
-import pdfplumber
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+from config import (
+    PDF_EXTRACT_PROCESSES,
+    PDF_PAGES_PER_CHUNK,
+    DETECT_BIBLIOGRAPHY,
+    PDF_LOW_MEMORY,
+    PDF_MEMORY_LIMIT_MB,
+)
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+from metrics import record_span, span
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+def _open_pdf(pdf_path: str) -> Any:
+    """pdfplumber.open; pdfplumber (and pdfminer) are imported on first use, not with this module."""
+    import pdfplumber
+    return pdfplumber.open(pdf_path)
+
+
+# ===================== BIBLIOGRAPHY DETECTION =====================
+
+_HEADING_RE = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?\s+|[IVX]+\.\s+)?"
+    r"(?:references|bibliography|works cited|literature cited|reference list)\s*:?\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# "[Hill '79] ...", "[12] ...", "12. Author ...", "(12) Author ..."
+_ENTRY_START_RE = re.compile(r"^\s*(?:\[[^\]\n]{1,40}\]|\d{1,3}\.\s+\S|\(\d{1,3}\)\s+\S)")
+_YEAR_RE = re.compile(r"\b(?:1[5-9]|20)\d{2}[a-z]?\b")
+
+
+def _looks_like_references(page_text: str) -> bool:
+    """Entry-label density or (for unlabelled styles like APA) year density."""
+    lines = [line for line in page_text.splitlines() if line.strip()]
+    if not lines:
+        return False
+    entries = sum(1 for line in lines if _ENTRY_START_RE.match(line))
+    years = sum(1 for line in lines if _YEAR_RE.search(line))
+    return (entries >= 3 and entries / len(lines) >= 0.15) or (len(lines) >= 5 and years / len(lines) >= 0.4)
+
+
+def _sketch_text(layout: Any) -> str:
+    """
+    Rough text of a page's characters (pdfminer, no layout analysis): lines
+    by baseline, top to bottom, and words split at horizontal gaps.
+    """
+    from pdfminer.layout import LTChar, LTContainer
+
+    chars = []
+    stack = [layout]
+    while stack:
+        for item in stack.pop():
+            if isinstance(item, LTChar):
+                chars.append(item)
+            elif isinstance(item, LTContainer):  # figures (form XObjects)
+                stack.append(item)
+    chars.sort(key=lambda c: -c.y0)
+    lines: list[list[Any]] = []
+    for char in chars:
+        if lines and abs(lines[-1][0].y0 - char.y0) <= 0.5 * char.size:
+            lines[-1].append(char)
+        else:
+            lines.append([char])
+    out = []
+    for line in lines:
+        line.sort(key=lambda c: c.x0)
+        words = [line[0].get_text()]
+        for prev, char in zip(line, line[1:]):
+            if char.x0 - prev.x1 > 0.15 * char.size:
+                words.append(" ")
+            words.append(char.get_text())
+        out.append("".join(words))
+    return "\n".join(out)
+
+
+def _page_sketcher() -> Callable[[Any], str]:
+    """
+    Function giving the sketch text (see _sketch_text) of a pdfminer page.
+    Only pdfminer's content-stream interpreter runs, which is much cheaper
+    than extract_text and enough for the detection heuristics.
+    """
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+
+    resources = PDFResourceManager()
+    device = PDFPageAggregator(resources, laparams=None)
+    interpreter = PDFPageInterpreter(resources, device)
+
+    def sketch(page_obj: Any) -> str:
+        interpreter.process_page(page_obj)
+        return _sketch_text(device.get_result())
+    return sketch
+
+
+# (page number, looks like references, has a references heading, extracted text or None)
+PageScan = Tuple[int, bool, bool, Optional[str]]
+
+
+def _scan_page(page: int, text: str, extracted: bool = False) -> PageScan:
+    return page, _looks_like_references(text), bool(_HEADING_RE.search(text)), text if extracted else None
+
+
+def _scan_page_range(pdf_path: str, start: int, end: int) -> list[PageScan]:
+    """
+    Scan pages [start, end) for the rules of _select_bibliography (runs in
+    a worker process). Pages that may be kept (reference-like or headed) are
+    extracted here too. A page right after a reference-like one is extracted
+    straight away and judged on its full text, since reference lists run
+    over consecutive pages; so a bibliography costs one sketch per range.
+    """
+    sketch = _page_sketcher()
+    scans: list[PageScan] = []
+    with _open_pdf(pdf_path) as pdf:
+        for n in range(start, end):
+            page = pdf.pages[n]
+            if scans and scans[-1][1]:
+                scans.append(_scan_page(n, page.extract_text() or "", extracted=True))
+                continue
+            scan = _scan_page(n, sketch(page.page_obj))
+            if scan[1] or scan[2]:
+                scan = (n, scan[1], scan[2], page.extract_text() or "")
+            scans.append(scan)
+    return scans
+
+
+def _select_bibliography(scans: Iterable[PageScan]) -> Iterator[Tuple[PageScan, bool]]:
+    """
+    Pair each page scan with whether the page belongs to the bibliography: it
+    looks like a reference list, or carries a "References"/"Bibliography"
+    heading right before one; single-page gaps between such pages are
+    filled. A page is decided once the two after it have been scanned.
+    """
+    pending: list[PageScan] = []  # scans not yet decided, in page order
+    base: list[bool] = []  # kept before gap filling, for every page seen so far but the last
+    decided = 0
+
+    def decision(i: int, last: int) -> bool:
+        gap = 0 < i < last and base[i - 1] and base[i + 1]
+        return base[i] or gap
+
+    for scan in scans:
+        if pending:
+            _, dense, heading, _ = pending[-1]
+            base.append(dense or (heading and scan[1]))
+        pending.append(scan)
+        while decided + 1 < len(base):
+            yield pending.pop(0), decision(decided, decided + 1)
+            decided += 1
+    if pending:
+        base.append(pending[-1][1])
+    last = len(base) - 1
+    while pending:
+        yield pending.pop(0), decision(decided, last)
+        decided += 1
+
+
+def find_bibliography_pages(pdf_path: str) -> list[int]:
+    """
+    0-based indices of the pages that hold references (see
+    _select_bibliography), found with a cheap text pass with no layout
+    analysis (see _page_sketcher). Returns [] if nothing is found.
+    """
+    from pdfminer.pdfpage import PDFPage
+
+    sketch = _page_sketcher()
+    with open(pdf_path, "rb") as fh:
+        scans = (_scan_page(n, sketch(page)) for n, page in enumerate(PDFPage.get_pages(fh)))
+        return [scan[0] for scan, keep in _select_bibliography(scans) if keep]
+
+
+# ===================== MEMORY =====================
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it can't be read."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak RSS of this process or its largest child (extraction workers)."""
+    if resource is None:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def _iter_pages_low_memory(pdf_path: str,
+                           page_numbers: list[int],
+                           memory_limit_mb: Optional[float]) -> Iterator[str]:
+    """
+    Extract pages one at a time in-process, dropping each page's cached
+    layout objects as soon as its text is out. memory_limit_mb bounds
+    extraction's RSS growth: RSS is sampled before and after each page and
+    the differences are summed, so what the pipeline's threads allocate
+    while a page is being handled downstream is not counted (what they
+    allocate during a page's extraction is). Above the limit the PDF is
+    reopened (dropping document-level caches); if that does not bring the
+    growth back under the limit, a MemoryError is raised.
+    """
+    limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+    grown = 0
+    pdf = _open_pdf(pdf_path)
+    try:
+        for n in page_numbers:
+            before = current_rss_bytes() if limit else None
+            page = pdf.pages[n]
+            text = page.extract_text() or ""
+            page.close()
+            after = current_rss_bytes() if before is not None else None
+            if after is not None:
+                grown += after - before
+                if grown > limit:
+                    pdf.close()
+                    gc.collect()
+                    pdf = _open_pdf(pdf_path)
+                    grown += (current_rss_bytes() or after) - after
+                    if grown > limit:
+                        raise MemoryError(
+                            f"PDF extraction at page {n + 1} has grown memory by {grown / 2**20:.0f} MB "
+                            f"(limit {memory_limit_mb:.0f} MB)"
+                        )
+            yield text
+    finally:
+        pdf.close()
+
+
+# ===================== TEXT EXTRACTION =====================
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> list[str]:
+    """Extract text of pages [start, end) (runs in a worker process)."""
+    with _open_pdf(pdf_path) as pdf:
+        return [pdf.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _page_ranges(page_numbers: list[int], pages_per_chunk: int) -> list[tuple[int, int]]:
+    """Group sorted page numbers into contiguous [start, end) chunks."""
+    ranges: list[tuple[int, int]] = []
+    for p in page_numbers:
+        if ranges and ranges[-1][1] == p and p - ranges[-1][0] < pages_per_chunk:
+            ranges[-1] = (ranges[-1][0], p + 1)
+        else:
+            ranges.append((p, p + 1))
+    return ranges
+
+
+def iter_page_texts(pdf_path: str,
+                    processes: Optional[int] = PDF_EXTRACT_PROCESSES,
+                    pages_per_chunk: int = PDF_PAGES_PER_CHUNK,
+                    page_numbers: Optional[list[int]] = None,
+                    low_memory: bool = PDF_LOW_MEMORY,
+                    memory_limit_mb: Optional[float] = PDF_MEMORY_LIMIT_MB,
+                    executor: Optional[Executor] = None) -> Iterator[str]:
+    """
+    Yield the text of each page (or of page_numbers only), in order.
+    Page ranges are extracted in parallel on a process pool (executor, when
+    given, instead of a pool of this call's own); each range is yielded as
+    soon as it (and every range before it) is done.
+    With low_memory, pages are extracted one at a time in-process instead
+    (see _iter_pages_low_memory).
+    """
+    if page_numbers is None:
+        with _open_pdf(pdf_path) as pdf:
+            page_numbers = list(range(len(pdf.pages)))
+
+    if low_memory:
+        yield from _iter_pages_low_memory(pdf_path, sorted(page_numbers), memory_limit_mb)
+        return
+    if memory_limit_mb:
+        logger.warning("memory_limit_mb only applies with low_memory; extracting without a memory limit.")
+
+    ranges = _page_ranges(sorted(page_numbers), pages_per_chunk)
+    for texts in _map_page_ranges(_extract_page_range, pdf_path, ranges, processes, executor):
+        yield from texts
+
+
+def _map_page_ranges(fn: Callable[[str, int, int], list],
+                     pdf_path: str,
+                     ranges: list[tuple[int, int]],
+                     processes: Optional[int],
+                     executor: Optional[Executor] = None) -> Iterator[list]:
+    """
+    fn(pdf_path, start, end) for each page range, in order: on a process pool
+    (each result yielded as soon as it and every one before it are done), or
+    in-process for a single range or process. A given executor (a
+    long-lived pool) is used as is and left running.
+    """
+    pool = executor
+    if pool is None:
+        processes = processes or os.cpu_count() or 1
+        if processes <= 1 or len(ranges) <= 1:
+            for start, end in ranges:
+                yield fn(pdf_path, start, end)
+            return
+        pool = ProcessPoolExecutor(max_workers=min(processes, len(ranges)))
+
+    futures = []
+    try:
+        futures = [pool.submit(fn, pdf_path, s, e) for s, e in ranges]
+        for future in futures:
+            yield future.result()
+    finally:
+        # also reached when the consumer stops early (e.g. --max_refs)
+        if executor is None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in futures:
+                future.cancel()
+
+
+def _iter_bibliography_page_texts(pdf_path: str,
+                                  processes: Optional[int] = PDF_EXTRACT_PROCESSES,
+                                  pages_per_chunk: int = PDF_PAGES_PER_CHUNK,
+                                  executor: Optional[Executor] = None) -> Iterator[str]:
+    """
+    Like iter_page_texts, but only for the bibliography pages: detection runs
+    in the extraction workers (see _scan_page_range), so it is parallel and
+    streamed like extraction itself. All pages if none is found.
+    """
+    with _open_pdf(pdf_path) as pdf:
+        n_pages = len(pdf.pages)
+    ranges = _page_ranges(list(range(n_pages)), pages_per_chunk)
+    chunks = _map_page_ranges(_scan_page_range, pdf_path, ranges, processes, executor)
+    scans = (scan for chunk in chunks for scan in chunk)
+    kept: list[int] = []
+    for (n, _, _, text), keep in _select_bibliography(scans):
+        if keep:
+            kept.append(n)
+            # a gap page between two reference pages was not extracted by its worker
+            yield text if text is not None else _extract_page_range(pdf_path, n, n + 1)[0]
+    if kept:
+        logger.info("Bibliography pages: %s", _describe_pages(kept))
+    else:
+        logger.info("No bibliography section detected; extracting all pages.")
+        yield from iter_page_texts(pdf_path, processes=processes, pages_per_chunk=pages_per_chunk, executor=executor)
+
+
+def extract_text_from_pdf(pdf_path: str, processes: Optional[int] = PDF_EXTRACT_PROCESSES) -> str:
     """Extract text from all pages of a PDF."""
-    with pdfplumber.open(pdf_path) as pdf:
-        pages_text = [page.extract_text() or "" for page in pdf.pages]
-    return "\n".join(pages_text)
+    return "\n".join(iter_page_texts(pdf_path, processes=processes))
+
+
+# Entry starts for the splitter: "[Hill '79]" / "[12]", "12." / "12)" / "(12)" (numbered in
+# sequence), and for unlabelled styles an author-first line ("Smith, J. A. (2019)",
+# "Ashish Vaswani, Noam Shazeer, ... 2017.") with its year, or a list that carries on.
+_BRACKET_START_RE = re.compile(r"^\s*\[[^\]\n]{1,40}\]")
+_NUMBER_START_RE = re.compile(r"^\s*(?:\((\d{1,3})\)|(\d{1,3})[.)])\s+\S")
+_AUTHOR_START_RE = re.compile(r"^\s*[A-Z][\w'’\-]+(?:\s+(?:[a-z]{1,3}\s+)?[A-Z][\w'’\-]+)?,\s+[A-Z]")
+_AUTHOR_YEAR_RE = re.compile(r"\((?:1[5-9]|20)\d{2}[a-z]?[,)]|\.\s+(?:1[5-9]|20)\d{2}[a-z]?\.|(?:,|&|\band)\s*$")
+
+
+def _entry_number(line: str) -> Optional[int]:
+    m = _NUMBER_START_RE.match(line)
+    return int(m.group(1) or m.group(2)) if m else None
+
+
+def iter_references(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Streaming version of split_into_references over lines of text.
+    An entry is only emitted once the next one starts (or the input ends),
+    so entries running across page breaks stay whole. Labelled entries
+    ([..] or numbered) start at their label; once a list is known to be
+    labelled, author-first lines no longer start an entry.
+    """
+    current: list[str] = []
+    is_entry = False  # current started at an entry start (not text before the list)
+    labelled = False
+    last_number = 0
+    emitted = False
+
+    def flush() -> Optional[str]:
+        ref = "\n".join(current).strip()
+        if is_entry and len(ref) > 30:
+            return ref
+        return None
+
+    def starts_entry(line: str) -> bool:
+        nonlocal labelled, last_number
+        if _BRACKET_START_RE.match(line):
+            labelled = True
+            return True
+        number = _entry_number(line)
+        if number is not None and (number == last_number + 1 or number == 1 or not labelled):
+            labelled, last_number = True, number
+            return True
+        if labelled or not _AUTHOR_START_RE.match(line) or not _AUTHOR_YEAR_RE.search(line):
+            return False
+        # an author list running onto a new line is not a new entry
+        return not is_entry or bool(_YEAR_RE.search("\n".join(current)))
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("———"):
+            continue
+        if stripped.startswith("Bibliography") or _HEADING_RE.match(stripped):
+            if not emitted:  # text before the list (body text, a numbered list in it) is not an entry
+                current, is_entry, labelled, last_number = [], False, False, 0
+            continue  # later on, a running page header
+        if starts_entry(line):
+            ref = flush()
+            if ref:
+                emitted = True
+                yield ref
+            current, is_entry = [], True
+        current.append(line)
+
+    if current:
+        ref = flush()
+        if ref:
+            yield ref
+
+
+def iter_references_from_pdf(pdf_path: str,
+                             processes: Optional[int] = PDF_EXTRACT_PROCESSES,
+                             detect_bibliography: bool = DETECT_BIBLIOGRAPHY,
+                             low_memory: bool = PDF_LOW_MEMORY,
+                             memory_limit_mb: Optional[float] = PDF_MEMORY_LIMIT_MB,
+                             executor: Optional[Executor] = None) -> Iterator[str]:
+    """
+    Yield references from a PDF while later pages are still being extracted.
+    executor is a long-lived process pool to extract on (see iter_page_texts).
+    With detect_bibliography, only the bibliography pages are extracted (all
+    pages if none are found); detection runs inside the extraction workers,
+    or first (find_bibliography_pages) with low_memory. low_memory /
+    memory_limit_mb are passed to iter_page_texts.
+    """
+    page_numbers = None
+    if detect_bibliography and low_memory:
+        with span("bibliography_detect"):
+            found = find_bibliography_pages(pdf_path)
+        if found:
+            logger.info("Bibliography pages: %s", _describe_pages(found))
+            page_numbers = found
+        else:
+            logger.info("No bibliography section detected; extracting all pages.")
+
+    extract_seconds = 0.0
+
+    def lines() -> Iterator[str]:
+        nonlocal extract_seconds
+        if detect_bibliography and not low_memory:
+            pages = _iter_bibliography_page_texts(pdf_path, processes=processes, executor=executor)
+        else:
+            pages = iter_page_texts(pdf_path, processes=processes, page_numbers=page_numbers,
+                                    low_memory=low_memory, memory_limit_mb=memory_limit_mb, executor=executor)
+        while True:
+            start = time.perf_counter()
+            page_text = next(pages, None)
+            extract_seconds += time.perf_counter() - start
+            if page_text is None:
+                return
+            yield from page_text.splitlines()
+
+    def references() -> Iterator[str]:
+        # Time spent producing references, split into waiting for page text
+        # ("pdf_extract") and the splitter itself ("split").
+        refs = iter_references(lines())
+        busy = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                ref = next(refs, None)
+                busy += time.perf_counter() - start
+                if ref is None:
+                    return
+                yield ref
+        finally:
+            record_span("pdf_extract", extract_seconds)
+            record_span("split", max(0.0, busy - extract_seconds))
+
+    return references()
+
+
+def _describe_pages(page_numbers: list[int]) -> str:
+    """1-based page ranges for logging, e.g. "12-18, 40"."""
+    parts = []
+    for start, end in _page_ranges(page_numbers, pages_per_chunk=len(page_numbers) or 1):
+        parts.append(str(start + 1) if end - start == 1 else f"{start + 1}-{end}")
+    return ", ".join(parts)
 
 
 def split_into_references(raw_text: str) -> list[str]:
     """
-    Split bibliography into individual references.
-    Tuned for style: [Hill '79] ...
-    """
-    lines = raw_text.splitlines()
-    cleaned_lines = [
-        line for line in lines
-        if not line.strip().startswith("Bibliography")
-        and not line.strip().startswith("———")
-    ]
-    cleaned_text = "\n".join(cleaned_lines)
-
-    # Split on lines starting with '['
-    parts = re.split(r'\n(?=\[)', cleaned_text)
-    refs = [p.strip() for p in parts if p.strip().startswith("[") and len(p.strip()) > 30]
-    return refs
+    Split bibliography into individual references: labelled ("[Hill '79]",
+    "[12]", "12.", "(12)") or author-first (APA, ACM, ...) entries.
+    """
+    return list(iter_references(raw_text.splitlines()))
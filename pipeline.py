@@ -1,59 +1,286 @@
-import pandas as pd
-from typing import Optional, Any
-from pdf_utils import extract_text_from_pdf, split_into_references
-from dspy_models import parse_reference_with_dspy, infer_work_type, pick_best_match
-from openalex_client import fetch_openalex_candidates, extract_authors_from_work
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Any
+from config import (
+    DEFAULT_WORKERS,
+    CACHE_DIR,
+    COMBINED_PARSE,
+    PARSER,
+    RULE_PARSER_MIN_CONFIDENCE,
+    LLM_PARSE_BATCH_SIZE,
+    MATCH_FAST_PATH_THRESHOLD,
+    OPENALEX_HEDGE_DELAY,
+    S2_MODE,
+    PDF_EXTRACT_PROCESSES,
+    DETECT_BIBLIOGRAPHY,
+    PDF_LOW_MEMORY,
+    PDF_MEMORY_LIMIT_MB,
+    OPENALEX_INDEX_PATH,
+    INSTITUTION_GAZETTEER_PATH,
+)
+from concurrency import configure_limits, get_limits
+from cache import (
+    configure_response_cache,
+    configure_prediction_cache,
+    get_response_cache,
+)
+from matching import local_best_match
+from checkpoint import Checkpoint
+from dedup import ReferenceDeduplicator
+import metrics
+from metrics import span
+from reference_parser import parse_reference_rules, record_parser_use, parser_stats, reset_parser_stats
+from pdf_utils import iter_references_from_pdf, peak_rss_bytes
+from openalex_index import configure_openalex_index, local_candidates
+from rate_limit import reset_limiters
+from affiliations import configure_gazetteer
+from openalex_client import (
+    fetch_openalex_candidates,
+    resolve_openalex_batch,
+    extract_authors_from_work,
+)
 from semantic_scholar_client import (
     fetch_semantic_scholar_candidates,
+    resolve_semantic_scholar_bulk,
     extract_authors_from_s2_paper,
 )
 
+logger = logging.getLogger(__name__)
+
+# Speculative Semantic Scholar lookups (s2_mode="speculative"); requests are
+# still capped by the "semantic_scholar" concurrency slot. Created on first use.
+_s2_pool: Optional[ThreadPoolExecutor] = None
+_s2_pool_size = 0
+_s2_pool_lock = threading.Lock()
+
+
+def _submit_s2(fn: Callable[..., Any], *args: Any) -> Future:
+    """
+    Submit to the speculative S2 pool, sized from the Semantic Scholar cap
+    (recreated when it changes). Submitting under the lock means a
+    concurrent resize cannot shut the pool down before the call is queued.
+    """
+    global _s2_pool, _s2_pool_size
+    size = max(4, get_limits()["semantic_scholar"] * 2)
+    with _s2_pool_lock:
+        if _s2_pool is None or _s2_pool_size != size:
+            if _s2_pool is not None:
+                _s2_pool.shutdown(wait=False)  # lookups already submitted still run
+            _s2_pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="s2-speculative")
+            _s2_pool_size = size
+        return _s2_pool.submit(fn, *args)
+
+
+def _parse_with_rules(ref_text: str, parser: str) -> Optional[dict[str, Any]]:
+    """The rule-based parse when the parser setting accepts it, else None (the LLM is needed)."""
+    if parser not in ("rules", "auto"):
+        return None
+    with span("parse", parser="rules"):
+        parsed = parse_reference_rules(ref_text)
+    if parser == "rules" or parsed["confidence"] >= RULE_PARSER_MIN_CONFIDENCE:
+        logger.debug("  -> Parsed with rules (confidence %.2f)", parsed["confidence"])
+        record_parser_use("rules")
+        parsed["work_type"] = parsed.get("work_type") or "unknown"
+        return parsed
+    logger.debug("  -> Rule-based parse not confident (%.2f), using the LLM", parsed["confidence"])
+    return None
+
+
+def parse_reference(ref_text: str,
+                    combined_parse: bool = COMBINED_PARSE,
+                    parser: str = PARSER) -> dict[str, Any]:
+    """
+    Parse a reference and infer its work type ("unknown" if not inferred).
+    With combined_parse, parsing and work-type inference share one LLM call.
 
-def process_single_reference(ref_text: str) -> dict[str, Any]:
-    """Process one reference through the full DSPy + OpenAlex pipeline."""
-    print("\nProcessing:", ref_text[:150].replace("\n", " "), "...")
+    parser="rules" uses only the rule-based parser (reference_parser.py);
+    "auto" uses it unless its confidence is below RULE_PARSER_MIN_CONFIDENCE,
+    and "llm" always asks the LLM.
+    """
+    parsed = _parse_with_rules(ref_text, parser)
+    if parsed is not None:
+        return parsed
 
-    # 1) Parse reference with DSPy
-    print("  -> Parsing...")
-    parsed = parse_reference_with_dspy(ref_text)
+    # DSPy (and the LM) are only loaded once a reference actually needs the LLM.
+    from dspy_models import parse_reference_with_dspy, parse_reference_and_type, infer_work_type
+
+    logger.debug("  -> Parsing...")
+    record_parser_use("llm")
+    if combined_parse:
+        with span("parse", parser="llm"):
+            parsed = parse_reference_and_type(ref_text)
+    else:
+        with span("parse", parser="llm"):
+            parsed = parse_reference_with_dspy(ref_text)
+        logger.debug("  -> Inferring work type...")
+        with span("work_type"):
+            parsed["work_type"] = infer_work_type(ref_text)
+    parsed["work_type"] = parsed.get("work_type") or "unknown"
+    return parsed
+
+
+def match_reference(ref_text: str,
+                    combined_parse: bool = COMBINED_PARSE,
+                    parser: str = PARSER,
+                    match_threshold: Optional[float] = MATCH_FAST_PATH_THRESHOLD,
+                    parsed: Optional[dict[str, Any]] = None,
+                    candidates: Optional[list[dict[str, Any]]] = None,
+                    hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY) -> dict[str, Any]:
+    """
+    Parse a reference, search OpenAlex and choose the best candidate.
+    Candidates scoring at least match_threshold locally are accepted without
+    the LLM matcher (None always asks the LLM). hedge_delay is passed to
+    fetch_openalex_candidates. The local OpenAlex index (see
+    openalex_index.py), if configured, is tried before the API.
+
+    parsed / candidates may be supplied by batch stages (see
+    process_pdf_to_excel); the parse / OpenAlex search steps are then skipped.
+
+    Returns {"parsed", "best_work", "match_rationale", "match_path",
+    "prompt_tokens"} for build_record; prompt_tokens is the LLM matcher's
+    estimated (full, sent) input size, or None when it was not asked.
+    """
+    # 1) Parse reference with DSPy (+ work type, for matching context / reporting)
+    if parsed is None:
+        parsed = parse_reference(ref_text, combined_parse, parser)
     paper_title = parsed.get("paper_title", "")
     year = parsed.get("year")
     authors = parsed.get("authors", []) or []
-    emails = parsed.get("emails", []) or []
-    parsed_first_affs = parsed.get("first_affiliations", []) or []
-    parsed_last_affs = parsed.get("last_affiliations", []) or []
-    parsed_first_emails = parsed.get("first_author_emails", []) or []
-    parsed_last_emails = parsed.get("last_author_emails", []) or []
-    print(f"  Title: {paper_title!r}, Year: {year}, Authors: {authors}")
-
-    # 2) Infer work type (for DSPy matching context / reporting)
-    print("  -> Inferring work type...")
-    work_type = infer_work_type(ref_text) or "unknown"
-    print(f"  Work type: {work_type}")
+    work_type = parsed.get("work_type") or "unknown"
+    logger.debug("  Title: %r, Year: %s, Authors: %s", paper_title, year, authors)
+    logger.debug("  Work type: %s", work_type)
 
-    # 3) Fetch candidates from OpenAlex
-    print("  -> Searching OpenAlex...")
-    first_author = authors[0] if authors else None
-    try:
-        candidates = fetch_openalex_candidates(
-            paper_title, year, first_author, work_type=work_type
-        )
-    except Exception as e:
-        print(f"  OpenAlex error: {e}")
-        candidates = []
+    # 3) Fetch candidates: local OpenAlex index first, then the API
+    if candidates is not None:
+        logger.debug("  -> %d candidates from batched OpenAlex lookup", len(candidates))
+    else:
+        candidates = local_candidates(parsed)
+        if candidates:
+            logger.debug("  -> %d candidates from the local OpenAlex index", len(candidates))
+        else:
+            logger.debug("  -> Searching OpenAlex...")
+            first_author = authors[0] if authors else None
+            try:
+                with span("openalex_search"):
+                    candidates = fetch_openalex_candidates(
+                        paper_title, year, first_author, work_type=work_type, hedge_delay=hedge_delay
+                    )
+            except Exception as e:
+                logger.warning("  OpenAlex error: %s", e)
+                candidates = []
 
-    print(f"  -> {len(candidates)} raw candidates from OpenAlex")
+            logger.debug("  -> %d raw candidates from OpenAlex", len(candidates))
 
-    # 4) Let DSPy filter + choose the best match (if any)
+    # 4) Local scorer first; let DSPy filter + choose only when it is unsure
     best_work = None
     match_rationale = ""
+    match_path = ""
+    prompt_tokens = None
     if candidates:
-        print("  -> Choosing best match with DSPy...")
-        best_work, match_rationale = pick_best_match(
-            ref_text, paper_title, year, authors, candidates, work_type
-        )
+        local_score = 0.0
+        if match_threshold is not None:
+            best_work, local_score = local_best_match(
+                paper_title, year, authors, candidates, work_type, threshold=match_threshold
+            )
+        if best_work:
+            match_path = f"local scorer, score {local_score:.2f}"
+            logger.debug("  -> Local scorer accepted match (score %.2f)", local_score)
+        else:
+            logger.debug("  -> Choosing best match with DSPy...")
+            from dspy_models import pick_best_match
+            with span("llm_match"):
+                best_work, match_rationale, prompt_tokens = pick_best_match(
+                    ref_text, paper_title, year, authors, candidates, work_type
+                )
+            match_path = "LLM"
     else:
-        print("  -> No candidates to choose from.")
+        logger.debug("  -> No candidates to choose from.")
+
+    return {
+        "parsed": parsed,
+        "best_work": best_work,
+        "match_rationale": match_rationale,
+        "match_path": match_path,
+        "prompt_tokens": prompt_tokens,
+    }
+
+
+def process_single_reference(ref_text: str,
+                             combined_parse: bool = COMBINED_PARSE,
+                             parser: str = PARSER,
+                             match_threshold: Optional[float] = MATCH_FAST_PATH_THRESHOLD,
+                             parsed: Optional[dict[str, Any]] = None,
+                             candidates: Optional[list[dict[str, Any]]] = None,
+                             hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY,
+                             s2_mode: str = S2_MODE) -> dict[str, Any]:
+    """
+    Process one reference through the full DSPy + OpenAlex pipeline
+    (match_reference, then build_record).
+
+    With s2_mode="speculative" the Semantic Scholar search starts right after
+    parsing, alongside OpenAlex, and its result is only used if OpenAlex
+    does not match. Any other mode searches Semantic Scholar afterwards.
+    """
+    logger.debug("Processing: %s ...", ref_text[:150].replace("\n", " "))
+
+    s2_future: Optional[Future] = None
+    if s2_mode == "speculative":
+        if parsed is None:
+            parsed = parse_reference(ref_text, combined_parse, parser)
+        s2_future = _submit_s2(
+            fetch_semantic_scholar_candidates, parsed.get("paper_title", ""), parsed.get("year")
+        )
+
+    try:
+        match = match_reference(
+            ref_text,
+            combined_parse=combined_parse,
+            parser=parser,
+            match_threshold=match_threshold,
+            parsed=parsed,
+            candidates=candidates,
+            hedge_delay=hedge_delay,
+        )
+    except Exception:
+        if s2_future is not None:
+            s2_future.cancel()
+        raise
+
+    if s2_future is not None:
+        if match["best_work"]:
+            s2_future.cancel()
+            return build_record(ref_text, match)
+        return build_record(ref_text, match, s2_source=s2_future.result)
+    return build_record(ref_text, match)
+
+
+def build_record(ref_text: str,
+                 match: dict[str, Any],
+                 s2_source: Optional[Callable[[], list[dict[str, Any]]]] = None) -> dict[str, Any]:
+    """
+    Turn a match_reference result into an output row.
+    Without an OpenAlex match, Semantic Scholar fills the gaps: s2_source
+    supplies its candidates (default: search by parsed title/year now).
+    """
+    parsed = match["parsed"]
+    best_work = match["best_work"]
+    match_rationale = match["match_rationale"]
+    match_path = match["match_path"]
+
+    paper_title = parsed.get("paper_title", "")
+    year = parsed.get("year")
+    authors = parsed.get("authors", []) or []
+    emails = parsed.get("emails", []) or []
+    parsed_first_affs = parsed.get("first_affiliations", []) or []
+    parsed_last_affs = parsed.get("last_affiliations", []) or []
+    parsed_first_emails = parsed.get("first_author_emails", []) or []
+    parsed_last_emails = parsed.get("last_author_emails", []) or []
 
     # 5) Extract author info (OpenAlex or fallback)
     first_author_info = {"name": "", "affiliations": [], "emails": emails}
@@ -62,7 +289,7 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
 
     if best_work:
         matched_title = best_work.get("title", "") or ""
-        print(f"  Matched OpenAlex work: {matched_title!r}")
+        logger.debug("  Matched OpenAlex work: %r", matched_title)
         fa, la = extract_authors_from_work(best_work)
         first_author_info = {
             "name": fa.get("name", ""),
@@ -74,7 +301,7 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
             "affiliations": la.get("affiliations", []),
             "emails": parsed_last_emails,
         }
-        notes_parts.append(f"Matched to {best_work.get('id', '')}")
+        notes_parts.append(f"Matched to {best_work.get('id', '')} ({match_path})")
     else:
         # Use DSPy-derived affiliations/emails as fallbacks when OpenAlex doesn't match
         first_author_info["affiliations"] = parsed_first_affs
@@ -84,17 +311,23 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
         if parsed_last_emails:
             last_author_info["emails"] = parsed_last_emails
         notes_parts.append("DSPy could not confidently match this reference to any OpenAlex work.")
+    if match.get("prompt_tokens"):
+        notes_parts.append("Match prompt ~{} -> ~{} tokens".format(*match["prompt_tokens"]))
 
     # Secondary lookup: Semantic Scholar if no OpenAlex match
     if not best_work:
-        print("  -> Semantic Scholar fallback search...")
+        logger.debug("  -> Semantic Scholar fallback search...")
         s2_candidates = []
         try:
-            s2_candidates = fetch_semantic_scholar_candidates(
-                paper_title, year
-            )
+            with span("s2_fallback"):
+                if s2_source is not None:
+                    s2_candidates = s2_source() or []
+                else:
+                    s2_candidates = fetch_semantic_scholar_candidates(
+                        paper_title, year
+                    )
         except Exception as e:
-            print(f"  Semantic Scholar error: {e}")
+            logger.warning("  Semantic Scholar error: %s", e)
             notes_parts.append(f"Semantic Scholar error: {e}")
 
         if s2_candidates:
@@ -109,7 +342,7 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
             if la_s2.get("affiliations"):
                 last_author_info["affiliations"] = last_author_info["affiliations"] or la_s2["affiliations"]
             notes_parts.append("Filled from Semantic Scholar fallback.")
-            print("  Semantic Scholar fallback filled author info.")
+            logger.debug("  Semantic Scholar fallback filled author info.")
         else:
             notes_parts.append("Semantic Scholar did not return matches (or was rate limited).")
 
@@ -147,6 +380,9 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
     if not last_author_info["name"] and len(authors) > 1:
         last_author_info["name"] = authors[-1]
 
+    if "confidence" in parsed:
+        notes_parts.append(f"Parsed with rules (confidence {parsed['confidence']:.2f})")
+
     notes = " | ".join([p for p in notes_parts if p])
 
     return {
@@ -163,40 +399,632 @@ def process_single_reference(ref_text: str) -> dict[str, Any]:
     }
 
 
-def process_pdf_to_excel(pdf_path: str, output_path: str, max_refs: Optional[int] = None) -> None:
-    """Full pipeline: PDF -> references -> DSPy + OpenAlex -> Excel."""
-    print(f"Reading PDF: {pdf_path}")
-    raw_text = extract_text_from_pdf(pdf_path)
+def error_record(ref: str, error: Exception) -> dict[str, Any]:
+    """Row written for a reference whose processing raised (batch runs and serve.py)."""
+    return {
+        "paper_title": ref[:120].replace("\n", " ") + ("..." if len(ref) > 120 else ""),
+        "year": None,
+        "first_author_name": "",
+        "first_author_affiliations": "",
+        "first_author_emails": "",
+        "last_author_name": "",
+        "last_author_affiliations": "",
+        "last_author_emails": "",
+        "reference_raw": ref,
+        "notes": f"Error during processing: {error}",
+    }
+
+
+def _process_reference_safely(idx: int,
+                              total: Optional[int],
+                              ref: str,
+                              parsed: Optional[dict[str, Any]] = None,
+                              candidates: Optional[list[dict[str, Any]]] = None,
+                              checkpoint: Optional[Checkpoint] = None,
+                              **options: Any) -> dict[str, Any]:
+    """
+    Run one reference, turning any exception into an error row.
+    Successful rows are added to the checkpoint right away; error rows are
+    not, so a resumed run retries them.
+    """
+    logger.info("=== Reference %s/%s ===", idx, total or "?")
+    try:
+        with span("reference"):
+            record = process_single_reference(ref, parsed=parsed, candidates=candidates, **options)
+    except Exception as e:
+        logger.error("Error (reference %s): %s", idx, e)
+        metrics.incr("reference_errors")
+        return error_record(ref, e)
+    if checkpoint is not None:
+        checkpoint.add(ref, record)
+    return record
+
+
+def _match_reference_safely(idx: int,
+                            total: int,
+                            ref: str,
+                            parsed: Optional[dict[str, Any]] = None,
+                            candidates: Optional[list[dict[str, Any]]] = None,
+                            **options: Any) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
+    """match_reference for the bulk S2 flow: returns (match, None) or (None, error row)."""
+    logger.info("=== Reference %s/%s ===", idx, total)
+    logger.debug("Processing: %s ...", ref[:150].replace("\n", " "))
+    try:
+        return match_reference(ref, parsed=parsed, candidates=candidates, **options), None
+    except Exception as e:
+        logger.error("Error (reference %s): %s", idx, e)
+        metrics.incr("reference_errors")
+        return None, error_record(ref, e)
+
+
+def _build_record_safely(ref: str,
+                         match: dict[str, Any],
+                         s2_paper: Optional[dict[str, Any]],
+                         checkpoint: Optional[Checkpoint] = None) -> dict[str, Any]:
+    """build_record with a bulk-resolved S2 paper (None: search for it now)."""
+    try:
+        if s2_paper is not None:
+            record = build_record(ref, match, s2_source=lambda: [s2_paper])
+        else:
+            record = build_record(ref, match)
+    except Exception as e:
+        logger.error("Error: %s", e)
+        metrics.incr("reference_errors")
+        return error_record(ref, e)
+    if checkpoint is not None:
+        checkpoint.add(ref, record)
+    return record
+
+
+def _parse_reference_safely(idx: int,
+                            total: int,
+                            ref: str,
+                            checkpoint: Optional[Checkpoint] = None,
+                            **options: Any) -> Optional[dict[str, Any]]:
+    """
+    Parse ahead of the batch stages, saving the parse to the checkpoint.
+    Failures return None so the reference is retried (and reported) by
+    _process_reference_safely.
+    """
+    logger.info("=== Parsing reference %s/%s ===", idx, total)
+    try:
+        parsed = parse_reference(ref, **options)
+    except Exception as e:
+        logger.warning("Parse error (reference %s): %s", idx, e)
+        return None
+    if checkpoint is not None:
+        checkpoint.add_stage("parsed", ref, parsed)
+    return parsed
+
+
+def _parse_references_batched(references: list[str],
+                              workers: int,
+                              batch_size: int,
+                              parser: str,
+                              checkpoint: Optional[Checkpoint] = None) -> list[Optional[dict[str, Any]]]:
+    """
+    Parse ahead like _parse_reference_safely, but references that need the
+    LLM go batch_size at a time into one call (see
+    dspy_models.parse_reference_batch), which always infers the work type too.
+    LLM parses are saved to the checkpoint as each batch finishes.
+    """
+    parsed: list[Optional[dict[str, Any]]] = [_parse_with_rules(ref, parser) for ref in references]
+    todo = [i for i, p in enumerate(parsed) if p is None]
+    if not todo:
+        return parsed
+
+    from dspy_models import plan_parse_batches, parse_reference_batch
+
+    batches = [[todo[j] for j in batch] for batch in plan_parse_batches([references[i] for i in todo], batch_size)]
+    logger.info("Parsing %d references with the LLM in %d batches...", len(todo), len(batches))
+
+    def parse_batch(batch: list[int]) -> list[Optional[dict[str, Any]]]:
+        try:
+            with span("parse", parser="llm_batch"):
+                results = parse_reference_batch([references[i] for i in batch])
+        except Exception as e:
+            logger.warning("Batch parse error (%d references): %s", len(batch), e)
+            return [None] * len(batch)
+        if checkpoint is not None:
+            for i, p in zip(batch, results):
+                if p is not None:
+                    checkpoint.add_stage("parsed", references[i], p)
+        return results
+
+    for batch, results in zip(batches, _map_in_order(parse_batch, workers, batches)):
+        for i, p in zip(batch, results):
+            if p is not None:
+                record_parser_use("llm")
+                p["work_type"] = p.get("work_type") or "unknown"
+                parsed[i] = p
+    return parsed
+
+
+def _map_in_order(fn: Any, workers: int, *iterables: Any) -> list[Any]:
+    """map() on a thread pool when workers > 1; results keep input order."""
+    if workers <= 1:
+        return list(map(fn, *iterables))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, *iterables))
+
+
+def _process_streaming(ref_iter: Iterable[str],
+                       checkpoint: Checkpoint,
+                       workers: int,
+                       s2_mode: str,
+                       options: dict[str, Any]) -> tuple[list[str], dict[int, dict[str, Any]]]:
+    """
+    Submit references to the worker pool as they come out of the PDF, so
+    processing overlaps extraction. Returns (all references, {index: new row}).
+    """
+    references: list[str] = []
+    futures: dict[int, Future] = {}
+    process_ref = partial(_process_reference_safely, s2_mode=s2_mode, checkpoint=checkpoint, **options)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, ref in enumerate(ref_iter):
+            references.append(ref)
+            if checkpoint.get(ref) is None:
+                futures[i] = pool.submit(process_ref, i + 1, None, ref)
+    return references, {i: f.result() for i, f in futures.items()}
+
+
+def _process_batched(references: list[str],
+                     pending: list[int],
+                     checkpoint: Checkpoint,
+                     workers: int,
+                     batch_openalex: bool,
+                     s2_mode: str,
+                     options: dict[str, Any],
+                     parse_batch_size: int = 1) -> dict[int, dict[str, Any]]:
+    """
+    Whole-list flow for the batch stages (batched LLM parse, batched OpenAlex
+    lookup, bulk S2). Returns {index: new row} for the pending references.
+
+    Rows are only written at the end of this flow, so each reference's
+    parse, OpenAlex candidates and (bulk S2) match go to the checkpoint as
+    soon as they are done; a resumed run picks them up instead of redoing
+    the stage.
+    """
+    total = len(references)
+    pending_refs = [references[i] for i in pending]
+    indices = [i + 1 for i in pending]
+    n = len(pending_refs)
+
+    parsed_refs: list[Optional[dict[str, Any]]] = [checkpoint.get_stage("parsed", ref) for ref in pending_refs]
+    candidate_lists: list[Optional[list[dict[str, Any]]]] = [
+        checkpoint.get_stage("candidates", ref) for ref in pending_refs
+    ]
+    matches: list[Optional[dict[str, Any]]] = [
+        checkpoint.get_stage("match", ref) if s2_mode == "bulk" else None for ref in pending_refs
+    ]
+    todo = [i for i in range(n) if matches[i] is None]  # references still to be matched
+    if len(todo) < n or any(p is not None for p in parsed_refs):
+        logger.info("Resuming the batch stages: %d parsed, %d matched references in the checkpoint.",
+                    sum(p is not None for p in parsed_refs), n - len(todo))
+
+    to_parse = [i for i in todo if parsed_refs[i] is None]
+    parsed_now: list[Optional[dict[str, Any]]] = []
+    if parse_batch_size > 1 and to_parse:
+        parsed_now = _parse_references_batched(
+            [pending_refs[i] for i in to_parse], workers, parse_batch_size, options["parser"], checkpoint
+        )
+    elif batch_openalex and to_parse:
+        parse_ref = partial(
+            _parse_reference_safely,
+            checkpoint=checkpoint, combined_parse=options["combined_parse"], parser=options["parser"],
+        )
+        parsed_now = _map_in_order(
+            parse_ref, workers, [indices[i] for i in to_parse], [total] * len(to_parse),
+            [pending_refs[i] for i in to_parse],
+        )
+    for i, p in zip(to_parse, parsed_now):
+        parsed_refs[i] = p
+    if batch_openalex and todo:
+        for i in todo:
+            if parsed_refs[i] is not None and candidate_lists[i] is None:
+                candidate_lists[i] = local_candidates(parsed_refs[i]) or None
+        logger.info("Batched OpenAlex lookup...")
+        ok = [i for i in todo if parsed_refs[i] is not None and candidate_lists[i] is None]
+        try:
+            resolved = resolve_openalex_batch([parsed_refs[i] for i in ok])
+        except Exception as e:
+            logger.error("OpenAlex batch lookup error: %s", e)
+            resolved = [None] * len(ok)
+        for i, cands in zip(ok, resolved):
+            candidate_lists[i] = cands
+            if cands is not None:
+                checkpoint.add_stage("candidates", pending_refs[i], cands)
+
+    if s2_mode == "bulk":
+        def match_one(i: int) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
+            if matches[i] is not None:
+                return matches[i], None
+            match, error_row = _match_reference_safely(
+                indices[i], total, pending_refs[i], parsed_refs[i], candidate_lists[i], **options
+            )
+            if match is not None:
+                checkpoint.add_stage("match", pending_refs[i], match)
+            return match, error_row
+
+        results = _map_in_order(match_one, workers, range(n))
+        unmatched = [i for i, (m, _) in enumerate(results) if m is not None and not m["best_work"]]
+        s2_papers: list[Optional[dict[str, Any]]] = [None] * n
+        if unmatched:
+            logger.info("Semantic Scholar bulk lookup for %d unmatched references...", len(unmatched))
+            try:
+                resolved = resolve_semantic_scholar_bulk([results[i][0]["parsed"] for i in unmatched])
+            except Exception as e:
+                logger.error("Semantic Scholar bulk lookup error: %s", e)
+                resolved = [None] * len(unmatched)
+            for i, paper in zip(unmatched, resolved):
+                s2_papers[i] = paper
+        # Matched references never touch S2; unresolved ones fall back to a per-reference search.
+        fresh = _map_in_order(
+            lambda ref, result, paper: result[1] or _build_record_safely(ref, result[0], paper, checkpoint),
+            workers, pending_refs, results, s2_papers,
+        )
+    else:
+        fresh = _map_in_order(
+            partial(_process_reference_safely, s2_mode=s2_mode, checkpoint=checkpoint, **options),
+            workers, indices, [total] * n, pending_refs, parsed_refs, candidate_lists,
+        )
+    return dict(zip(pending, fresh))
+
+
+def _start_run(cache_dir: Optional[str],
+               use_cache: bool,
+               llm_concurrency: Optional[int],
+               openalex_concurrency: Optional[int],
+               s2_concurrency: Optional[int],
+               openalex_index: Optional[str],
+               institutions: Optional[str] = INSTITUTION_GAZETTEER_PATH) -> None:
+    """
+    Reset metrics, parser counts and rate limiters and configure the
+    caches, per-service limits, local index and institution gazetteer for
+    a run.
+    """
+    metrics.reset()
+    reset_parser_stats()
+    reset_limiters()
+    if "dspy_models" in sys.modules:  # not imported yet means nothing to reset
+        sys.modules["dspy_models"].reset_parse_batch_cap()
+    configure_openalex_index(openalex_index)
+    configure_gazetteer(institutions)
+    configure_response_cache(cache_dir, enabled=use_cache)
+    configure_prediction_cache(cache_dir, enabled=use_cache)
+    configure_limits(
+        llm=llm_concurrency,
+        openalex=openalex_concurrency,
+        semantic_scholar=s2_concurrency,
+    )
+
+
+def _write_excel(records: list[dict[str, Any]], path: str) -> None:
+    with span("excel_write"):
+        import pandas as pd
+        df = pd.DataFrame(records).fillna("")
+        df.to_excel(path, index=False)
+
+
+def _finish_run(started: float,
+                summary_path: str,
+                prometheus_path: Optional[str],
+                extra: dict[str, Any]) -> None:
+    """Log cache/parser/memory stats and write the run metrics (extra: run description)."""
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        stats = response_cache.stats()
+        logger.info("API response cache: %d hits, %d misses", stats["hits"], stats["misses"])
+    if "dspy_models" in sys.modules:
+        for name, stats in sorted(sys.modules["dspy_models"].prediction_cache_stats().items()):
+            logger.info("LLM prediction cache [%s]: %d hits, %d misses", name, stats["hits"], stats["misses"])
+    counts = parser_stats()
+    if counts["rules"]:
+        logger.info("Rule-based parser: %d references, LLM parser: %d", counts["rules"], counts["llm"])
+    peak = peak_rss_bytes()
+    if peak is not None:
+        logger.info("Peak RSS: %.0f MB", peak / 2**20)
+
+    elapsed = time.perf_counter() - started
+    processed = extra.get("processed", 0)
+    metrics.write_summary(summary_path, extra=dict(
+        extra,
+        seconds=round(elapsed, 3),
+        refs_per_sec=round(processed / elapsed, 3) if elapsed else None,
+        peak_rss_mb=round(peak / 2**20, 1) if peak else None,
+        parser_counts=counts,
+    ))
+    for line in metrics.format_summary():
+        logger.debug("  %s", line)
+    logger.info("Run metrics written to %s", summary_path)
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+        logger.info("Prometheus metrics written to %s", prometheus_path)
+
+
+def process_pdf_to_excel(pdf_path: str,
+                         output_path: str,
+                         max_refs: Optional[int] = None,
+                         workers: int = DEFAULT_WORKERS,
+                         llm_concurrency: Optional[int] = None,
+                         openalex_concurrency: Optional[int] = None,
+                         s2_concurrency: Optional[int] = None,
+                         cache_dir: Optional[str] = CACHE_DIR,
+                         use_cache: bool = True,
+                         combined_parse: bool = COMBINED_PARSE,
+                         parser: str = PARSER,
+                         match_threshold: Optional[float] = MATCH_FAST_PATH_THRESHOLD,
+                         batch_openalex: bool = False,
+                         parse_batch_size: int = LLM_PARSE_BATCH_SIZE,
+                         hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY,
+                         s2_mode: str = S2_MODE,
+                         resume: bool = False,
+                         checkpoint_path: Optional[str] = None,
+                         extract_processes: Optional[int] = PDF_EXTRACT_PROCESSES,
+                         detect_bibliography: bool = DETECT_BIBLIOGRAPHY,
+                         low_memory: bool = PDF_LOW_MEMORY,
+                         memory_limit_mb: Optional[float] = PDF_MEMORY_LIMIT_MB,
+                         metrics_path: Optional[str] = None,
+                         prometheus_path: Optional[str] = None,
+                         openalex_index: Optional[str] = OPENALEX_INDEX_PATH,
+                         institutions: Optional[str] = INSTITUTION_GAZETTEER_PATH) -> None:
+    """
+    Full pipeline: PDF -> references -> DSPy + OpenAlex -> Excel.
+
+    Pages are extracted on extract_processes processes (only the detected
+    bibliography pages with detect_bibliography), or one page at a time with
+    low_memory (see pdf_utils.iter_page_texts). Unless a batch
+    stage needs the whole list first, references are handed to the workers
+    as soon as their pages are extracted.
+
+    With workers > 1 references are processed on a thread pool; the LLM,
+    OpenAlex and Semantic Scholar calls are each capped separately
+    (see concurrency.py). Rows are always written in input order.
 
-    print("Splitting into references...")
-    references = split_into_references(raw_text)
-    print(f"Found {len(references)} references.")
+    parser selects the reference parser (see parse_reference).
 
+    OpenAlex / Semantic Scholar responses and LLM predictions are cached
+    under cache_dir unless use_cache is False.
+
+    With batch_openalex, all references are parsed first and their DOIs
+    resolved with multi-value OpenAlex requests; only the leftovers go
+    through the per-reference staged search.
+
+    With parse_batch_size > 1, all references are parsed first and those the
+    LLM has to parse are sent up to parse_batch_size per call (see
+    dspy_models.plan_parse_batches).
+
+    s2_mode controls the Semantic Scholar fallback (see config.S2_MODE); with
+    "bulk", unmatched references are resolved together after matching.
+
+    Every finished row is appended to a JSONL checkpoint (default:
+    <output_path>.checkpoint.jsonl). With resume, references already in the
+    checkpoint are skipped; the Excel file is always built from it.
+
+    openalex_index is a local snapshot index (see openalex_index.py) tried
+    before the API; None uses the API only.
+
+    institutions is an institution gazetteer (see affiliations.py) used to
+    find affiliations in reference text; None uses keyword heuristics only.
+
+    Span timings and counters (see metrics.py) are written as JSON to
+    metrics_path (default: <output_path>.metrics.json) and, if given, in
+    Prometheus text format to prometheus_path.
+    """
+    started = time.perf_counter()
+    _start_run(cache_dir, use_cache, llm_concurrency, openalex_concurrency, s2_concurrency, openalex_index,
+               institutions)
+
+    workers = max(1, workers or 1)
+    if workers > 1:
+        logger.info("Processing with %d workers...", workers)
+    options = {
+        "combined_parse": combined_parse,
+        "parser": parser,
+        "match_threshold": match_threshold,
+        "hedge_delay": hedge_delay,
+    }
+
+    logger.info("Reading PDF: %s", pdf_path)
+    ref_iter: Iterable[str] = iter_references_from_pdf(
+        pdf_path,
+        processes=extract_processes,
+        detect_bibliography=detect_bibliography,
+        low_memory=low_memory,
+        memory_limit_mb=memory_limit_mb,
+    )
     if max_refs:
-        references = references[:max_refs]
-        print(f"Limiting to {max_refs} references.")
+        ref_iter = islice(ref_iter, max_refs)
+        logger.info("Limiting to %d references.", max_refs)
+
+    checkpoint = Checkpoint(checkpoint_path or f"{output_path}.checkpoint.jsonl", resume=resume)
+    try:
+        if batch_openalex or s2_mode == "bulk" or parse_batch_size > 1:
+            logger.info("Splitting into references...")
+            references = list(ref_iter)
+            logger.info("Found %d references.", len(references))
+            pending = [i for i, ref in enumerate(references) if checkpoint.get(ref) is None]
+            fresh_by_index = _process_batched(
+                references, pending, checkpoint, workers, batch_openalex, s2_mode, options, parse_batch_size
+            )
+        else:
+            references, fresh_by_index = _process_streaming(ref_iter, checkpoint, workers, s2_mode, options)
+            logger.info("Found %d references.", len(references))
+    finally:
+        checkpoint.close()
+    if resume:
+        logger.info("Resumed: %d of %d references came from the checkpoint (%s).",
+                    len(references) - len(fresh_by_index), len(references), checkpoint.path)
+
+    # Rows come from the checkpoint; references that failed this run keep their error rows.
+    records = [checkpoint.get(ref) or fresh_by_index[i] for i, ref in enumerate(references)]
+
+    logger.info("Writing Excel...")
+    _write_excel(records, output_path)
+    logger.info("Done. Saved to %s", output_path)
+
+    _finish_run(started, metrics_path or f"{output_path}.metrics.json", prometheus_path, {
+        "pdf_path": pdf_path,
+        "output_path": output_path,
+        "references": len(references),
+        "processed": len(fresh_by_index),
+        "options": dict(options, workers=workers, batch_openalex=batch_openalex,
+                        parse_batch_size=parse_batch_size, s2_mode=s2_mode),
+    })
+
+
+def _document_names(documents: list[str]) -> list[str]:
+    """Per-document output names: the file stem, suffixed when two stems collide."""
+    names: list[str] = []
+    seen: dict[str, int] = {}
+    for path in documents:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}_{seen[stem]}")
+    return names
 
-    records: list[dict[str, Any]] = []
-    for idx, ref in enumerate(references, 1):
-        print(f"\n=== Reference {idx}/{len(references)} ===")
+
+def _unique_references(documents: list[str],
+                       names: list[str],
+                       dedup: ReferenceDeduplicator,
+                       document_refs: list[list[tuple[int, str]]],
+                       max_refs: Optional[int],
+                       extract_options: dict[str, Any]) -> Iterator[str]:
+    """
+    Extract each document in turn and yield only references not seen in an
+    earlier one (their position in this stream is their dedup index).
+    document_refs gets one [(unique index, own text), ...] list per document.
+    """
+    for path, name in zip(documents, names):
+        logger.info("Reading PDF: %s", path)
+        refs: list[tuple[int, str]] = []
+        document_refs.append(refs)
+        metrics.incr("documents")
+        ref_iter: Iterable[str] = iter_references_from_pdf(path, **extract_options)
+        if max_refs:
+            ref_iter = islice(ref_iter, max_refs)
         try:
-            records.append(process_single_reference(ref))
+            for position, ref in enumerate(ref_iter):
+                idx, is_new = dedup.add(ref, name, position)
+                refs.append((idx, ref))
+                if is_new:
+                    yield ref
+                else:
+                    metrics.incr("duplicate_references")
         except Exception as e:
-            print(f"Error: {e}")
-            records.append({
-                "paper_title": ref[:120].replace("\n", " ") + ("..." if len(ref) > 120 else ""),
-                "year": None,
-                "first_author_name": "",
-                "first_author_affiliations": "",
-                "first_author_emails": "",
-                "last_author_name": "",
-                "last_author_affiliations": "",
-                "last_author_emails": "",
-                "reference_raw": ref,
-                "notes": f"Error during processing: {e}",
-            })
-
-    print("\nWriting Excel...")
-    df = pd.DataFrame(records).fillna("")
-    df.to_excel(output_path, index=False)
-    print(f"Done. Saved to {output_path}")
+            # one unreadable PDF should not stop the batch
+            logger.error("Could not read %s: %s", path, e)
+            metrics.incr("document_errors")
+
+
+def process_pdfs_to_excel(documents: list[str],
+                          output_path: str,
+                          per_document_dir: Optional[str] = None,
+                          max_refs: Optional[int] = None,
+                          workers: int = DEFAULT_WORKERS,
+                          llm_concurrency: Optional[int] = None,
+                          openalex_concurrency: Optional[int] = None,
+                          s2_concurrency: Optional[int] = None,
+                          cache_dir: Optional[str] = CACHE_DIR,
+                          use_cache: bool = True,
+                          combined_parse: bool = COMBINED_PARSE,
+                          parser: str = PARSER,
+                          match_threshold: Optional[float] = MATCH_FAST_PATH_THRESHOLD,
+                          batch_openalex: bool = False,
+                          parse_batch_size: int = LLM_PARSE_BATCH_SIZE,
+                          hedge_delay: Optional[float] = OPENALEX_HEDGE_DELAY,
+                          s2_mode: str = S2_MODE,
+                          resume: bool = False,
+                          checkpoint_path: Optional[str] = None,
+                          extract_processes: Optional[int] = PDF_EXTRACT_PROCESSES,
+                          detect_bibliography: bool = DETECT_BIBLIOGRAPHY,
+                          low_memory: bool = PDF_LOW_MEMORY,
+                          memory_limit_mb: Optional[float] = PDF_MEMORY_LIMIT_MB,
+                          metrics_path: Optional[str] = None,
+                          prometheus_path: Optional[str] = None,
+                          openalex_index: Optional[str] = OPENALEX_INDEX_PATH,
+                          institutions: Optional[str] = INSTITUTION_GAZETTEER_PATH) -> None:
+    """
+    Batch mode: many PDFs -> one combined Excel file plus one per document.
+
+    References are canonicalized across documents (see dedup.py: normalized
+    text, DOI, or rule-parsed title + year); each unique reference is
+    parsed, searched and matched once and its row is fanned out to every
+    document citing it. The combined file has one row per unique reference
+    with the citing documents and occurrence count; per-document files
+    (default directory: <output_path stem>_documents) keep each document's
+    own order and reference text. max_refs applies per document.
+
+    The other options behave as in process_pdf_to_excel; the checkpoint and
+    metrics cover the whole batch.
+    """
+    started = time.perf_counter()
+    _start_run(cache_dir, use_cache, llm_concurrency, openalex_concurrency, s2_concurrency, openalex_index,
+               institutions)
+
+    workers = max(1, workers or 1)
+    if workers > 1:
+        logger.info("Processing with %d workers...", workers)
+    options = {
+        "combined_parse": combined_parse,
+        "parser": parser,
+        "match_threshold": match_threshold,
+        "hedge_delay": hedge_delay,
+    }
+    extract_options = {
+        "processes": extract_processes,
+        "detect_bibliography": detect_bibliography,
+        "low_memory": low_memory,
+        "memory_limit_mb": memory_limit_mb,
+    }
+
+    names = _document_names(documents)
+    dedup = ReferenceDeduplicator()
+    document_refs: list[list[tuple[int, str]]] = []
+    unique_iter = _unique_references(documents, names, dedup, document_refs, max_refs, extract_options)
+
+    checkpoint = Checkpoint(checkpoint_path or f"{output_path}.checkpoint.jsonl", resume=resume)
+    try:
+        if batch_openalex or s2_mode == "bulk" or parse_batch_size > 1:
+            references = list(unique_iter)
+            pending = [i for i, ref in enumerate(references) if checkpoint.get(ref) is None]
+            fresh_by_index = _process_batched(
+                references, pending, checkpoint, workers, batch_openalex, s2_mode, options, parse_batch_size
+            )
+        else:
+            references, fresh_by_index = _process_streaming(unique_iter, checkpoint, workers, s2_mode, options)
+    finally:
+        checkpoint.close()
+
+    occurrences = sum(len(refs) for refs in document_refs)
+    logger.info("Found %d references in %d documents, %d unique.", occurrences, len(documents), len(references))
+    if resume:
+        logger.info("Resumed: %d of %d unique references came from the checkpoint (%s).",
+                    len(references) - len(fresh_by_index), len(references), checkpoint.path)
+
+    records = [checkpoint.get(ref) or fresh_by_index[i] for i, ref in enumerate(references)]
+
+    logger.info("Writing Excel...")
+    combined = []
+    for record, seen_in in zip(records, dedup.occurrences):
+        cited_by = list(dict.fromkeys(name for name, _ in seen_in))
+        combined.append(dict(record, documents="; ".join(cited_by), occurrences=len(seen_in)))
+    _write_excel(combined, output_path)
+
+    per_document_dir = per_document_dir or f"{os.path.splitext(output_path)[0]}_documents"
+    os.makedirs(per_document_dir, exist_ok=True)
+    for name, refs in zip(names, document_refs):
+        rows = [dict(records[idx], reference_raw=ref) for idx, ref in refs]
+        _write_excel(rows, os.path.join(per_document_dir, f"{name}.xlsx"))
+    logger.info("Done. Saved to %s (per-document files in %s)", output_path, per_document_dir)
+
+    _finish_run(started, metrics_path or f"{output_path}.metrics.json", prometheus_path, {
+        "documents": len(documents),
+        "output_path": output_path,
+        "per_document_dir": per_document_dir,
+        "references": occurrences,
+        "unique_references": len(references),
+        "processed": len(fresh_by_index),
+        "options": dict(options, workers=workers, batch_openalex=batch_openalex,
+                        parse_batch_size=parse_batch_size, s2_mode=s2_mode),
+    })
@@ -0,0 +1,202 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+from config import (
+    RATE_LIMITS,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MIN_RATE,
+    RATE_LIMIT_INCREASE,
+    RATE_LIMIT_DECREASE,
+    RATE_LIMIT_BACKOFF_BASE,
+    RATE_LIMIT_BACKOFF_MAX,
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_COOLDOWN,
+)
+from metrics import incr, record_span
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Wait before retry number `attempt` (1-based): the server's Retry-After
+    plus up to 10% jitter, else exponential backoff with equal jitter.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 0.1 * retry_after + RATE_LIMIT_BACKOFF_BASE)
+    ceiling = min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class Limiter:
+    """
+    Outbound call policy for one host (or the LLM provider), shared by all
+    threads and event loops:
+
+      - token bucket (GCRA) at `rate` calls/second with a small burst;
+        rate None means unlimited until the first throttling response;
+        the rate observed then becomes max_rate
+      - AIMD: each success adds about RATE_LIMIT_INCREASE calls/s per second
+        (capped at max_rate), a 429 multiplies the rate by RATE_LIMIT_DECREASE
+        (at most once per second) and pauses every caller for Retry-After
+      - circuit breaker: after CIRCUIT_BREAKER_FAILURES consecutive failures
+        calls fail fast with CircuitOpenError for CIRCUIT_BREAKER_COOLDOWN
+        seconds; then one probe call decides whether it closes again
+
+    Every acquire() must be followed by on_success / on_throttle /
+    on_failure, or by release_probe() with its return value when the call
+    ended without a verdict on the host, so a probe never stays pending.
+    """
+
+    def __init__(self, name: str, rate: Optional[float] = None) -> None:
+        self.name = name
+        self.rate = rate
+        self.max_rate = rate
+        self._lock = threading.Lock()
+        self._tat = 0.0  # theoretical arrival time of the next call
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._recent: Deque[float] = deque()  # call times in the last second (observed rate)
+        self._failures = 0
+        self._open_until = 0.0
+        self._probing = 0  # ticket of the half-open probe call in flight (0 = none)
+        self._probe_tickets = 0
+
+    # ---------- admission ----------
+
+    def _reserve(self) -> Tuple[float, int]:
+        """Check the breaker and book the next slot; returns (seconds to wait, probe ticket or 0)."""
+        with self._lock:
+            now = time.monotonic()
+            probe = 0
+            if self._open_until:
+                if now < self._open_until or self._probing:
+                    incr("circuit_rejections", target=self.name)
+                    raise CircuitOpenError(f"circuit open for {self.name}")
+                self._probe_tickets += 1
+                probe = self._probing = self._probe_tickets  # half-open: let this one call through
+            start = max(now, self._paused_until)
+            if self.rate:
+                interval = 1.0 / self.rate
+                start = max(start, self._tat - (RATE_LIMIT_BURST - 1) * interval)
+                self._tat = max(self._tat, start) + interval
+            self._recent.append(start)
+            while self._recent and self._recent[0] < start - 1.0:
+                self._recent.popleft()
+            return start - now, probe
+
+    def acquire(self) -> int:
+        """
+        Block until a call may start (raises CircuitOpenError when open).
+        Returns the probe ticket when this call is the half-open probe, else 0.
+        """
+        wait, probe = self._reserve()
+        if wait > 0:
+            record_span("rate_limit_wait", wait, target=self.name)
+            time.sleep(wait)
+        return probe
+
+    async def aacquire(self) -> int:
+        """Async counterpart of acquire()."""
+        wait, probe = self._reserve()
+        if wait > 0:
+            record_span("rate_limit_wait", wait, target=self.name)
+            await asyncio.sleep(wait)
+        return probe
+
+    def release_probe(self, probe: int) -> None:
+        """
+        End the probe with this ticket if no outcome was reported for it, so
+        the next call may probe. Safe to call after a report (use in finally).
+        """
+        if not probe:
+            return
+        with self._lock:
+            if self._probing == probe:
+                self._probing = 0
+
+    # ---------- feedback ----------
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._open_until = 0.0
+            self._probing = 0
+            if self.rate:
+                self.rate += RATE_LIMIT_INCREASE / self.rate
+                if self.max_rate:
+                    self.rate = min(self.rate, self.max_rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        """A 429 (or provider rate-limit error): slow down and pause for Retry-After."""
+        incr("rate_limited", target=self.name)
+        with self._lock:
+            now = time.monotonic()
+            self._probing = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if now - self._last_decrease >= 1.0:
+                current = self.rate or max(len(self._recent), 1)
+                if self.max_rate is None:
+                    self.max_rate = float(current)  # was unlimited: never climb past what got throttled
+                self.rate = max(RATE_LIMIT_MIN_RATE, current * RATE_LIMIT_DECREASE)
+                self._last_decrease = now
+
+    def on_failure(self) -> None:
+        """A connection error, timeout, 5xx, or a 429 that outlasted the retries."""
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= CIRCUIT_BREAKER_FAILURES:
+                self._open_until = time.monotonic() + CIRCUIT_BREAKER_COOLDOWN
+                self._probing = 0
+                incr("circuit_opened", target=self.name)
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "open": bool(self._open_until) and time.monotonic() < self._open_until,
+                "failures": self._failures,
+            }
+
+
+_limiters: Dict[str, Limiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> Limiter:
+    """Shared limiter for a host ("api.openalex.org") or "llm"; RATE_LIMITS sets the starting rate."""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = Limiter(name, RATE_LIMITS.get(name))
+    return limiter
+
+
+def reset_limiters() -> None:
+    """Forget adaptive rates and breaker state (start of a run)."""
+    with _limiters_lock:
+        _limiters.clear()
@@ -0,0 +1,268 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from affiliations import extract_affiliations
+
+# ===================== PATTERNS =====================
+
+# Leading citation labels: "[Hill ’79]", "[12]", "12.", "(12)"
+_LABEL_RE = re.compile(r"^\s*(?:\[[^\]\n]{1,40}\]|\(\d{1,4}\)|\d{1,4}[.)])\s*")
+
+_YEAR = r"(?:1[5-9]\d{2}|20\d{2})"
+_YEAR_RE = re.compile(rf"\b({_YEAR})[a-z]?\b")
+
+# APA-like: Authors (2018). Title. Venue ...   (also "(2001, April)" and a missing period)
+_APA_RE = re.compile(
+    rf"^(?P<authors>[^\"“”]+?)\s*\((?P<year>{_YEAR})[a-z]?(?:,[^)]{{0,20}})?\)\s*[.,:]?\s*(?P<rest>.+)$",
+    re.DOTALL,
+)
+# ACM-like: Authors. 2018. Title. Venue ...
+_ACM_RE = re.compile(
+    rf"^(?P<authors>.+?)\.\s+(?P<year>{_YEAR})[a-z]?\.\s+(?P<rest>.+)$",
+    re.DOTALL,
+)
+# IEEE / MLA-like: Authors, "Title," Venue ... / Authors. "Title." Venue ...
+_QUOTED_RE = re.compile(
+    r"^(?P<authors>[^\"“”]+?)[.,]?\s*[\"“](?P<title>[^\"“”]{8,}?)[,.]?[\"”]\s*(?P<rest>.*)$",
+    re.DOTALL,
+)
+
+_DOI_RE = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)", re.IGNORECASE)
+# Matches only start where a local part can start, so long runs without "@" are not rescanned.
+_EMAIL_RE = re.compile(r"(?<![\w.%+-])[\w.%+-]+@(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,}(?![\w-])")
+
+# Title ends at the first sentence break ("." / "?" / "!" followed by a capital, digit or bracket).
+_SENTENCE_END_RE = re.compile(r"(?<=[^\s.][.?!])\s+(?=[A-Z0-9(\[“\"]|arXiv)")
+
+# "J.", "J. R.", "J.R", "Ch.", "J-P." ("Xu", "Li" are surnames, not initials)
+_ABBREVIATIONS = {"vol", "no", "pp", "ed", "eds", "vs", "al", "st", "dr", "jr", "sr", "inc", "co"}
+
+_INITIALS_RE = re.compile(r"^(?:(?:[A-Z][a-z]?\.|[A-Z](?![a-z]))\s?-?\s?)+$")
+_NAME_WORD_RE = re.compile(r"^[A-Z][\w'’\-]+$|^(?:van|von|der|de|del|da|di|la|le|du|den|ter)$")
+
+# Text that is a venue, publisher, page range or link rather than a title
+_VENUE_HINT_RE = re.compile(
+    r"^(?:in\s|arxiv|proceedings|journal|transactions|retrieved|available|https?:|doi\b|\d+\s*[-–]\s*\d+|"
+    r"(?:springer|wiley|elsevier|o[’']reilly|mcgraw|addison|prentice|[\w ]+ (?:university )?press)\b)",
+    re.IGNORECASE,
+)
+# A title cut at an abbreviation: "Springer, p", "Models, vol"
+_CUT_TITLE_RE = re.compile(r"(?:^|[\s,])(?:[a-z]|pp|vol|no)$")
+
+_TYPE_HINTS: List[Tuple[str, re.Pattern]] = [
+    ("proceedings-article", re.compile(
+        r"\b(?:proceedings|proc\.|conference|symposium|workshop|NeurIPS|NIPS|ICML|ICLR|CVPR|ECCV|ICCV|"
+        r"ACL|EMNLP|AAAI|IJCAI|KDD|SIGMOD|SIGIR|WWW)\b|\badvances in neural information", re.IGNORECASE)),
+    ("book-chapter", re.compile(r"\bIn\b.*\(Eds?\.\)|\bchapter\b", re.IGNORECASE)),
+    ("journal-article", re.compile(
+        r"\b(?:journal|transactions|letters|review|magazine)\b|\d+\s*\(\d+\)\s*[,:]|\bvol\.", re.IGNORECASE)),
+    ("book", re.compile(
+        r"\b(?:press|publishers?|publishing|springer|wiley|o[’']reilly|mcgraw|elsevier|addison|prentice|"
+        r"isbn|edition|ed\.)\b", re.IGNORECASE)),
+]
+
+_stats = {"rules": 0, "llm": 0}
+_stats_lock = threading.Lock()
+
+
+# ===================== HELPERS =====================
+
+def extract_doi(text: str) -> Optional[str]:
+    """First DOI in the text (bare, lowercased), or None."""
+    m = _DOI_RE.search(text or "")
+    if not m:
+        return None
+    doi = m.group(1).rstrip(".,;:")
+    # drop closing brackets that belong to the surrounding text, not the DOI
+    while doi and doi[-1] in ")]}" and doi.count(doi[-1]) > doi.count({")": "(", "]": "[", "}": "{"}[doi[-1]]):
+        doi = doi[:-1].rstrip(".,;:")
+    return doi.lower() or None
+
+
+def extract_emails(text: str) -> List[str]:
+    """Email addresses in the text, in order, without repeats."""
+    return list(dict.fromkeys(_EMAIL_RE.findall(text or "")))
+
+
+def strip_label(ref_text: str) -> str:
+    """Drop a leading citation label ("[12]", "12.", "[Hill ’79]")."""
+    return _LABEL_RE.sub("", ref_text or "", count=1)
+
+
+def _is_initials(part: str) -> bool:
+    return bool(_INITIALS_RE.match(part.strip()))
+
+
+def _is_name(part: str) -> bool:
+    words = part.replace(".", ". ").split()
+    if not words or len(words) > 5:
+        return False
+    return all(_is_initials(w) or _NAME_WORD_RE.match(w) for w in words)
+
+
+def _display_name(surname: str, given: str) -> str:
+    """"Wang", "X. Y." -> "X. Y. Wang" (the form the LLM parser returns)."""
+    given = re.sub(r"\.(?=[A-Z])", ". ", given.strip())
+    given = re.sub(r"\b([A-Z])\b(?!\.)", r"\1.", given)
+    return f"{given} {surname.strip()}".strip()
+
+
+def parse_authors(text: str) -> Tuple[List[str], bool]:
+    """
+    Split an author list ("Wang, X., Ma, S., ... & Wei, F." /
+    "X. Wang, S. Ma and F. Wei" / "Heil, Christopher E., and David F. Walnut").
+    Returns (names as "X. Wang", clean) where clean is False if some part
+    did not look like a name.
+    """
+    text = re.sub(r"\s+", " ", text or "").strip(" .,;")
+    text = re.sub(r",?\s*(?:\.\.\.|…)\s*", ", ", text)
+    text = re.sub(r",?\s+(?:&|and)\s+", ", ", text)
+    text = re.sub(r"\bet al\.?|\(Eds?\.?\)", "", text).strip(" ,.")
+    parts = [p.strip() for p in re.split(r"[,;]", text) if p.strip()]
+
+    names: List[str] = []
+    clean = bool(parts)
+    i = 0
+    while i < len(parts):
+        part = parts[i]
+        nxt = parts[i + 1] if i + 1 < len(parts) else None
+        if nxt is not None and _is_initials(nxt) and not _is_initials(part) \
+                and (" " not in part or _is_name(part)):
+            # "Surname, I. J." / "Van der Maaten, L. J. P."
+            names.append(_display_name(part, nxt))
+            i += 2
+            continue
+        if " " not in part and nxt is not None and _is_name(nxt) and not _is_initials(part) \
+                and len(nxt.split()) <= 2 and i == 0:
+            # leading "Surname, Given M." (MLA first author)
+            names.append(_display_name(part, nxt))
+            i += 2
+            continue
+        if _is_name(part) and " " in part:
+            # "X. Wang", "David F. Walnut" or APA without comma "Harrison M."
+            words = part.split()
+            if _is_initials(words[-1]) and not _is_initials(words[0]):
+                names.append(_display_name(words[0], " ".join(words[1:])))
+            else:
+                names.append(part)
+        else:
+            clean = False
+        i += 1
+    return names, clean
+
+
+def _title_from_rest(rest: str) -> Tuple[str, str]:
+    """Split "Title. Venue, 5(2), 1-9." into (title, venue)."""
+    rest = re.sub(r"\s+", " ", rest).strip()
+    quoted = re.match(r"^[\"“](?P<title>[^\"“”]{3,}?)[,.]?[\"”]\s*(?P<venue>.*)$", rest)
+    if quoted:
+        return quoted.group("title").strip(" ,."), quoted.group("venue")
+    title, venue = rest, ""
+    for m in _SENTENCE_END_RE.finditer(rest):
+        head = rest[:m.start()]
+        last_word = re.split(r"[\s(]", head)[-1].rstrip(".?!").lower()
+        if last_word in _ABBREVIATIONS or head.count("(") > head.count(")"):
+            continue
+        title, venue = head, rest[m.end():]
+        break
+    title = title.rstrip(" .,")
+    if not venue and "," in title:
+        # "Title, Journal of X, 6, pp. 1-9": no period after the title
+        head, tail = title.split(",", 1)
+        if len(head.split()) >= 3:
+            title, venue = head, tail
+    return title.strip(), venue.strip()
+
+
+def guess_work_type(text: str) -> Optional[str]:
+    """Work type from venue keywords (None if nothing fits)."""
+    for work_type, pattern in _TYPE_HINTS:
+        if pattern.search(text or ""):
+            return work_type
+    return None
+
+
+# ===================== PARSER =====================
+
+def parse_reference_rules(ref_text: str) -> Dict[str, Any]:
+    """
+    Parse a reference without the LLM. Handles bracketed/numbered labels and
+    APA-, ACM- and IEEE/MLA-like layouts. Returns the parse_reference_with_dspy
+    dict plus "work_type" and "confidence" (0-1; low when the layout was not
+    recognized or a field looks wrong).
+    """
+    text = strip_label(ref_text)
+    text = re.sub(r"-\n(?=[a-z])", "-", text)  # keep hyphenated words whole across line breaks
+    text = re.sub(r"\s+", " ", text).strip()
+
+    style = None
+    authors_raw, title, venue, year = "", "", "", None
+    for name, pattern in (("apa", _APA_RE), ("acm", _ACM_RE), ("quoted", _QUOTED_RE)):
+        m = pattern.match(text)
+        if not m:
+            continue
+        style = name
+        authors_raw = m.group("authors")
+        if name == "quoted":
+            title, venue = m.group("title").strip(" ,."), m.group("rest")
+        else:
+            title, venue = _title_from_rest(m.group("rest"))
+            year = int(m.group("year"))
+        break
+
+    if year is None:
+        years = _YEAR_RE.findall(venue if style else text)
+        year = int(years[-1]) if years else None
+
+    authors, authors_clean = parse_authors(authors_raw) if style else ([], False)
+    emails = extract_emails(ref_text)
+    affiliations = extract_affiliations(ref_text)  # a single one is shared by first and last author
+
+    # Confidence: recognized layout, year, clean author list, plausible title.
+    confidence = 0.0
+    if style:
+        confidence += 0.3
+    if year is not None:
+        confidence += 0.2
+    if authors and authors_clean:
+        confidence += 0.25
+    title_words = len(title.split())
+    has_letters = len(re.findall(r"[^\W\d_]", title)) >= 4
+    plausible = not _VENUE_HINT_RE.match(title) and not _CUT_TITLE_RE.search(title)
+    if 2 <= title_words <= 40 and has_letters and plausible:
+        confidence += 0.25
+    elif title_words == 1 and has_letters and plausible:
+        confidence += 0.1
+
+    return {
+        "paper_title": title,
+        "year": year,
+        "authors": authors,
+        "emails": emails,
+        "authors_structured": [],
+        "first_affiliations": affiliations[:1],
+        "last_affiliations": affiliations[-1:],
+        "first_author_emails": emails,
+        "last_author_emails": [],
+        "doi": extract_doi(ref_text),
+        "work_type": guess_work_type(venue),
+        "confidence": round(confidence, 2),
+    }
+
+
+def record_parser_use(parser: str) -> None:
+    """Count which parser produced a reference ("rules" or "llm")."""
+    with _stats_lock:
+        _stats[parser] = _stats.get(parser, 0) + 1
+
+
+def parser_stats() -> Dict[str, int]:
+    """Rule-based vs LLM parse counts since the last reset_parser_stats."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_parser_stats() -> None:
+    """Zero the parse counts (start of a run)."""
+    with _stats_lock:
+        _stats.update(rules=0, llm=0)
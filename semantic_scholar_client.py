@@ -1,12 +1,18 @@
+import logging
 import re
-import requests
-import time
 from typing import Any, Dict, List, Optional, Tuple
 from config import (
     SEMANTIC_SCHOLAR_BASE_URL,
+    SEMANTIC_SCHOLAR_BATCH_SIZE,
     SEMANTIC_SCHOLAR_TIMEOUT,
     SEMANTIC_SCHOLAR_API_KEY,
+    SEMANTIC_SCHOLAR_FIELDS,
 )
+from http_client import http_get, http_post, ahttp_get, response_json
+from cache import cached_response, store_response
+from rate_limit import CircuitOpenError
+
+logger = logging.getLogger(__name__)
 
 
 def _normalize_title(title: str) -> str:
@@ -14,30 +20,115 @@ def _normalize_title(title: str) -> str:
     return " ".join(cleaned.split())
 
 
-def _s2_get(url: str, params: Dict[str, Any], max_retries: int = 2, base_delay: float = 0.5) -> Dict[str, Any]:
-    """Call Semantic Scholar with retry/backoff on 429s."""
-    headers = {"User-Agent": "reference-extractor/1.0"}
+def _s2_headers() -> Dict[str, str]:
+    """The API key header, if one is set (the shared session sends the User-Agent)."""
+    headers: Dict[str, str] = {}
     if SEMANTIC_SCHOLAR_API_KEY and "SET_YOUR_S2_KEY_HERE" not in SEMANTIC_SCHOLAR_API_KEY:
         headers["x-api-key"] = SEMANTIC_SCHOLAR_API_KEY
-    for attempt in range(1, max_retries + 1):
-        try:
-            resp = requests.get(url, params=params, timeout=SEMANTIC_SCHOLAR_TIMEOUT, headers=headers)
-            if resp.status_code == 429 and attempt < max_retries:
-                wait = base_delay * attempt
-                print(f"  Semantic Scholar rate limit (429), retrying in {wait:.1f}s...")
-                time.sleep(wait)
-                continue
-            resp.raise_for_status()
-            return resp.json() or {}
-        except Exception as e:
-            if getattr(e, "response", None) is not None and getattr(e.response, "status_code", None) == 429:
-                if attempt >= max_retries:
-                    print("  Semantic Scholar rate limit (429) final attempt; skipping.")
-                    return {"rate_limited": True}
-            if attempt >= max_retries:
-                raise
-            time.sleep(base_delay * attempt)
-    return {}
+    return headers
+
+
+def _s2_result(resp: Any) -> Any:
+    """Decode a response; a 404 (e.g. no title match) is an empty dict, a final 429 is {"rate_limited": True}."""
+    if resp.status_code == 429:
+        logger.warning("  Semantic Scholar rate limit (429) after retries; skipping.")
+        return {"rate_limited": True}
+    if resp.status_code == 404:
+        return {}
+    resp.raise_for_status()
+    return response_json(resp) or {}
+
+
+def _s2_request(url: str, params: Dict[str, Any], json_body: Any = None) -> Any:
+    """
+    Call Semantic Scholar (POST when json_body is given). Throttling, retries
+    and backoff are handled by the shared host limiter in http_client, which
+    holds the "semantic_scholar" slot per attempt, not across Retry-After
+    waits; while the circuit breaker is open the call is skipped as rate limited.
+    """
+    headers = _s2_headers()
+    try:
+        if json_body is None:
+            resp = http_get(url, params=params, timeout=SEMANTIC_SCHOLAR_TIMEOUT, headers=headers,
+                            service="semantic_scholar")
+        else:
+            resp = http_post(url, params=params, json_body=json_body, timeout=SEMANTIC_SCHOLAR_TIMEOUT,
+                             headers=headers, service="semantic_scholar")
+    except CircuitOpenError:
+        logger.debug("  Semantic Scholar circuit open; skipping.")
+        return {"rate_limited": True}
+    return _s2_result(resp)
+
+
+def _s2_get(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """GET form of _s2_request."""
+    return _s2_request(url, params)
+
+
+async def _as2_get(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Async counterpart of _s2_get."""
+    headers = _s2_headers()
+    try:
+        resp = await ahttp_get(url, params=params, timeout=SEMANTIC_SCHOLAR_TIMEOUT, headers=headers,
+                               service="semantic_scholar")
+    except CircuitOpenError:
+        logger.debug("  Semantic Scholar circuit open; skipping.")
+        return {"rate_limited": True}
+    return _s2_result(resp)
+
+
+def compact_s2_paper(paper: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Keep only what extract_authors_from_s2_paper and the notes read."""
+    if not paper:
+        return paper
+    return {
+        "paperId": paper.get("paperId"),
+        "title": paper.get("title"),
+        "year": paper.get("year"),
+        "authors": [
+            {"name": a.get("name") or "", "affiliations": [x for x in (a.get("affiliations") or []) if x]}
+            for a in (paper.get("authors") or [])
+        ],
+    }
+
+
+def _s2_search_params(title: str, year: Optional[int], per_page: int) -> Dict[str, Any]:
+    params: Dict[str, Any] = {
+        "query": _normalize_title(title),
+        "limit": per_page,
+        "fields": SEMANTIC_SCHOLAR_FIELDS,
+    }
+    if year:
+        params["year"] = year
+    return params
+
+
+def _s2_search(url: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """One cached search call; returns None when rate limited (never cached)."""
+    hit, cached = cached_response(url, params)
+    if hit:
+        logger.debug("  Semantic Scholar (cached): %d results", len(cached))
+        return cached
+    data = _s2_get(url, params=params)
+    if data.get("rate_limited"):
+        return None
+    results = [compact_s2_paper(p) for p in data.get("data", []) or []]
+    store_response(url, params, results)
+    return results
+
+
+async def _as2_search(url: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Async counterpart of _s2_search."""
+    hit, cached = cached_response(url, params)
+    if hit:
+        logger.debug("  Semantic Scholar (cached): %d results", len(cached))
+        return cached
+    data = await _as2_get(url, params=params)
+    if data.get("rate_limited"):
+        return None
+    results = [compact_s2_paper(p) for p in data.get("data", []) or []]
+    store_response(url, params, results)
+    return results
 
 
 def fetch_semantic_scholar_candidates(title: str,
@@ -48,43 +139,147 @@ def fetch_semantic_scholar_candidates(title: str,
         return []
 
     base_url = f"{SEMANTIC_SCHOLAR_BASE_URL}/paper/search"
-    clean_title = _normalize_title(title)
+    params = _s2_search_params(title, year, per_page)
 
-    params = {
-        "query": clean_title,
-        "limit": per_page,
-        "fields": "title,year,authors.name,authors.affiliations",
-    }
-    if year:
-        params["year"] = year
+    logger.debug("  Semantic Scholar query: %s", params)
+
+    try:
+        results = _s2_search(base_url, params)
+        if results is None:
+            return []
+    except Exception as e:
+        logger.warning("  Semantic Scholar error: %s", e)
+        results = []
+
+    if not results and year:
+        params.pop("year", None)
+        logger.debug("  Semantic Scholar fallback query (no year): %s", params)
+        try:
+            results = _s2_search(base_url, params)
+            if results is None:
+                return []
+        except Exception as e:
+            logger.warning("  Semantic Scholar fallback error: %s", e)
+            results = []
+
+    return results
+
+
+async def afetch_semantic_scholar_candidates(title: str,
+                                             year: Optional[int] = None,
+                                             per_page: int = 5) -> List[Dict[str, Any]]:
+    """Async version of fetch_semantic_scholar_candidates."""
+    if not title:
+        return []
+
+    base_url = f"{SEMANTIC_SCHOLAR_BASE_URL}/paper/search"
+    params = _s2_search_params(title, year, per_page)
 
-    print("  Semantic Scholar query:", params)
-    base_delay = 0.5 if SEMANTIC_SCHOLAR_API_KEY else 2.0
+    logger.debug("  Semantic Scholar query: %s", params)
 
     try:
-        data = _s2_get(base_url, params=params, base_delay=base_delay)
-        if data.get("rate_limited"):
+        results = await _as2_search(base_url, params)
+        if results is None:
             return []
-        results = data.get("data", []) or []
     except Exception as e:
-        print("  Semantic Scholar error:", e)
+        logger.warning("  Semantic Scholar error: %s", e)
         results = []
 
     if not results and year:
         params.pop("year", None)
-        print("  Semantic Scholar fallback query (no year):", params)
+        logger.debug("  Semantic Scholar fallback query (no year): %s", params)
         try:
-            data = _s2_get(base_url, params=params, base_delay=base_delay)
-            if data.get("rate_limited"):
+            results = await _as2_search(base_url, params)
+            if results is None:
                 return []
-            results = data.get("data", []) or []
         except Exception as e:
-            print("  Semantic Scholar fallback error:", e)
+            logger.warning("  Semantic Scholar fallback error: %s", e)
             results = []
 
     return results
 
 
+def fetch_semantic_scholar_batch(paper_ids: List[str],
+                                 batch_size: int = SEMANTIC_SCHOLAR_BATCH_SIZE) -> List[Optional[Dict[str, Any]]]:
+    """
+    Resolve many paper ids (e.g. "DOI:10.1145/...") via POST /paper/batch.
+    Returns one paper (or None) per input id; cached per id.
+    """
+    url = f"{SEMANTIC_SCHOLAR_BASE_URL}/paper/batch"
+    papers: Dict[str, Optional[Dict[str, Any]]] = {}
+    missing: List[str] = []
+    for pid in dict.fromkeys(paper_ids):
+        hit, cached = cached_response(url, {"id": pid, "fields": SEMANTIC_SCHOLAR_FIELDS})
+        if hit:
+            papers[pid] = cached or None
+        else:
+            missing.append(pid)
+
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        logger.debug("  Semantic Scholar batch lookup (%d ids)", len(chunk))
+        try:
+            data = _s2_request(url, {"fields": SEMANTIC_SCHOLAR_FIELDS}, json_body={"ids": chunk})
+        except Exception as e:
+            logger.warning("  Semantic Scholar batch error: %s", e)
+            continue
+        if not isinstance(data, list):
+            # rate limited or unexpected payload: leave these ids unresolved
+            continue
+        for pid, paper in zip(chunk, data):
+            paper = compact_s2_paper(paper)
+            papers[pid] = paper or None
+            store_response(url, {"id": pid, "fields": SEMANTIC_SCHOLAR_FIELDS}, paper or {})
+
+    return [papers.get(pid) for pid in paper_ids]
+
+
+def match_semantic_scholar_title(title: str, year: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Best single title match via /paper/search/match (None when there is none)."""
+    if not title:
+        return None
+    url = f"{SEMANTIC_SCHOLAR_BASE_URL}/paper/search/match"
+    params: Dict[str, Any] = {"query": _normalize_title(title), "fields": SEMANTIC_SCHOLAR_FIELDS}
+    if year:
+        params["year"] = year
+    hit, cached = cached_response(url, params)
+    if hit:
+        return cached or None
+    logger.debug("  Semantic Scholar title match: %s", params)
+    data = _s2_request(url, params)
+    if data.get("rate_limited"):
+        return None
+    paper = compact_s2_paper((data.get("data") or [None])[0])
+    store_response(url, params, paper or {})
+    return paper
+
+
+def resolve_semantic_scholar_bulk(parsed_refs: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Fill many references with as few requests as possible: DOIs go through
+    one /paper/batch call per SEMANTIC_SCHOLAR_BATCH_SIZE ids, the rest through
+    /paper/search/match. Returns one paper (or None) per parsed reference.
+    """
+    resolved: List[Optional[Dict[str, Any]]] = [None] * len(parsed_refs)
+
+    with_doi = [i for i, p in enumerate(parsed_refs) if p.get("doi")]
+    if with_doi:
+        papers = fetch_semantic_scholar_batch([f"DOI:{parsed_refs[i]['doi']}" for i in with_doi])
+        for i, paper in zip(with_doi, papers):
+            resolved[i] = paper
+
+    for i, parsed in enumerate(parsed_refs):
+        if resolved[i] is None and parsed.get("paper_title"):
+            try:
+                resolved[i] = match_semantic_scholar_title(parsed["paper_title"], parsed.get("year"))
+            except Exception as e:
+                logger.warning("  Semantic Scholar match error: %s", e)
+
+    hits = sum(1 for r in resolved if r)
+    logger.info("  Semantic Scholar bulk lookup resolved %d/%d references", hits, len(parsed_refs))
+    return resolved
+
+
 def extract_authors_from_s2_paper(paper: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """Extract first/last author summaries from a Semantic Scholar paper result."""
     authors = paper.get("authors", []) or []
@@ -0,0 +1,536 @@
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from config import (
+    CACHE_DIR,
+    COMBINED_PARSE,
+    PARSER,
+    MATCH_FAST_PATH_THRESHOLD,
+    OPENALEX_HEDGE_DELAY,
+    S2_MODE,
+    PDF_EXTRACT_PROCESSES,
+    DETECT_BIBLIOGRAPHY,
+    OPENALEX_INDEX_PATH,
+    INSTITUTION_GAZETTEER_PATH,
+    MODEL_NAME,
+    API_BASE,
+    LOG_LEVEL,
+    SERVE_HOST,
+    SERVE_PORT,
+    SERVE_WORKERS,
+    SERVE_MAX_JOBS,
+    SERVE_MAX_UPLOAD_MB,
+)
+import metrics
+from metrics import span
+from affiliations import configure_gazetteer, get_gazetteer
+from cache import configure_prediction_cache, configure_response_cache
+from concurrency import configure_limits
+from http_client import get_session
+from openalex_index import configure_openalex_index
+from pdf_utils import iter_references_from_pdf
+from pipeline import error_record, process_single_reference
+
+logger = logging.getLogger(__name__)
+
+_XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+_FINISHED = ("done", "failed", "cancelled")
+
+
+class Job:
+    """One submitted PDF or reference list; rows are kept in input order."""
+
+    def __init__(self, kind: str, name: str, options: Dict[str, Any]) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind  # "pdf" or "references"
+        self.name = name
+        self.options = options
+        self.status = "queued"  # -> extracting (PDFs) -> running -> done / failed / cancelled
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.references: List[str] = []
+        self.records: List[Optional[Dict[str, Any]]] = []
+        self.pending: Deque[int] = deque()
+        self.scheduled = False  # in the service's round-robin queue
+        self.input_complete = False  # every reference is known (PDF extraction finished)
+        self.done = 0
+        self.errors = 0
+        self.finished_event = threading.Event()
+
+    def describe(self) -> Dict[str, Any]:
+        total = len(self.references) if self.input_complete else None
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "status": self.status,
+            "total": total,
+            "found": len(self.references),
+            "done": self.done,
+            "errors": self.errors,
+            "progress": round(self.done / total, 3) if total else (1.0 if total == 0 else None),
+            "created": self.created,
+            "seconds": round(end - (self.started or end), 3),
+            "error": self.error,
+        }
+
+
+class ReferenceService:
+    """
+    Job queue over a shared pool of worker threads. Workers take one
+    reference at a time from the active jobs in turn (round-robin); rows are
+    built with pipeline.process_single_reference, and a reference that
+    raises gets the same error row as in a batch run.
+    """
+
+    def __init__(self,
+                 workers: int = SERVE_WORKERS,
+                 options: Optional[Dict[str, Any]] = None,
+                 max_jobs: int = SERVE_MAX_JOBS,
+                 extract_options: Optional[Dict[str, Any]] = None) -> None:
+        self.workers = max(1, workers)
+        self.options = dict(options or {})
+        self.extract_options = dict(extract_options or {})
+        processes = self.extract_options.get("processes", PDF_EXTRACT_PROCESSES) or os.cpu_count() or 1
+        self.extract_options["processes"] = processes
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Deque[Job] = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._extract_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="serve-extract")
+        # One long-lived page-extraction pool for every upload: no process start-up per
+        # job, and concurrent uploads share its processes instead of each adding a pool.
+        self._pdf_pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+        self._threads = [
+            threading.Thread(target=self._work, name=f"serve-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---------- submission ----------
+
+    def submit_references(self, references: List[str], name: str = "",
+                          options: Optional[Dict[str, Any]] = None) -> Job:
+        job = self._new_job("references", name, options)
+        for ref in references:
+            self._add_reference(job, ref)
+        self._complete_input(job)
+        return job
+
+    def submit_pdf(self, data: bytes, name: str = "", options: Optional[Dict[str, Any]] = None,
+                   extract_options: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue a PDF; its references are scheduled as extraction yields them."""
+        job = self._new_job("pdf", name, options)
+        job.status = "extracting"
+        job.started = time.time()
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as fh:
+            fh.write(data)
+        self._extract_pool.submit(self._extract, job, fh.name, dict(self.extract_options, **(extract_options or {})))
+        return job
+
+    def _new_job(self, kind: str, name: str, options: Optional[Dict[str, Any]]) -> Job:
+        job = Job(kind, name, dict(self.options, **(options or {})))
+        with self._cond:
+            self._jobs[job.id] = job
+        metrics.incr("serve_jobs", kind=kind)
+        logger.info("Job %s queued (%s%s)", job.id, kind, f": {name}" if name else "")
+        return job
+
+    def _extract(self, job: Job, path: str, extract_options: Dict[str, Any]) -> None:
+        try:
+            for ref in iter_references_from_pdf(path, executor=self._pdf_pool, **extract_options):
+                self._add_reference(job, ref)
+        except Exception as e:
+            logger.error("Job %s: could not read PDF: %s", job.id, e)
+            job.error = f"Could not read PDF: {e}"
+        finally:
+            os.remove(path)
+            self._complete_input(job)
+
+    def _add_reference(self, job: Job, ref: str) -> None:
+        with self._cond:
+            if job.status == "cancelled":
+                return
+            job.pending.append(len(job.references))
+            job.references.append(ref)
+            job.records.append(None)
+            if not job.scheduled:
+                job.scheduled = True
+                self._active.append(job)
+            self._cond.notify()
+
+    def _complete_input(self, job: Job) -> None:
+        with self._cond:
+            job.input_complete = True
+            self._maybe_finish(job)
+
+    # ---------- processing ----------
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._active and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = self._active.popleft()
+                idx = job.pending.popleft()
+                if job.pending:
+                    self._active.append(job)  # back of the line: other jobs go next
+                else:
+                    job.scheduled = False
+                if job.status in ("queued", "extracting"):
+                    job.status = "running"
+                    job.started = job.started or time.time()
+                ref = job.references[idx]
+            record, failed = self._process(job, ref)
+            with self._cond:
+                job.records[idx] = record
+                job.done += 1
+                job.errors += failed
+                self._maybe_finish(job)
+
+    def _process(self, job: Job, ref: str) -> Tuple[Dict[str, Any], bool]:
+        try:
+            with span("reference"):
+                return process_single_reference(ref, **job.options), False
+        except Exception as e:
+            logger.error("Job %s: error: %s", job.id, e)
+            metrics.incr("reference_errors")
+            return error_record(ref, e), True
+
+    def _maybe_finish(self, job: Job) -> None:
+        """Mark a job finished once all its references are in (caller holds the lock)."""
+        if job.status in _FINISHED or not job.input_complete or job.done < len(job.references):
+            return
+        job.status = "failed" if job.error else "done"
+        job.finished = time.time()
+        job.finished_event.set()
+        metrics.incr("serve_jobs_finished", status=job.status)
+        logger.info("Job %s %s: %d references, %d errors", job.id, job.status, job.done, job.errors)
+        self._evict()
+
+    def _evict(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in _FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    # ---------- queries ----------
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        with self._cond:
+            return job.describe()
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [job.describe() for job in self._jobs.values()]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Drop a job's pending references and forget it (references in flight still finish)."""
+        with self._cond:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return None
+            job.pending.clear()
+            if job.scheduled:
+                self._active.remove(job)
+                job.scheduled = False
+            if job.status not in _FINISHED:
+                job.status = "cancelled"
+                job.finished = time.time()
+                job.finished_event.set()
+            return job
+
+    def health(self) -> Dict[str, Any]:
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                "status": "ok",
+                "workers": self.workers,
+                "jobs": counts,
+                "queued_references": sum(len(job.pending) for job in self._active),
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._extract_pool.shutdown(wait=False)
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _xlsx_bytes(records: List[Dict[str, Any]]) -> bytes:
+    import pandas as pd
+
+    buf = io.BytesIO()
+    pd.DataFrame(records).fillna("").to_excel(buf, index=False)
+    return buf.getvalue()
+
+
+def _job_options(params: Dict[str, str]) -> Dict[str, Any]:
+    """Per-job overrides from the query string (parser, s2_mode, match_threshold)."""
+    options: Dict[str, Any] = {}
+    if params.get("parser"):
+        if params["parser"] not in ("llm", "rules", "auto"):
+            raise ValueError("parser must be llm, rules or auto")
+        options["parser"] = params["parser"]
+    if params.get("s2_mode"):
+        if params["s2_mode"] not in ("fallback", "speculative"):
+            raise ValueError("s2_mode must be fallback or speculative")
+        options["s2_mode"] = params["s2_mode"]
+    if params.get("match_threshold"):
+        value = params["match_threshold"]
+        options["match_threshold"] = None if value == "none" else float(value)
+    return options
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    service: ReferenceService  # set on the subclass made by make_server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+    def _send(self, status: int, body: Any, content_type: str = "application/json",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        if content_type == "application/json":
+            body = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, {"error": message})
+
+    def _route(self) -> Tuple[List[str], Dict[str, str]]:
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return [p for p in url.path.split("/") if p], params
+
+    def _job(self, job_id: str, params: Dict[str, str]) -> Optional[Job]:
+        """Look up a job, waiting up to ?wait= seconds for it to finish."""
+        job = self.service.get(job_id)
+        if job is None:
+            self._error(404, f"no job {job_id}")
+            return None
+        if params.get("wait"):
+            job.finished_event.wait(min(float(params["wait"]), 300.0))
+        return job
+
+    def do_GET(self) -> None:
+        parts, params = self._route()
+        try:
+            if parts == ["health"]:
+                self._send(200, self.service.health())
+            elif parts == ["metrics"]:
+                self._send(200, metrics.snapshot())
+            elif parts == ["jobs"]:
+                self._send(200, {"jobs": self.service.jobs()})
+            elif len(parts) == 2 and parts[0] == "jobs":
+                job = self._job(parts[1], params)
+                if job is not None:
+                    self._send(200, self.service.describe(job))
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                job = self._job(parts[1], params)
+                if job is not None:
+                    self._send_result(job, params.get("format", "json"))
+            else:
+                self._error(404, "not found")
+        except ValueError as e:
+            self._error(400, str(e))
+
+    def _send_result(self, job: Job, fmt: str) -> None:
+        status = self.service.describe(job)
+        if status["status"] not in ("done", "failed"):
+            self._send(409, dict(status, error=status["error"] or "job not finished"))
+            return
+        if fmt == "xlsx":
+            filename = os.path.splitext(job.name)[0] if job.name else job.id
+            self._send(200, _xlsx_bytes(job.records), _XLSX_TYPE,
+                       {"Content-Disposition": f'attachment; filename="{filename}.xlsx"'})
+        elif fmt == "json":
+            self._send(200, {"job": status, "records": job.records})
+        else:
+            self._error(400, "format must be json or xlsx")
+
+    def do_POST(self) -> None:
+        parts, params = self._route()
+        if parts != ["jobs"]:
+            self._error(404, "not found")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVE_MAX_UPLOAD_MB * 2**20:
+            self._error(413, f"upload larger than {SERVE_MAX_UPLOAD_MB} MB")
+            return
+        data = self.rfile.read(length)
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        name = params.get("name", "")
+        try:
+            options = _job_options(params)
+            if content_type == "application/pdf" or data[:5] == b"%PDF-":
+                extract = {}
+                if params.get("detect_bibliography"):
+                    extract["detect_bibliography"] = params["detect_bibliography"] not in ("0", "false")
+                job = self.service.submit_pdf(data, name, options, extract)
+            else:
+                if content_type == "application/json":
+                    body = json.loads(data or b"{}")
+                    references = body.get("references") if isinstance(body, dict) else body
+                    name = name or (body.get("name", "") if isinstance(body, dict) else "")
+                else:
+                    references = data.decode("utf-8").splitlines()
+                if not isinstance(references, list):
+                    raise ValueError('expected {"references": [...]}, a JSON array, or one reference per line')
+                references = [str(r) for r in references if str(r).strip()]
+                job = self.service.submit_references(references, name, options)
+        except (ValueError, UnicodeDecodeError) as e:
+            self._error(400, str(e))
+            return
+        self._send(202, self.service.describe(job), headers={"Location": f"/jobs/{job.id}"})
+
+    def do_DELETE(self) -> None:
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.service.cancel(parts[1])
+            if job is None:
+                self._error(404, f"no job {parts[1]}")
+            else:
+                self._send(200, job.describe())
+        else:
+            self._error(404, "not found")
+
+
+def make_server(host: str = SERVE_HOST,
+                port: int = SERVE_PORT,
+                workers: int = SERVE_WORKERS,
+                options: Optional[Dict[str, Any]] = None,
+                cache_dir: Optional[str] = CACHE_DIR,
+                use_cache: bool = True,
+                llm_concurrency: Optional[int] = None,
+                openalex_concurrency: Optional[int] = None,
+                s2_concurrency: Optional[int] = None,
+                openalex_index: Optional[str] = OPENALEX_INDEX_PATH,
+                institutions: Optional[str] = INSTITUTION_GAZETTEER_PATH,
+                extract_options: Optional[Dict[str, Any]] = None,
+                warm: bool = True) -> Tuple[ThreadingHTTPServer, ReferenceService]:
+    """
+    Configure caches, limits, the local index and the gazetteer once, warm
+    the HTTP session, gazetteer and (unless the parser is "rules") the LM,
+    and build the HTTP server with its ReferenceService. Call
+    serve_forever() on the server.
+    """
+    options = dict({
+        "combined_parse": COMBINED_PARSE,
+        "parser": PARSER,
+        "match_threshold": MATCH_FAST_PATH_THRESHOLD,
+        "hedge_delay": OPENALEX_HEDGE_DELAY,
+        "s2_mode": S2_MODE if S2_MODE != "bulk" else "fallback",  # bulk needs the whole list
+    }, **(options or {}))
+    configure_openalex_index(openalex_index)
+    configure_gazetteer(institutions)
+    configure_response_cache(cache_dir, enabled=use_cache)
+    configure_prediction_cache(cache_dir, enabled=use_cache)
+    configure_limits(llm=llm_concurrency, openalex=openalex_concurrency, semantic_scholar=s2_concurrency)
+    get_session()
+    get_gazetteer()
+    if warm and options["parser"] != "rules":
+        from dspy_models import get_lm
+        get_lm()
+
+    service = ReferenceService(workers, options, extract_options=extract_options or {
+        "processes": PDF_EXTRACT_PROCESSES,
+        "detect_bibliography": DETECT_BIBLIOGRAPHY,
+    })
+    handler = type("ServiceHandler", (_ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, service
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the reference pipeline over HTTP with a job queue.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS,
+                        help="Worker threads shared by all jobs (default: %(default)s).")
+    parser.add_argument("--parser", choices=["llm", "rules", "auto"], default=PARSER)
+    parser.add_argument("--s2_mode", choices=["fallback", "speculative"],
+                        default=S2_MODE if S2_MODE != "bulk" else "fallback")
+    parser.add_argument("--match_threshold", type=float, default=MATCH_FAST_PATH_THRESHOLD)
+    parser.add_argument("--hedge_delay", type=float, default=OPENALEX_HEDGE_DELAY)
+    parser.add_argument("--openalex_index", default=OPENALEX_INDEX_PATH)
+    parser.add_argument("--institutions", default=INSTITUTION_GAZETTEER_PATH)
+    parser.add_argument("--cache-dir", dest="cache_dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true")
+    parser.add_argument("--llm_concurrency", type=int, default=None)
+    parser.add_argument("--openalex_concurrency", type=int, default=None)
+    parser.add_argument("--s2_concurrency", type=int, default=None)
+    parser.add_argument("--model", default=None, help=f"LiteLLM model string (default: {MODEL_NAME}).")
+    parser.add_argument("--api_base", default=None, help="Model server URL, e.g. http://localhost:11434.")
+    parser.add_argument("--log_level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+
+    if args.model or args.api_base:
+        from dspy_models import configure_lm
+        configure_lm(model=args.model or MODEL_NAME, api_base=args.api_base or API_BASE)
+
+    server, service = make_server(
+        args.host,
+        args.port,
+        args.workers,
+        options={
+            "parser": args.parser,
+            "s2_mode": args.s2_mode,
+            "match_threshold": args.match_threshold,
+            "hedge_delay": args.hedge_delay,
+        },
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        llm_concurrency=args.llm_concurrency,
+        openalex_concurrency=args.openalex_concurrency,
+        s2_concurrency=args.s2_concurrency,
+        openalex_index=args.openalex_index,
+        institutions=args.institutions,
+    )
+    logger.info("Serving on http://%s:%d with %d workers", args.host, server.server_port, service.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+from config import STARTUP_BUDGET_SECONDS, STARTUP_FORBIDDEN_MODULES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _time_command(args: List[str], runs: int) -> float:
+    """Median wall time of a fresh-interpreter command."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=HERE, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _loaded_heavy_modules() -> List[str]:
+    """Forbidden modules that `import pipeline` pulls in."""
+    probe = (
+        "import sys, pipeline; "
+        f"print(' '.join(m for m in {tuple(STARTUP_FORBIDDEN_MODULES)!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", probe], cwd=HERE, check=True,
+                         capture_output=True, text=True).stdout
+    return out.split()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure CLI startup time and check it against the budget in config.py."
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement (median is reported).")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=STARTUP_BUDGET_SECONDS,
+        help="Seconds allowed per measurement (default: %(default)s).",
+    )
+    args = parser.parse_args(argv)
+
+    measurements = {
+        "python (bare interpreter)": _time_command(["-c", "pass"], args.runs),
+        "main.py --help": _time_command(["main.py", "--help"], args.runs),
+        "import pipeline": _time_command(["-c", "import pipeline"], args.runs),
+    }
+    # Informational: what the first LLM call pays on top.
+    llm_import = _time_command(["-c", "import dspy_models"], args.runs)
+
+    ok = True
+    for name, seconds in measurements.items():
+        over = name != "python (bare interpreter)" and seconds > args.budget
+        ok = ok and not over
+        print(f"{name:<28} {seconds * 1000:7.0f} ms{'  OVER BUDGET' if over else ''}")
+    print(f"{'import dspy_models (lazy)':<28} {llm_import * 1000:7.0f} ms")
+
+    heavy = _loaded_heavy_modules()
+    if heavy:
+        ok = False
+        print(f"`import pipeline` loads {', '.join(heavy)} eagerly; import them on first use instead.")
+
+    print(f"Budget {args.budget * 1000:.0f} ms: {'OK' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import affiliations
+from affiliations import Gazetteer, configure_gazetteer, extract_affiliations, keyword_affiliations
+from reference_parser import _EMAIL_RE, extract_emails
+
+
+@pytest.fixture
+def gazetteer_file(tmp_path):
+    path = tmp_path / "institutions.tsv"
+    path.write_text(
+        "Massachusetts Institute of Technology\n"
+        "MIT\tMassachusetts Institute of Technology\n"
+        "Université Paris-Saclay\tParis-Saclay University\n",
+        encoding="utf-8",
+    )
+    previous = affiliations._gazetteer_path
+    configure_gazetteer(str(path))
+    yield path
+    configure_gazetteer(previous)
+
+
+def test_gazetteer_is_leftmost_longest():
+    gazetteer = Gazetteer([
+        ("University of California", "University of California"),
+        ("University of California Berkeley", "UC Berkeley"),
+        ("California Berkeley Lab", "Berkeley Lab"),
+        ("Stanford University", "Stanford University"),
+    ])
+    text = "Work done at the University of California, Berkeley Lab and Stanford University."
+    assert gazetteer.find(text) == ["UC Berkeley", "Stanford University"]
+    start, end, name = gazetteer.spans(text)[0]
+    assert (text[start:end], name) == ("University of California, Berkeley", "UC Berkeley")
+
+
+def test_gazetteer_folds_case_and_accents():
+    gazetteer = Gazetteer([("Université Paris-Saclay", "Paris-Saclay University")])
+    assert gazetteer.find("UNIVERSITE PARIS SACLAY, France") == ["Paris-Saclay University"]
+
+
+def test_gazetteer_ignores_single_word_aliases():
+    gazetteer = Gazetteer([("MIT", "Massachusetts Institute of Technology"), ("Apple", "Apple Inc.")])
+    assert len(gazetteer) == 0
+    assert gazetteer.find("MIT and Apple") == []
+
+
+def test_gazetteer_hits_replace_overlapping_keyword_phrases(gazetteer_file):
+    text = "J. Doe (Massachusetts Institute of Technology) and A. Roe, Department of Physics, Universite Paris-Saclay."
+    assert extract_affiliations(text) == [
+        "Massachusetts Institute of Technology",
+        "Department of Physics",
+        "Paris-Saclay University",
+    ]
+
+
+def test_keyword_affiliations_without_gazetteer():
+    previous = affiliations._gazetteer_path
+    configure_gazetteer(None)
+    try:
+        text = "A. Roe, Department of Computer Science, Stanford University, USA."
+        assert extract_affiliations(text) == ["Department of Computer Science", "Stanford University"]
+    finally:
+        configure_gazetteer(previous)
+
+
+def test_publishers_are_not_affiliations():
+    assert keyword_affiliations("Oxford: Cambridge University Press, 2004.") == []
+    assert keyword_affiliations("Institute of Physics Publishing, Bristol") == []
+
+
+def test_extract_emails():
+    text = "Contact: jane.doe+refs@cs.example.ac.uk, (bob@example.com); jane.doe+refs@cs.example.ac.uk; x@y; a@b.c"
+    assert extract_emails(text) == ["jane.doe+refs@cs.example.ac.uk", "bob@example.com"]
+    assert extract_emails(None) == []
+
+
+def test_email_regex_is_linear_without_an_at_sign():
+    text = "a." * 50000 + "-" * 50000
+    start = time.perf_counter()
+    assert _EMAIL_RE.search(text) is None
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,94 @@
+import pytest
+
+import pdf_utils
+from pdf_utils import _scan_page_range, _select_bibliography, find_bibliography_pages, iter_references_from_pdf
+
+
+def _kept(flags):
+    """_select_bibliography over pages described as "r" (reference-like), "h" (heading only) or "-" (other)."""
+    scans = [(n, flag == "r", flag == "h", None) for n, flag in enumerate(flags)]
+    return [scan[0] for scan, keep in _select_bibliography(iter(scans)) if keep]
+
+
+@pytest.mark.parametrize("flags, kept", [
+    ("--rrr", [2, 3, 4]),  # runs over several pages to the end
+    ("-hrr-", [1, 2, 3]),  # heading page before the list, then a trailing page
+    ("-rr-rr-", [1, 2, 3, 4, 5]),  # a figure page in the middle is filled in
+    ("-rr--r", [1, 2, 5]),  # two pages are not a gap
+    ("-rr--", [1, 2]),  # appendix after the references
+    ("-h-r", [3]),  # a heading not followed by references
+    ("----", []),
+    ("r", [0]),
+    ("", []),
+])
+def test_select_bibliography(flags, kept):
+    assert _kept(flags) == kept
+
+
+def test_pages_are_decided_two_scans_later():
+    yielded = []
+
+    def scans():
+        for n, flag in enumerate("-rrr--"):
+            yielded.append(n)
+            yield n, flag == "r", False, None
+
+    selection = _select_bibliography(scans())
+    assert next(selection)[0][0] == 0
+    assert yielded == [0, 1, 2]
+
+
+BODY = [
+    "In this section we describe the method in more detail and discuss how",
+    "the components fit together, which choices matter and which do not.",
+    "The design follows the earlier discussion closely.",
+]
+REFS_1 = [
+    "References",
+    "[1] Smith, J. (2019). Learning to match citations at scale. Journal of Data Science.",
+    "[2] Vaswani, A. (2017). Attention is all you need. In NeurIPS.",
+    "[3] Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks.",
+]
+FIGURE = ["Figure 7: Throughput over the number of workers for every configuration we tried."]
+REFS_2 = [
+    "[4] Lee, H. (2018). Sparse attention for long documents. JMLR.",
+    "[5] Ng, A. (2004). Feature selection and rotational invariance. In ICML.",
+    "[6] Doe, J. (2001). Another title of a reference. Some Venue.",
+]
+APPENDIX = ["Appendix A", "Proofs of the lemmas are given below, without any citations at all."]
+
+
+def test_scan_extracts_the_pages_that_may_be_kept(write_pdf):
+    pdf = write_pdf([BODY, REFS_1, FIGURE, REFS_2])
+    scans = _scan_page_range(pdf, 0, 4)
+    assert [(n, dense, heading) for n, dense, heading, _ in scans] == [
+        (0, False, False), (1, True, True), (2, False, False), (3, True, False),
+    ]
+    assert scans[0][3] is None  # only sketched
+    assert "Figure 7" in scans[2][3]  # right after a reference page: extracted straight away
+    assert "[4] Lee" in scans[3][3]
+
+
+def test_bibliography_with_a_gap_page_and_an_appendix(write_pdf):
+    pdf = write_pdf([BODY, REFS_1, FIGURE, REFS_2, APPENDIX, APPENDIX])
+    assert find_bibliography_pages(pdf) == [1, 2, 3]
+    refs = list(iter_references_from_pdf(pdf, processes=1, detect_bibliography=True))
+    assert [ref.split("]")[0] for ref in refs] == ["[1", "[2", "[3", "[4", "[5", "[6"]
+    assert "Figure 7" in refs[2]  # the gap page is kept, so its text joins the entry before it
+    assert not any("Proofs" in ref for ref in refs)
+
+
+def test_no_bibliography_falls_back_to_all_pages(write_pdf, monkeypatch):
+    pdf = write_pdf([BODY, APPENDIX])
+    assert find_bibliography_pages(pdf) == []
+    extracted = []
+    real_extract = pdf_utils._extract_page_range
+
+    def extract(path, start, end):
+        extracted.append((start, end))
+        return real_extract(path, start, end)
+
+    monkeypatch.setattr(pdf_utils, "_extract_page_range", extract)
+    pages = list(pdf_utils._iter_bibliography_page_texts(pdf, processes=1))
+    assert extracted == [(0, 2)]
+    assert "the components fit together" in pages[0] and "Appendix A" in pages[1]
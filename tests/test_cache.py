@@ -0,0 +1,87 @@
+import pytest
+
+import cache
+from cache import SqliteCache, cached_response, response_key, store_response
+from config import CACHE_NEGATIVE_TTL_SECONDS, CACHE_TTL_SECONDS
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def responses(tmp_path):
+    cache.configure_response_cache(str(tmp_path))
+    yield cache.get_response_cache()
+    cache.configure_response_cache()
+
+
+def _count(store):
+    return store._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"))
+    store.set("short", {"a": 1}, ttl=10)
+    store.set("forever", [1, 2])
+    clock.now += 9
+    assert store.get("short") == (True, {"a": 1})
+    clock.now += 2
+    assert store.get("short") == (False, None)
+    assert _count(store) == 1  # the expired entry is dropped on read
+    clock.now += 10**9
+    assert store.get("forever") == (True, [1, 2])
+    assert store.stats() == {"hits": 2, "misses": 1}
+
+
+def test_empty_responses_get_the_negative_ttl(responses, clock):
+    store_response("works", {"search": "found"}, [{"id": "W1"}])
+    store_response("works", {"search": "nothing"}, [])
+    clock.now += CACHE_NEGATIVE_TTL_SECONDS + 1
+    assert cached_response("works", {"search": "nothing"}) == (False, None)
+    assert cached_response("works", {"search": "found"}) == (True, [{"id": "W1"}])
+    clock.now += CACHE_TTL_SECONDS
+    assert cached_response("works", {"search": "found"}) == (False, None)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"), max_entries=3)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        store.set(key, key)
+    clock.now += 1
+    store.get("a")
+    clock.now += 1
+    store.set("d", "d")
+    store._trim()
+    assert [store.get(key)[0] for key in ("a", "b", "c", "d")] == [True, False, True, True]
+
+
+def test_trim_drops_expired_entries_first(tmp_path, clock):
+    store = SqliteCache(str(tmp_path / "c.sqlite3"), max_entries=2)
+    store.set("old", 1, ttl=5)
+    clock.now += 1
+    store.set("b", 2)
+    store.set("c", 3)
+    clock.now += 10
+    store._trim()
+    assert _count(store) == 2
+    assert store.get("b") == (True, 2) and store.get("c") == (True, 3)
+
+
+def test_response_key_ignores_order_case_whitespace_and_mailto():
+    key = response_key("works", {"search": "Attention  is All", "filter": "year:2017", "mailto": "a@b.c"})
+    assert key == response_key("works", {"filter": "year:2017", "search": "attention is all", "per_page": None})
+    assert key != response_key("works", {"search": "attention is all"})
+    assert key != response_key("authors", {"search": "attention is all", "filter": "year:2017"})
@@ -0,0 +1,162 @@
+import pytest
+
+import pipeline
+from checkpoint import Checkpoint, reference_key
+
+OPTIONS = {
+    "combined_parse": True,
+    "parser": "rules",
+    "match_threshold": 0.9,
+    "hedge_delay": None,
+}
+
+
+def test_records_and_stages_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.add("[1] A reference", {"paper_title": "A"})
+    checkpoint.add_stage("parsed", "[1] A reference", {"paper_title": "A"})
+    checkpoint.add_stage("parsed", "[2] Another one", {"paper_title": "B"})
+    checkpoint.close()
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write('{"key": "cut short by a cra')
+
+    resumed = Checkpoint(path, resume=True)
+    assert len(resumed) == 1
+    assert resumed.get("[1]   A\nreference") == {"paper_title": "A"}  # whitespace-insensitive key
+    assert resumed.get_stage("parsed", "[1] A reference") is None  # its row is done
+    assert resumed.get_stage("parsed", "[2] Another one") == {"paper_title": "B"}
+    assert resumed.get("[2] Another one") is None
+    resumed.close()
+
+    fresh = Checkpoint(path)  # without resume the run starts over, keeping the old file aside
+    assert len(fresh) == 0
+    fresh.close()
+    assert len(Checkpoint(path + ".bak", resume=True)) == 1
+
+
+def test_reference_key_ignores_whitespace():
+    assert reference_key(" a  b\nc ") == reference_key("a b c")
+
+
+class _Crash(BaseException):
+    pass
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    calls = {"parse": 0, "openalex": 0, "match": 0}
+
+    def parse(ref, **options):
+        calls["parse"] += 1
+        return {"paper_title": ref, "year": 2020}
+
+    def resolve(parsed_refs):
+        calls["openalex"] += len(parsed_refs)
+        return [[{"id": "W" + p["paper_title"][-1]}] for p in parsed_refs]
+
+    def match(ref, parsed=None, candidates=None, **options):
+        calls["match"] += 1
+        return {"parsed": parsed, "best_work": None, "match_rationale": "", "match_path": "", "prompt_tokens": 0}
+
+    monkeypatch.setattr(pipeline, "parse_reference", parse)
+    monkeypatch.setattr(pipeline, "resolve_openalex_batch", resolve)
+    monkeypatch.setattr(pipeline, "local_candidates", lambda parsed: [])
+    monkeypatch.setattr(pipeline, "match_reference", match)
+    return calls
+
+
+def _run(monkeypatch, tmp_path, references, **options):
+    monkeypatch.setattr(pipeline, "iter_references_from_pdf", lambda pdf_path, **kwargs: iter(references))
+    pipeline.process_pdf_to_excel(
+        "refs.pdf", str(tmp_path / "out.xlsx"), workers=1, use_cache=False, batch_openalex=True, **options
+    )
+    return str(tmp_path / "out.xlsx.checkpoint.jsonl")
+
+
+def test_bulk_flow_resumes_after_the_matching_stage(tmp_path, monkeypatch, stages):
+    references = ["[1] first", "[2] second", "[3] third"]
+
+    def crash(parsed_refs):
+        raise _Crash()
+
+    monkeypatch.setattr(pipeline, "resolve_semantic_scholar_bulk", crash)
+    with pytest.raises(_Crash):
+        _run(monkeypatch, tmp_path, references, s2_mode="bulk")
+    assert stages == {"parse": 3, "openalex": 3, "match": 3}
+
+    monkeypatch.setattr(pipeline, "resolve_semantic_scholar_bulk", lambda parsed_refs: [None] * len(parsed_refs))
+    monkeypatch.setattr(pipeline, "build_record",
+                        lambda ref, match, s2_source=None: {"reference_raw": ref, "title": match["parsed"]["paper_title"]})
+    path = _run(monkeypatch, tmp_path, references, s2_mode="bulk", resume=True)
+    assert stages == {"parse": 3, "openalex": 3, "match": 3}  # nothing redone
+    resumed = Checkpoint(path, resume=True)
+    assert [resumed.get(ref)["title"] for ref in references] == references
+
+
+def test_batched_openalex_flow_keeps_parses_and_candidates(tmp_path, monkeypatch, stages):
+    references = ["[1] first", "[2] second"]
+    seen = []
+
+    def process(ref, parsed=None, candidates=None, **options):
+        seen.append((parsed, candidates))
+        raise _Crash()
+
+    monkeypatch.setattr(pipeline, "process_single_reference", process)
+    with pytest.raises(_Crash):
+        _run(monkeypatch, tmp_path, references, s2_mode="fallback")
+
+    seen.clear()
+    with pytest.raises(_Crash):
+        _run(monkeypatch, tmp_path, references, s2_mode="fallback", resume=True)
+    assert stages["parse"] == 2 and stages["openalex"] == 2  # from the first run only
+    assert seen == [({"paper_title": "[1] first", "year": 2020}, [{"id": "Wt"}])]
+
+
+def test_batched_stages_resume_after_the_matching_stage(tmp_path, monkeypatch, stages):
+    references = ["[1] first", "[2] second", "[3] third"]
+    path = str(tmp_path / "run.checkpoint.jsonl")
+
+    def crash(parsed_refs):
+        raise _Crash()
+
+    monkeypatch.setattr(pipeline, "resolve_semantic_scholar_bulk", crash)
+    checkpoint = Checkpoint(path)
+    with pytest.raises(_Crash):
+        pipeline._process_batched(references, [0, 1, 2], checkpoint, 1, True, "bulk", OPTIONS)
+    checkpoint.close()
+    assert stages == {"parse": 3, "openalex": 3, "match": 3}
+
+    monkeypatch.setattr(pipeline, "resolve_semantic_scholar_bulk", lambda parsed_refs: [None] * len(parsed_refs))
+    monkeypatch.setattr(pipeline, "build_record",
+                        lambda ref, match, s2_source=None: {"reference_raw": ref, "title": match["parsed"]["paper_title"]})
+    checkpoint = Checkpoint(path, resume=True)
+    rows = pipeline._process_batched(references, [0, 1, 2], checkpoint, 1, True, "bulk", OPTIONS)
+    checkpoint.close()
+    assert stages == {"parse": 3, "openalex": 3, "match": 3}  # nothing redone
+    assert [rows[i]["title"] for i in range(3)] == references
+    assert Checkpoint(path, resume=True).get("[2] second")["title"] == "[2] second"
+
+
+def test_batched_stages_keep_parses_and_candidates(tmp_path, monkeypatch, stages):
+    references = ["[1] first", "[2] second"]
+    path = str(tmp_path / "run.checkpoint.jsonl")
+    seen = []
+
+    def process(ref, parsed=None, candidates=None, **options):
+        seen.append((parsed, candidates))
+        raise _Crash()
+
+    monkeypatch.setattr(pipeline, "process_single_reference", process)
+    checkpoint = Checkpoint(path)
+    with pytest.raises(_Crash):
+        pipeline._process_batched(references, [0, 1], checkpoint, 1, True, "fallback", OPTIONS)
+    checkpoint.close()
+
+    seen.clear()
+    checkpoint = Checkpoint(path, resume=True)
+    with pytest.raises(_Crash):
+        pipeline._process_batched(references, [0, 1], checkpoint, 1, True, "fallback", OPTIONS)
+    checkpoint.close()
+    assert stages["parse"] == 2 and stages["openalex"] == 2  # from the first run only
+    assert seen == [({"paper_title": "[1] first", "year": 2020}, [{"id": "Wt"}])]
@@ -0,0 +1,88 @@
+import json
+
+from matching import score_candidate
+from openalex_client import compact_work, extract_authors_from_work
+
+
+def _authorship(n, name, institutions):
+    return {
+        "author_position": "middle",
+        "author": {"id": f"https://openalex.org/A{n}", "display_name": name, "orcid": None},
+        "institutions": institutions,
+        "countries": ["US"],
+        "is_corresponding": False,
+        "raw_author_name": name,
+        "raw_affiliation_strings": ["Somewhere, Some Country"],
+    }
+
+
+GOOGLE = {"id": "https://openalex.org/I1", "display_name": "Google (United States)", "ror": "https://ror.org/1",
+          "country_code": "US", "type": "company", "lineage": ["https://openalex.org/I1"]}
+TORONTO = {"id": "https://openalex.org/I2", "display_name": "University of Toronto", "ror": "https://ror.org/2",
+           "country_code": "CA", "type": "education", "lineage": ["https://openalex.org/I2"]}
+
+# a /works result as OpenAlex returns it without `select` (trimmed): no host venue, an abstract index
+WORK = {
+    "id": "https://openalex.org/W2963403868",
+    "doi": "https://doi.org/10.48550/arxiv.1706.03762",
+    "title": "Attention Is All You Need",
+    "display_name": "Attention Is All You Need",
+    "publication_year": 2017,
+    "publication_date": "2017-06-12",
+    "type": "article",
+    "cited_by_count": 100000,
+    "primary_location": None,
+    "locations": [],
+    "abstract_inverted_index": {"The": [0], "dominant": [1], "sequence": [2, 9], "transduction": [3]},
+    "concepts": [{"id": "https://openalex.org/C1", "display_name": "Transformer", "score": 0.9}],
+    "referenced_works": ["https://openalex.org/W1", "https://openalex.org/W2"],
+    "authorships": [
+        _authorship(1, "Ashish Vaswani", [GOOGLE]),
+        _authorship(2, "Noam Shazeer", [GOOGLE, {"id": "https://openalex.org/I3", "display_name": None}]),
+        _authorship(3, "Aidan N. Gomez", [TORONTO]),
+        _authorship(4, "Illia Polosukhin", []),
+    ],
+}
+
+
+def test_compact_work_keeps_what_matching_and_author_extraction_read():
+    compact = compact_work(WORK)
+    assert compact == {
+        "id": "https://openalex.org/W2963403868",
+        "doi": "https://doi.org/10.48550/arxiv.1706.03762",
+        "title": "Attention Is All You Need",
+        "publication_year": 2017,
+        "type": "article",
+        "cited_by_count": 100000,
+        "authorships": [
+            {"author": {"id": "https://openalex.org/A1", "display_name": "Ashish Vaswani"},
+             "institutions": [{"display_name": "Google (United States)"}]},
+            {"author": {"id": "https://openalex.org/A2", "display_name": "Noam Shazeer"},
+             "institutions": [{"display_name": "Google (United States)"}]},
+            {"author": {"id": "https://openalex.org/A3", "display_name": "Aidan N. Gomez"},
+             "institutions": [{"display_name": "University of Toronto"}]},
+            {"author": {"id": "https://openalex.org/A4", "display_name": "Illia Polosukhin"},
+             "institutions": []},
+        ],
+    }
+    # what is cached / indexed round-trips through JSON and re-compacts to itself
+    assert json.loads(json.dumps(compact)) == compact
+    assert compact_work(compact) == compact
+
+
+def test_compact_work_gives_the_same_answers_downstream():
+    compact = compact_work(WORK)
+    parsed = ("Attention is all you need", 2017, ["A. Vaswani", "I. Polosukhin"], "article")
+    assert score_candidate(*parsed, compact) == score_candidate(*parsed, WORK)
+    assert extract_authors_from_work(compact) == extract_authors_from_work(WORK)
+
+
+def test_compact_work_fills_gaps_and_drops_middle_authors():
+    work = {"id": "https://openalex.org/W1", "title": None, "display_name": "Only a display name",
+            "authorships": [_authorship(n, f"Author {n}", []) for n in range(5)]}
+    compact = compact_work(work, max_authorships=3)
+    assert compact["title"] == "Only a display name"
+    assert compact["doi"] is None and compact["publication_year"] is None
+    assert [a["author"]["display_name"] for a in compact["authorships"]] == ["Author 0", "Author 1", "Author 4"]
+    assert extract_authors_from_work(compact) == extract_authors_from_work(work)
+    assert compact_work({})["authorships"] == [] and compact_work({})["title"] == ""
@@ -0,0 +1,79 @@
+import os
+
+import pandas as pd
+
+import pipeline
+from dedup import ReferenceDeduplicator, reference_keys, text_key
+
+REF = "[3] Smith, J., Doe, A. (2019). Learning to match citations at scale. Journal of Data, 12(3), 45-67."
+
+
+def test_text_key_ignores_label_layout_and_accents():
+    assert text_key("[12] Müller, K. Deep-\nlearning.") == text_key("4. Muller, K.  Deeplearning")
+
+
+def test_short_texts_get_no_text_key():
+    assert not any(k.startswith("text:") for k in reference_keys("Ibid., p. 4."))
+
+
+def test_same_text_in_another_layout_is_one_reference():
+    dedup = ReferenceDeduplicator()
+    assert dedup.add(REF, "a.pdf", 0) == (0, True)
+    assert dedup.add(REF.replace("[3]", "7.").replace(" ", "\n", 3), "b.pdf", 6) == (0, False)
+    assert len(dedup) == 1
+    assert dedup.representatives == [REF]
+    assert dedup.occurrences == [[("a.pdf", 0), ("b.pdf", 6)]]
+
+
+def test_shared_doi_is_one_reference():
+    dedup = ReferenceDeduplicator()
+    dedup.add("Smith J. A paper on citation matching. 2019. doi:10.1234/abc.5678", "a.pdf", 0)
+    index, is_new = dedup.add("J. Smith, Citation matching (preprint), https://doi.org/10.1234/ABC.5678", "b.pdf", 0)
+    assert (index, is_new) == (0, False)
+
+
+def test_different_works_get_their_own_index():
+    dedup = ReferenceDeduplicator()
+    dedup.add(REF, "a.pdf", 0)
+    other = "[4] Brown, B. (2020). An unrelated study of graph partitioning methods. Networks, 8, 1-20."
+    assert dedup.add(other, "a.pdf", 1) == (1, True)
+    assert len(dedup) == 2
+
+
+OTHER = "[4] Brown, B. (2020). An unrelated study of graph partitioning methods. Networks, 8, 1-20."
+THIRD = "[9] Lee, H. (2018). Sparse attention for long documents. Journal of Machine Learning, 19, 1-30."
+
+
+def test_batch_processes_shared_references_once_and_fans_them_out(monkeypatch, tmp_path):
+    relaid = REF.replace("[3]", "1.")
+    pdfs = {
+        os.path.join("x", "a.pdf"): [REF, OTHER],
+        os.path.join("y", "a.pdf"): [relaid, THIRD],  # same stem as x/a.pdf
+        "b.pdf": [OTHER],
+    }
+    processed = []
+
+    def process(ref, **kwargs):
+        processed.append(ref)
+        return {"reference_raw": ref, "paper_title": f"title of {ref[:3]}"}
+
+    monkeypatch.setattr(pipeline, "iter_references_from_pdf", lambda path, **kwargs: iter(pdfs[path]))
+    monkeypatch.setattr(pipeline, "process_single_reference", process)
+    output = str(tmp_path / "all.xlsx")
+    pipeline.process_pdfs_to_excel(list(pdfs), output, workers=2, use_cache=False)
+
+    assert sorted(processed) == sorted([REF, OTHER, THIRD])
+    combined = pd.read_excel(output)
+    assert combined[["paper_title", "documents", "occurrences"]].values.tolist() == [
+        ["title of [3]", "a; a_2", 2],
+        ["title of [4]", "a; b", 2],
+        ["title of [9]", "a_2", 1],
+    ]
+    per_document = str(tmp_path / "all_documents")
+    assert sorted(os.listdir(per_document)) == ["a.xlsx", "a_2.xlsx", "b.xlsx"]
+    second = pd.read_excel(os.path.join(per_document, "a_2.xlsx"))
+    assert second[["reference_raw", "paper_title"]].values.tolist() == [
+        [relaid, "title of [3]"],  # the document's own text, the shared row's fields
+        [THIRD, "title of [9]"],
+    ]
+    assert pd.read_excel(os.path.join(per_document, "b.xlsx"))["paper_title"].tolist() == ["title of [4]"]
@@ -0,0 +1,57 @@
+import pytest
+
+import pdf_utils
+from pdf_utils import iter_references_from_pdf
+
+PAGES = [
+    ["References", "[1] Smith, J. (2019). Learning to match citations at scale. Journal of",
+     "Data Science, 12(3), 45-67."],
+    ["[2] Vaswani, A. (2017). Attention is all you need. In NeurIPS.",
+     "[3] Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks."],
+    ["[4] Lee, H. (2018). Sparse attention for long documents. JMLR."],
+]
+MB = 2 ** 20
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Script current_rss_bytes: each probe pops the next value (in MB); counts PDF opens."""
+    readings, opens = [], []
+    real_open = pdf_utils._open_pdf
+
+    def open_pdf(path):
+        opens.append(path)
+        return real_open(path)
+
+    monkeypatch.setattr(pdf_utils, "current_rss_bytes", lambda: readings.pop(0) * MB)
+    monkeypatch.setattr(pdf_utils, "_open_pdf", open_pdf)
+    return readings, opens
+
+
+def test_going_over_the_limit_reopens_the_pdf_and_carries_on(write_pdf, rss):
+    readings, opens = rss
+    pdf = write_pdf(PAGES)
+    normal = list(iter_references_from_pdf(pdf, processes=1))
+    opens.clear()
+    # the second page grows RSS by 8 MB, over the 5 MB limit; reopening gives it back
+    readings.extend([100, 100, 100, 108, 100, 100, 100])
+    low = list(iter_references_from_pdf(pdf, processes=1, low_memory=True, memory_limit_mb=5))
+    assert low == normal
+    assert len(low) == 4 and low[0].endswith("Data Science, 12(3), 45-67.")
+    assert len(opens) == 3 and not readings  # page count, first open, reopen
+
+
+def test_growth_that_survives_a_reopen_raises(write_pdf, rss):
+    readings, opens = rss
+    pdf = write_pdf(PAGES)
+    readings.extend([100, 104, 104, 108, 107])
+    with pytest.raises(MemoryError, match="page 2 has grown memory by 7 MB"):
+        list(iter_references_from_pdf(pdf, processes=1, low_memory=True, memory_limit_mb=5))
+    assert len(opens) == 3
+
+
+def test_no_limit_never_probes(write_pdf, rss):
+    readings, _ = rss  # an empty script: any probe would fail
+    pdf = write_pdf(PAGES)
+    assert list(iter_references_from_pdf(pdf, processes=1, low_memory=True, memory_limit_mb=None)) == \
+        list(iter_references_from_pdf(pdf, processes=1))
@@ -0,0 +1,85 @@
+import json
+
+import dspy
+
+import dspy_models
+from config import MATCH_PROMPT_TOP_K
+from dspy_models import _candidate_for_prompt, pick_best_match
+from matching import shortlist_candidates
+
+
+def _work(n, title, year=2017, authors=("Ashish Vaswani",), work_type="article"):
+    return {
+        "id": f"https://openalex.org/W{n}",
+        "title": title,
+        "publication_year": year,
+        "type": work_type,
+        "authorships": [{"author": {"display_name": name}} for name in authors],
+    }
+
+
+def test_shortlist_keeps_the_top_k_best_scored():
+    candidates = [_work(n, f"Unrelated study number {n} of things", 1990) for n in range(8)]
+    candidates.insert(5, _work(99, "Attention is all you need"))
+    shortlist = shortlist_candidates("Attention is all you need", 2017, ["A. Vaswani"], candidates, "article", top_k=3)
+    assert len(shortlist) == 3
+    assert shortlist[0]["id"] == "https://openalex.org/W99"
+
+
+def test_shortlist_merges_preprint_and_published_versions():
+    preprint = _work(1, "Attention is all you need", 2017, work_type="preprint")
+    published = _work(2, "Attention Is All You Need.", 2018, work_type="article")
+    shortlist = shortlist_candidates("Attention is all you need", None, [], [preprint, published], None)
+    assert [c["id"] for c in shortlist] == ["https://openalex.org/W2"]
+
+
+def test_shortlist_keeps_numbered_parts_and_other_first_authors_apart():
+    part_1 = _work(1, "Sparse attention, part I")
+    part_2 = _work(2, "Sparse attention, part II")
+    other_author = _work(3, "Sparse attention, part I", authors=("Noam Shazeer",))
+    shortlist = shortlist_candidates("Sparse attention, part I", 2017, [], [part_1, part_2, other_author], None)
+    assert len(shortlist) == 3
+
+
+def test_long_author_lists_are_cut_to_first_and_last():
+    many = _work(1, "A title", authors=[f"Author {i}" for i in range(40)])
+    assert _candidate_for_prompt(many)["authors"] == ["Author 0", "Author 39"]
+    assert _candidate_for_prompt(many)["n_authors"] == 40
+    assert len(_candidate_for_prompt(many, all_authors=True)["authors"]) == 40
+    two = _work(2, "A title", authors=["Author A", "Author B"])
+    assert _candidate_for_prompt(two) == _candidate_for_prompt(two, all_authors=True)  # nothing cut, no n_authors
+
+
+def _choose(monkeypatch):
+    sent = []
+
+    def fake_predict(module, lm_config=None, **inputs):
+        sent.append(inputs)
+        return dspy.Prediction(chosen_id=json.loads(inputs["candidates_json"])[0]["id"], rationale="best title")
+
+    monkeypatch.setattr(dspy_models, "_predict", fake_predict)
+    return sent
+
+
+def test_match_prompt_shrinks_for_many_candidates_and_authors(monkeypatch):
+    sent = _choose(monkeypatch)
+    candidates = [
+        _work(n, f"Attention is all you need, variant {n}", authors=[f"Author {n} {i}" for i in range(40)])
+        for n in range(10)
+    ]
+    best, _, (before, after) = pick_best_match(
+        "Vaswani, A. (2017). Attention is all you need. " * 30,
+        "Attention is all you need", 2017, ["A. Vaswani"], candidates, "article",
+    )
+    assert best is not None
+    assert len(json.loads(sent[0]["candidates_json"])) == MATCH_PROMPT_TOP_K
+    assert after < before / 2
+
+
+def test_match_prompt_never_grows_for_small_inputs(monkeypatch):
+    _choose(monkeypatch)
+    candidates = [_work(1, "Attention is all you need"), _work(2, "Attention is not all you need", 2021)]
+    _, _, (before, after) = pick_best_match(
+        "Vaswani, A. (2017). Attention is all you need.", "Attention is all you need", 2017, [], candidates, None,
+    )
+    assert after <= before
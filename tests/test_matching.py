@@ -0,0 +1,88 @@
+import pytest
+
+from config import MATCH_FAST_PATH_MIN_TITLE_SIMILARITY, MATCH_FAST_PATH_THRESHOLD
+from matching import local_best_match, normalize_title, score_candidate, surname, title_similarity
+
+TITLE = "Attention is all you need"
+AUTHORS = ["Vaswani, A.", "N. Shazeer"]
+
+
+def _work(n, title=TITLE, year=2017, authors=("Ashish Vaswani", "Noam Shazeer"), work_type="proceedings-article"):
+    return {
+        "id": f"https://openalex.org/W{n}",
+        "title": title,
+        "publication_year": year,
+        "type": work_type,
+        "authorships": [{"author": {"display_name": name}} for name in authors],
+    }
+
+
+def test_titles_compare_without_case_accents_or_punctuation():
+    assert normalize_title("  Über-Attention: ALL you   need!") == "uber attention all you need"
+    assert title_similarity("Attention Is All You Need.", "attention is all you need") == 1.0
+    assert title_similarity("", TITLE) == 0.0
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Vaswani, A.", "vaswani"),
+    ("A. Vaswani", "vaswani"),
+    ("Ashish Vaswani", "vaswani"),
+    ("J. R. Müller", "muller"),
+    ("A.", ""),
+])
+def test_surname(name, expected):
+    assert surname(name) == expected
+
+
+def test_exact_match_scores_one():
+    assert score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", _work(1)) == pytest.approx((1.0, 1.0))
+
+
+def test_missing_fields_score_neutral():
+    score, title_sim = score_candidate(TITLE, None, [], "unknown", _work(1, authors=()))
+    assert title_sim == 1.0
+    assert score == pytest.approx(0.55 + 0.45 * 0.5)
+
+
+def test_year_authors_and_type_lower_the_score():
+    exact, _ = score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", _work(1))
+    off_by_one, _ = score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", _work(1, year=2018))
+    far_year, _ = score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", _work(1, year=2010))
+    other_authors, _ = score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", _work(1, authors=("J. Doe",)))
+    other_type, _ = score_candidate(TITLE, 2017, AUTHORS, "book", _work(1))
+    assert exact > off_by_one > far_year
+    assert exact > other_authors and exact > other_type
+
+
+def test_fast_path_accepts_a_clear_match():
+    best, score = local_best_match(TITLE, 2017, AUTHORS, [_work(1, "Deep residual learning"), _work(2)], None)
+    assert best["id"] == "https://openalex.org/W2"
+    assert score >= MATCH_FAST_PATH_THRESHOLD
+
+
+def test_fast_path_defers_below_the_threshold():
+    candidates = [_work(1, year=2005, authors=("J. Doe",), work_type="book")]
+    best, score = local_best_match(TITLE, 2017, AUTHORS, candidates, "proceedings-article")
+    assert best is None
+    assert 0 < score < MATCH_FAST_PATH_THRESHOLD
+    best, _ = local_best_match(TITLE, 2017, AUTHORS, candidates, "proceedings-article", threshold=score)
+    assert best is candidates[0]
+
+
+def test_fast_path_requires_a_near_identical_title():
+    candidate = _work(1, "Attention is all we need")
+    score, title_sim = score_candidate(TITLE, 2017, AUTHORS, "proceedings-article", candidate)
+    assert score >= MATCH_FAST_PATH_THRESHOLD and title_sim < MATCH_FAST_PATH_MIN_TITLE_SIMILARITY
+    assert local_best_match(TITLE, 2017, AUTHORS, [candidate], "proceedings-article")[0] is None
+
+
+def test_fast_path_defers_when_the_runner_up_is_close():
+    candidates = [_work(1), _work(2, year=2018)]
+    best, score = local_best_match(TITLE, 2017, AUTHORS, candidates, "proceedings-article")
+    assert best is None
+    assert score == pytest.approx(1.0)
+
+
+def test_fast_path_without_title_or_candidates():
+    assert local_best_match("", 2017, AUTHORS, [_work(1)], None) == (None, 0.0)
+    assert local_best_match(TITLE, 2017, AUTHORS, [], None) == (None, 0.0)
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _record():
+    for ms in range(1, 101):
+        metrics.record_span("openalex_stage", ms / 1000, stage="1a")
+    metrics.record_span("parse", 0.25)
+    metrics.incr("http_requests", host="api.openalex.org")
+    metrics.incr("http_requests", 2, host="api.openalex.org")
+    metrics.incr("llm_tokens", 12.5, kind='prompt "in"')
+
+
+def test_snapshot_percentiles_and_counters():
+    _record()
+    data = metrics.snapshot()
+    stage, parse = data["spans"]
+    assert stage == {
+        "name": "openalex_stage", "labels": {"stage": "1a"}, "count": 100, "total_s": 5.05,
+        "mean_ms": 50.5, "p50_ms": 51.0, "p90_ms": 90.0, "p99_ms": 99.0, "max_ms": 100.0,
+    }
+    assert (parse["name"], parse["labels"], parse["count"], parse["p99_ms"]) == ("parse", {}, 1, 250.0)
+    assert data["counters"] == [
+        {"name": "http_requests", "labels": {"host": "api.openalex.org"}, "value": 3},
+        {"name": "llm_tokens", "labels": {"kind": 'prompt "in"'}, "value": 12.5},
+    ]
+    assert metrics.counter_total("http_requests") == 3
+
+
+def test_span_records_even_when_the_block_raises():
+    with pytest.raises(ValueError):
+        with metrics.span("reference"):
+            raise ValueError("boom")
+    assert metrics.snapshot()["spans"][0]["count"] == 1
+
+
+def test_json_summary_merges_run_info(tmp_path):
+    _record()
+    path = tmp_path / "metrics.json"
+    written = metrics.write_summary(str(path), extra={"references": 2, "wall_s": 1.5})
+    on_disk = json.loads(path.read_text(encoding="utf-8"))
+    assert on_disk == written
+    assert set(on_disk) == {"references", "wall_s", "spans", "counters"}
+    assert on_disk["references"] == 2 and len(on_disk["spans"]) == 2
+
+
+def test_format_summary_lines():
+    _record()
+    assert metrics.format_summary() == [
+        "openalex_stage[stage=1a]: n=100 total=5.05s p50=51.0ms p90=90.0ms p99=99.0ms max=100.0ms",
+        "parse: n=1 total=0.25s p50=250.0ms p90=250.0ms p99=250.0ms max=250.0ms",
+        "http_requests[host=api.openalex.org]: 3",
+        'llm_tokens[kind=prompt "in"]: 12.5',
+    ]
+
+
+def test_prometheus_textfile(tmp_path):
+    _record()
+    path = tmp_path / "refextract.prom"
+    metrics.write_prometheus(str(path))
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "# TYPE refextract_openalex_stage_seconds summary",
+        'refextract_openalex_stage_seconds{stage="1a",quantile="0.5"} 0.051000',
+        'refextract_openalex_stage_seconds{stage="1a",quantile="0.9"} 0.090000',
+        'refextract_openalex_stage_seconds{stage="1a",quantile="0.99"} 0.099000',
+        'refextract_openalex_stage_seconds_sum{stage="1a"} 5.050000',
+        'refextract_openalex_stage_seconds_count{stage="1a"} 100',
+        "# TYPE refextract_parse_seconds summary",
+        'refextract_parse_seconds{quantile="0.5"} 0.250000',
+        'refextract_parse_seconds{quantile="0.9"} 0.250000',
+        'refextract_parse_seconds{quantile="0.99"} 0.250000',
+        "refextract_parse_seconds_sum 0.250000",
+        "refextract_parse_seconds_count 1",
+        "# TYPE refextract_http_requests_total counter",
+        'refextract_http_requests_total{host="api.openalex.org"} 3',
+        "# TYPE refextract_llm_tokens_total counter",
+        'refextract_llm_tokens_total{kind="prompt \\"in\\""} 12.5',
+    ]
+    assert os.listdir(tmp_path) == ["refextract.prom"]  # no temp file left behind
@@ -0,0 +1,79 @@
+import pytest
+
+import openalex_client
+import pipeline
+from openalex_client import resolve_openalex_batch
+
+
+def _work(n, title, doi=None):
+    return {
+        "id": f"https://openalex.org/W{n}",
+        "doi": f"https://doi.org/{doi}" if doi else None,
+        "title": title,
+        "publication_year": 2017,
+        "type": "article",
+        "authorships": [{"author": {"display_name": "Ashish Vaswani"}}],
+    }
+
+
+WORKS = {f"10.1000/{n}": _work(n, f"Title number {n}", f"10.1000/{n}") for n in range(5)}
+
+
+@pytest.fixture
+def openalex(monkeypatch):
+    """Stub OpenAlex: doi: filters answer from WORKS, search stages from `search`; returns the requests made."""
+    requests = []
+    search = {}
+
+    def get_results(label, params):
+        requests.append((label, params))
+        flt = params.get("filter", "")
+        if flt.startswith("doi:"):
+            return [WORKS[doi] for doi in flt[len("doi:"):].split("|") if doi in WORKS]
+        return search.get(label.split(" (", 1)[0], [])
+
+    monkeypatch.setattr(openalex_client, "_openalex_get_results", get_results)
+    return requests, search
+
+
+def test_dois_resolve_in_one_request(openalex):
+    requests, _ = openalex
+    parsed = [
+        {"paper_title": "Title number 1", "doi": "https://doi.org/10.1000/1"},
+        {"paper_title": "No DOI here"},
+        {"paper_title": "Unknown DOI", "doi": "10.9999/missing"},
+        {"paper_title": "Same work again", "doi": "DOI:10.1000/1"},
+        {"paper_title": "Bad DOI", "doi": "10.1000/1,10.1000/2"},
+    ]
+    resolved = resolve_openalex_batch(parsed)
+    assert resolved == [[WORKS["10.1000/1"]], None, None, [WORKS["10.1000/1"]], None]
+    assert [params["filter"] for _, params in requests] == ["doi:10.1000/1|10.9999/missing"]
+
+
+def test_dois_are_chunked_by_batch_size(openalex):
+    requests, _ = openalex
+    parsed = [{"paper_title": f"Title number {n}", "doi": f"10.1000/{n}"} for n in range(5)]
+    resolved = resolve_openalex_batch(parsed, doi_batch_size=2)
+    assert resolved == [[WORKS[f"10.1000/{n}"]] for n in range(5)]
+    assert [label for label, _ in requests] == ["batch DOI (2 refs)", "batch DOI (2 refs)", "batch DOI (1 refs)"]
+
+
+def test_misses_fall_back_to_the_staged_search(openalex, monkeypatch, tmp_path):
+    requests, search = openalex
+    search["Stage 1a"] = [_work(9, "Attention is all you need")]
+    references = [
+        "[1] Vaswani, A. (2017). Title number 3. Journal of Things, 1(1), 1-9. https://doi.org/10.1000/3",
+        "[2] Vaswani, A. (2017). Attention is all you need. Journal of Things, 1(1), 1-9.",
+    ]
+    monkeypatch.setattr(pipeline, "iter_references_from_pdf", lambda pdf_path, **kwargs: iter(references))
+    monkeypatch.setattr(pipeline, "fetch_semantic_scholar_candidates", lambda *args, **kwargs: [])
+    rows = []
+    monkeypatch.setattr(pipeline, "_write_excel", lambda records, path: rows.extend(records))
+    pipeline.process_pdf_to_excel(
+        "refs.pdf", str(tmp_path / "out.xlsx"), workers=1, use_cache=False, parser="rules",
+        batch_openalex=True, hedge_delay=None, s2_mode="fallback",
+    )
+    assert [label for label, _ in requests] == ["batch DOI (1 refs)", "Stage 1a"]
+    assert "title.search:Attention is all you need" in requests[1][1]["filter"]
+    assert ["W3" in row["notes"] for row in rows] == [True, False]
+    assert "Matched to https://openalex.org/W9" in rows[1]["notes"]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import openalex_client
+from openalex_client import _afetch_stages_hedged, _fetch_stages_hedged
+
+STAGES = [(f"Stage {n}", {"stage": n}) for n in (1, 2, 3)]
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Fake stage queries: {label: (seconds, results)}; returns the labels called, in order."""
+    plan = {}
+    called = []
+
+    def fake_get(label, params):
+        called.append(label)
+        seconds, results = plan[label]
+        time.sleep(seconds)
+        return results
+
+    monkeypatch.setattr(openalex_client, "_openalex_get_results", fake_get)
+    return plan, called
+
+
+def test_fast_first_stage_is_not_hedged(stages):
+    plan, called = stages
+    plan.update({"Stage 1": (0, [{"id": "W1"}]), "Stage 2": (0, [{"id": "W2"}]), "Stage 3": (0, [])})
+    assert _fetch_stages_hedged(STAGES, hedge_delay=1.0) == [{"id": "W1"}]
+    assert called == ["Stage 1"]
+
+
+def test_hedged_stage_wins_when_the_slow_stage_comes_back_empty(stages):
+    plan, called = stages
+    plan.update({"Stage 1": (0.3, []), "Stage 2": (0, [{"id": "W2"}]), "Stage 3": (0, [{"id": "W3"}])})
+    started = time.monotonic()
+    assert _fetch_stages_hedged(STAGES, hedge_delay=0.05) == [{"id": "W2"}]
+    assert "Stage 2" in called
+    assert time.monotonic() - started < 0.3 + 0.2  # stage 2 was already done when stage 1 came back
+
+
+def test_higher_priority_stage_still_wins_over_a_faster_hedge(stages):
+    plan, called = stages
+    plan.update({"Stage 1": (0.2, [{"id": "W1"}]), "Stage 2": (0, [{"id": "W2"}]), "Stage 3": (0, [])})
+    assert _fetch_stages_hedged(STAGES, hedge_delay=0.05) == [{"id": "W1"}]
+    assert called[:2] == ["Stage 1", "Stage 2"]
+
+
+def test_queued_hedges_are_cancelled_once_the_answer_is_known(stages, monkeypatch):
+    plan, called = stages
+    plan.update({"Stage 1": (0.2, [{"id": "W1"}]), "Stage 2": (0.1, [{"id": "W2"}]), "Stage 3": (0, [])})
+    pool = ThreadPoolExecutor(max_workers=1)  # hedges queue behind the running stage
+    submitted = []
+
+    def submit(fn, *args):
+        submitted.append(args[0])
+        return pool.submit(fn, *args)
+
+    monkeypatch.setattr(openalex_client, "_submit_stage", submit)
+    assert _fetch_stages_hedged(STAGES, hedge_delay=0.05) == [{"id": "W1"}]
+    pool.shutdown(wait=True)
+    assert submitted == ["Stage 1", "Stage 2", "Stage 3"]
+    # the worker may pick up stage 2 before the cancel lands; stage 3 is still queued behind it
+    assert called[0] == "Stage 1" and "Stage 3" not in called
+
+
+def test_async_hedges_are_cancelled_on_the_wire(monkeypatch):
+    cancelled = []
+
+    async def fake_aget(label, params):
+        try:
+            if label == "Stage 1":
+                await asyncio.sleep(0.2)
+                return [{"id": "W1"}]
+            await asyncio.sleep(10)
+            return [{"id": label}]
+        except asyncio.CancelledError:
+            cancelled.append(label)
+            raise
+
+    monkeypatch.setattr(openalex_client, "_aopenalex_get_results", fake_aget)
+
+    async def run():
+        results = await _afetch_stages_hedged(STAGES, hedge_delay=0.05)
+        await asyncio.sleep(0)  # let the cancellations land
+        return results
+
+    assert asyncio.run(run()) == [{"id": "W1"}]
+    assert sorted(cancelled) == ["Stage 2", "Stage 3"]
+
+
+def test_stage_submissions_survive_a_pool_resize(monkeypatch):
+    caps = iter([2, 3, 4, 5])
+    monkeypatch.setattr(openalex_client, "get_limits", lambda: {"openalex": next(caps)})
+    futures = [openalex_client._submit_stage(lambda n: n * 2, n) for n in range(4)]  # each call replaces the pool
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6]
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from openalex_index import OpenAlexIndex, build_index
+
+
+def _work(n, title, year, surname, cited_by=0, doi=None, work_type="journal-article"):
+    return {
+        "id": f"https://openalex.org/W{n}",
+        "doi": doi,
+        "title": title,
+        "publication_year": year,
+        "type": work_type,
+        "cited_by_count": cited_by,
+        "authorships": [{
+            "author": {"id": f"https://openalex.org/A{n}", "display_name": f"Jane {surname}"},
+            "institutions": [{"display_name": "University of Somewhere"}],
+        }],
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    works = [
+        _work(1, "Attention is all you need", 2017, "Vaswani", cited_by=900, doi="https://doi.org/10.5555/attn"),
+        _work(2, "Attention is all you need: a replication", 2019, "Other", cited_by=3),
+        _work(3, "Graph partitioning for sparse matrices", 2010, "Karypis", cited_by=50),
+        _work(4, "A survey of sparse matrix graph methods", 2012, "Karypis", cited_by=5, work_type="book"),
+        {"id": "https://openalex.org/W5", "title": None},  # no title: skipped
+    ]
+    shard = tmp_path / "part_000.jsonl"
+    shard.write_text("\n".join(json.dumps(w) for w in works) + "\nnot json\n", encoding="utf-8")
+    db_path = str(tmp_path / "works.sqlite")
+    stats = build_index([str(tmp_path)], db_path)
+    assert stats == {"files": 1, "read": 5, "indexed": 4}
+    return OpenAlexIndex(db_path)
+
+
+def test_exact_title_wins(index):
+    works = index.search("Attention Is All You Need.")
+    assert [w["id"] for w in works] == ["https://openalex.org/W1"]
+    assert works[0]["doi"] == "https://doi.org/10.5555/attn"
+    assert works[0]["authorships"][0]["author"]["display_name"] == "Jane Vaswani"
+
+
+def test_all_title_words_ranked_by_citations(index):
+    works = index.search("attention need")
+    assert [w["id"] for w in works] == ["https://openalex.org/W1", "https://openalex.org/W2"]
+
+
+def test_any_title_word_within_the_year_window(index):
+    works = index.search("graph methods for nothing in particular", year=2011, first_author="G. Karypis")
+    assert {w["id"] for w in works} == {"https://openalex.org/W3", "https://openalex.org/W4"}
+    assert index.search("graph methods for nothing in particular", year=1990) == []
+
+
+def test_lookup_doi_and_stats(index):
+    assert [w["id"] for w in index.lookup_doi("doi:10.5555/ATTN")] == ["https://openalex.org/W1"]
+    assert index.lookup_doi("not a doi") == []
+    assert index.stats() == {"works": 4}
+
+
+def test_rebuild_updates_works_in_place(index, tmp_path):
+    shard = tmp_path / "update" / "part_001.jsonl"
+    shard.parent.mkdir()
+    shard.write_text(json.dumps(_work(3, "Multilevel graph partitioning", 2010, "Karypis")) + "\n", encoding="utf-8")
+    build_index([str(shard)], index.path)
+    reopened = OpenAlexIndex(index.path)
+    assert reopened.stats() == {"works": 4}
+    assert [w["id"] for w in reopened.search("multilevel graph partitioning")] == ["https://openalex.org/W3"]
+    assert reopened.search("graph partitioning for sparse matrices", year=1990) == []
+
+
+def test_missing_index_is_an_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        OpenAlexIndex(str(tmp_path / "nope.sqlite"))
@@ -0,0 +1,117 @@
+import json
+
+import dspy
+import pytest
+
+import cache
+import dspy_models
+from dspy_models import _batch_items, parse_reference_batch, plan_parse_batches
+from rate_limit import CircuitOpenError
+
+
+@pytest.fixture(autouse=True)
+def fresh_cap():
+    dspy_models.reset_parse_batch_cap()
+    yield
+    dspy_models.reset_parse_batch_cap()
+
+
+def test_batches_respect_batch_size():
+    refs = ["A short reference."] * 7
+    assert plan_parse_batches(refs, batch_size=3) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert plan_parse_batches(refs, batch_size=1) == [[i] for i in range(7)]
+
+
+def test_batches_respect_the_context_budget():
+    overhead = dspy_models._batch_prompt_overhead()
+    per_ref = dspy_models.estimate_tokens("x" * 400) + dspy_models.LLM_PARSE_OUTPUT_TOKENS_PER_REF + 8
+    refs = ["x" * 400] * 6
+    batches = plan_parse_batches(refs, batch_size=50, context_tokens=overhead + 2 * per_ref)
+    assert batches == [[0, 1], [2, 3], [4, 5]]
+    # a reference larger than the budget still gets a batch of its own
+    assert plan_parse_batches(["x" * 40000, "y"], batch_size=50, context_tokens=overhead + per_ref) == [[0], [1]]
+
+
+def test_batches_respect_the_cap_until_reset():
+    dspy_models._parse_batch_cap = 2
+    assert plan_parse_batches(["r"] * 5, batch_size=8) == [[0, 1], [2, 3], [4]]
+    dspy_models.reset_parse_batch_cap()
+    assert plan_parse_batches(["r"] * 5, batch_size=8) == [[0, 1, 2, 3, 4]]
+
+
+def test_batch_items_reads_the_array():
+    raw = 'Here you go:\n[{"index": 1, "paper_title": "B"}, {"index": 0, "paper_title": "A"}]\nDone.'
+    assert _batch_items(raw, 2) == {0: {"index": 0, "paper_title": "A"}, 1: {"index": 1, "paper_title": "B"}}
+
+
+def test_batch_items_skips_bad_entries():
+    raw = json.dumps([
+        {"index": 0, "paper_title": "A"},
+        {"index": 0, "paper_title": "duplicate"},
+        {"index": 7, "paper_title": "out of range"},
+        {"index": "x", "paper_title": "bad index"},
+        {"index": 1},
+        "not an object",
+        {"paper_title": "position as index"},
+    ])
+    assert _batch_items(raw, 7) == {0: {"index": 0, "paper_title": "A"}, 6: {"paper_title": "position as index"}}
+
+
+@pytest.mark.parametrize("raw", [None, "", "no array here", '[{"index": 0, "paper_title": "cut sh', '{"a": [1}'])
+def test_batch_items_unreadable(raw):
+    assert _batch_items(raw, 3) is None
+
+
+def test_unreadable_batch_is_split_and_caps_later_batches(monkeypatch):
+    calls = []
+
+    def fake_predict(module, lm_config=None, **inputs):
+        refs = json.loads(inputs["refs_json"])
+        calls.append(len(refs))
+        if len(refs) > 2:
+            return dspy.Prediction(parsed_json='[{"index": 0, "paper_title": "trunc')
+        return dspy.Prediction(parsed_json=json.dumps(
+            [{"index": r["index"], "paper_title": r["ref_text"], "year": 2020} for r in refs]
+        ))
+
+    monkeypatch.setattr(dspy_models, "_predict", fake_predict)
+    results = parse_reference_batch(["Ref one", "Ref two", "Ref three", "Ref four"])
+    assert calls == [4, 2, 2]
+    assert [r["paper_title"] for r in results] == ["Ref one", "Ref two", "Ref three", "Ref four"]
+    assert dspy_models._parse_batch_cap == 2
+
+
+def test_open_breaker_is_raised_without_splitting(monkeypatch):
+    calls = []
+
+    def fake_predict(module, lm_config=None, **inputs):
+        calls.append(inputs["refs_json"])
+        raise CircuitOpenError("llm")
+
+    monkeypatch.setattr(dspy_models, "_predict", fake_predict)
+    with pytest.raises(CircuitOpenError):
+        parse_reference_batch(["Ref one", "Ref two", "Ref three", "Ref four"])
+    assert len(calls) == 1
+    assert dspy_models._parse_batch_cap is None
+
+
+def test_unreadable_batch_output_is_not_cached(monkeypatch, tmp_path):
+    outputs = ['[{"index": 0, "paper_title": "trunc', '[{"index": 0, "paper_title": "A"}, {"index": 1, "paper_title": "B"}]']
+    calls = []
+
+    def fake_call_lm(module, signature_name, inputs, lm_config=None):
+        calls.append(signature_name)
+        return dspy.Prediction(parsed_json=outputs.pop(0))
+
+    monkeypatch.setattr(dspy_models, "_call_lm", fake_call_lm)
+    monkeypatch.setattr(dspy_models, "_parse_individually", lambda ref_text: {"paper_title": ref_text})
+    cache.configure_prediction_cache(str(tmp_path))
+    try:
+        # the truncated output is split and parsed one by one, and not written to the cache ...
+        assert [r["paper_title"] for r in parse_reference_batch(["Ref A", "Ref B"])] == ["Ref A", "Ref B"]
+        # ... so a rerun asks the LLM again; the readable answer is cached and replayed after that
+        assert [r["paper_title"] for r in parse_reference_batch(["Ref A", "Ref B"])] == ["A", "B"]
+        assert [r["paper_title"] for r in parse_reference_batch(["Ref A", "Ref B"])] == ["A", "B"]
+    finally:
+        cache.configure_prediction_cache()
+    assert calls == ["ParseReferenceBatch", "ParseReferenceBatch"]
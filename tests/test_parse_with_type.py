@@ -0,0 +1,61 @@
+import json
+
+import dspy
+import pytest
+
+import dspy_models
+import pipeline
+
+REF = "Vaswani, A., & Shazeer, N. (2017). Attention is all you need. NeurIPS. a.vaswani@example.com"
+
+PARSE_FIELDS = dict(
+    paper_title="Attention is all you need",
+    year="2017",
+    authors_json=json.dumps(["A. Vaswani", "N. Shazeer"]),
+    emails_json=json.dumps(["a.vaswani@example.com"]),
+    authors_structured_json=json.dumps([
+        {"name": "A. Vaswani", "affiliations": ["Google Brain"], "emails": ["a.vaswani@example.com"]},
+        {"name": "N. Shazeer", "affiliations": ["Google Research"], "emails": []},
+    ]),
+)
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    def fake_predict(module, lm_config=None, **inputs):
+        calls.append(module.signature.__name__)
+        if module is dspy_models.infer_type_module:
+            return dspy.Prediction(work_type="conference paper")
+        if module is dspy_models.parse_with_type_module:
+            return dspy.Prediction(**PARSE_FIELDS, work_type="conference paper")
+        return dspy.Prediction(**PARSE_FIELDS)
+
+    monkeypatch.setattr(dspy_models, "_predict", fake_predict)
+    monkeypatch.setattr(pipeline, "local_candidates", lambda parsed: [])
+    monkeypatch.setattr(pipeline, "fetch_openalex_candidates", lambda *args, **kwargs: [])
+    monkeypatch.setattr(pipeline, "fetch_semantic_scholar_candidates", lambda *args, **kwargs: [])
+    return calls
+
+
+def test_combined_parse_gives_the_two_call_dict_in_one_call(llm_calls):
+    combined = pipeline.parse_reference(REF, combined_parse=True, parser="llm")
+    assert llm_calls == ["ParseReferenceWithType"]
+    separate = pipeline.parse_reference(REF, combined_parse=False, parser="llm")
+    assert llm_calls[1:] == ["ParseReference", "InferWorkType"]
+    assert combined == separate
+    assert combined["work_type"] == "proceedings-article"
+    assert combined["first_affiliations"] == ["Google Brain"]
+    assert combined["last_affiliations"] == ["Google Research"]
+
+
+def test_combined_parse_feeds_process_single_reference(llm_calls):
+    combined = pipeline.process_single_reference(REF, combined_parse=True, parser="llm", s2_mode="fallback")
+    separate = pipeline.process_single_reference(REF, combined_parse=False, parser="llm", s2_mode="fallback")
+    assert combined == separate
+    assert combined["paper_title"] == "Attention is all you need"
+    assert combined["year"] == 2017
+    assert (combined["first_author_name"], combined["last_author_name"]) == ("A. Vaswani", "N. Shazeer")
+    assert combined["first_author_affiliations"] == "Google Brain"
+    assert combined["first_author_emails"] == "a.vaswani@example.com"
@@ -0,0 +1,210 @@
+import pytest
+import requests
+
+import concurrency
+import config
+import http_client
+import rate_limit
+from rate_limit import CircuitOpenError, Limiter
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A limiter whose breaker opens after 2 failures and cools down immediately."""
+    monkeypatch.setattr(rate_limit, "CIRCUIT_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(rate_limit, "CIRCUIT_BREAKER_COOLDOWN", 0.0)
+    rate_limit.reset_limiters()
+    yield Limiter("test")
+    rate_limit.reset_limiters()
+
+
+def _open(limiter, cooldown=0.0):
+    for _ in range(2):
+        limiter.acquire()
+        limiter.on_failure()
+    assert limiter._open_until
+
+
+def test_breaker_opens_and_probe_closes_it(breaker, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CIRCUIT_BREAKER_COOLDOWN", 60.0)
+    _open(breaker)
+    assert breaker.state()["open"]
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+    breaker._open_until = 1.0  # cooldown over
+    probe = breaker.acquire()
+    assert probe
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()  # only one probe at a time
+    breaker.on_success()
+    breaker.release_probe(probe)
+    assert breaker.acquire() == 0
+    assert not breaker.state()["open"]
+
+
+def test_failed_probe_reopens(breaker, monkeypatch):
+    _open(breaker)
+    probe = breaker.acquire()
+    monkeypatch.setattr(rate_limit, "CIRCUIT_BREAKER_COOLDOWN", 60.0)
+    breaker.on_failure()
+    breaker.release_probe(probe)
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+
+def test_unreported_probe_is_released(breaker):
+    _open(breaker)
+    probe = breaker.acquire()
+    breaker.release_probe(probe)  # the call ended without a verdict
+    for _ in range(3):
+        next_probe = breaker.acquire()
+        assert next_probe
+        breaker.release_probe(next_probe)
+
+
+def test_stale_ticket_does_not_release_a_newer_probe(breaker):
+    _open(breaker)
+    first = breaker.acquire()
+    breaker.on_throttle()  # reported; a new probe may start
+    second = breaker.acquire()
+    breaker.release_probe(first)
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.release_probe(second)
+    assert breaker.acquire()
+
+
+def test_throttle_halves_rate_and_pauses():
+    limiter = Limiter("test", rate=10.0)
+    limiter.on_throttle(retry_after=5.0)
+    assert limiter.rate == 5.0
+    wait, _ = limiter._reserve()
+    assert 4.0 < wait <= 5.0
+
+
+def test_parse_retry_after():
+    assert rate_limit.parse_retry_after("3") == 3.0
+    assert rate_limit.parse_retry_after("-1") == 0.0
+    assert rate_limit.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert rate_limit.parse_retry_after("soon") is None
+    assert rate_limit.parse_retry_after(None) is None
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b"{}"
+
+
+class _Session:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def session(monkeypatch, breaker):
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+
+    def install(*outcomes):
+        fake = _Session(outcomes)
+        monkeypatch.setattr(http_client, "get_session", lambda: fake)
+        return fake
+    return install
+
+
+def test_request_error_during_probe_does_not_lock_breaker(session):
+    limiter = rate_limit.get_limiter("host.test")
+    _open(limiter)
+    session(requests.exceptions.InvalidURL("bad url"), _Response(200))
+    with pytest.raises(requests.exceptions.InvalidURL):
+        http_client.http_get("http://host.test/x")
+    assert http_client.http_get("http://host.test/x").status_code == 200
+    assert not limiter.state()["open"]
+
+
+def test_unexpected_error_during_probe_releases_it(session):
+    limiter = rate_limit.get_limiter("host.test")
+    _open(limiter)
+    session(KeyError("boom"), _Response(200))
+    with pytest.raises(KeyError):
+        http_client.http_get("http://host.test/x")
+    assert http_client.http_get("http://host.test/x").status_code == 200
+
+
+def test_500_counts_towards_the_breaker(session, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CIRCUIT_BREAKER_COOLDOWN", 60.0)
+    fake = session(_Response(500), _Response(500))
+    assert http_client.http_get("http://host.test/x").status_code == 500
+    assert http_client.http_get("http://host.test/x").status_code == 500
+    assert fake.calls == 2  # 500 is not retried
+    with pytest.raises(CircuitOpenError):
+        http_client.http_get("http://host.test/x")
+
+
+def test_503_is_retried_then_succeeds(session):
+    fake = session(_Response(503), requests.ConnectionError("reset"), _Response(200))
+    assert http_client.http_get("http://host.test/x").status_code == 200
+    assert fake.calls == 3
+
+
+def test_llm_output_error_during_probe_does_not_lock_breaker(breaker, monkeypatch):
+    import dspy_models
+
+    monkeypatch.setattr(dspy_models, "get_lm", lambda: None)
+    limiter = rate_limit.get_limiter("llm")
+    _open(limiter)
+
+    def unparseable(**kwargs):
+        raise ValueError("Adapter could not parse the LM response")
+
+    with pytest.raises(ValueError):
+        dspy_models._call_lm(unparseable, "Sig", {})
+    assert dspy_models._call_lm(lambda **kwargs: "ok", "Sig", {}) == "ok"
+    assert dspy_models._call_lm(lambda **kwargs: "ok", "Sig", {}) == "ok"
+
+
+def test_unlimited_rate_recovers_only_to_the_throttled_rate():
+    limiter = Limiter("test")
+    for _ in range(8):
+        assert limiter._reserve() == (0, 0)  # unlimited: no waiting
+    limiter.on_throttle()
+    assert (limiter.rate, limiter.max_rate) == (4.0, 8.0)
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.rate == 8.0
+
+
+def test_slot_is_released_while_waiting_to_retry(session, monkeypatch):
+    concurrency.configure_limits(openalex=1)
+    sem = concurrency._slots["openalex"]
+    free = []
+
+    def slot_free():
+        if sem.acquire(blocking=False):
+            sem.release()
+            return True
+        return False
+
+    class _Checking(_Session):
+        def request(self, method, url, **kwargs):
+            free.append(("request", slot_free()))
+            return super().request(method, url, **kwargs)
+
+    fake = _Checking([_Response(429), _Response(200)])
+    monkeypatch.setattr(http_client, "get_session", lambda: fake)
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: free.append(("sleep", slot_free())))
+    try:
+        assert http_client.http_get("http://host.test/x", service="openalex").status_code == 200
+    finally:
+        concurrency.configure_limits(openalex=config.OPENALEX_MAX_CONCURRENCY)
+    assert free == [("request", False), ("sleep", True), ("request", False)]
@@ -0,0 +1,125 @@
+import pytest
+
+from config import RULE_PARSER_MIN_CONFIDENCE
+from pdf_utils import iter_references, iter_references_from_pdf, split_into_references
+from reference_parser import parse_reference_rules
+
+
+APA_PAGES = [
+    [
+        "6 Conclusion",
+        "We showed that the approach works in 2019 and later years.",
+        "References",
+        "Smith, J. A., Doe, B., &",
+        "Brown, K. (2019). Learning to match citations at scale. Journal of",
+        "Data Science, 12(3), 45-67.",
+        "Vaswani, A., & Shazeer, N. (2017). Attention is all you need. In Advances",
+    ],
+    [
+        "in Neural Information Processing Systems (pp. 5998-6008).",
+        "Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks, 8, 1-20.",
+        "Lee, H., & Park, S. (2018). Sparse attention for long documents. Journal of",
+        "Machine Learning Research, 19(1), 1-30.",
+        "Ng, A. (2004). Feature selection, L1 vs. L2 regularization, and rotational",
+        "invariance. In Proceedings of ICML (pp. 78-85).",
+    ],
+]
+
+
+@pytest.mark.parametrize("detect_bibliography", [False, True])
+def test_apa_bibliography_from_pdf_to_parsed_references(write_pdf, detect_bibliography):
+    pdf = write_pdf(APA_PAGES)
+    refs = list(iter_references_from_pdf(pdf, processes=1, detect_bibliography=detect_bibliography))
+    parsed = [parse_reference_rules(ref) for ref in refs]
+    assert [(p["paper_title"], p["year"]) for p in parsed] == [
+        ("Learning to match citations at scale", 2019),
+        ("Attention is all you need", 2017),
+        ("Graph partitioning for sparse matrices", 2020),
+        ("Sparse attention for long documents", 2018),
+        ("Feature selection, L1 vs. L2 regularization, and rotational invariance", 2004),
+    ]
+    assert len(parsed[0]["authors"]) == 3  # the author list running onto a second line
+
+
+def test_entry_split_across_a_page_break_stays_whole():
+    pages = [
+        ["References", "[1] Smith, J. (2019). Learning to match citations at scale. Journal of",
+         "Data Science, 12(3), 45-67.", "[2] Vaswani, A., & Shazeer, N. (2017). Attention is all you need. In"],
+        ["Advances in Neural Information Processing Systems (pp. 5998-6008).",
+         "[3] Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks, 8, 1-20."],
+    ]
+    consumed = []
+
+    def lines():
+        for n, page in enumerate(pages):
+            for line in page:
+                consumed.append(n)
+                yield line
+
+    refs = iter_references(lines())
+    assert next(refs).startswith("[1] Smith")
+    assert consumed[-1] == 0  # the first entry is out before the next page is read
+    second = next(refs)
+    assert second.endswith("Systems (pp. 5998-6008).")
+    assert parse_reference_rules(second)["paper_title"] == "Attention is all you need"
+    assert list(refs) == ["[3] Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks, 8, 1-20."]
+
+
+def test_numbered_entries_are_split_in_sequence():
+    text = "\n".join([
+        "1 Introduction",
+        "1. A numbered list in the body text.",
+        "References",
+        "1. Smith, J. (2019). Learning to match citations at scale. Journal of Data Science,",
+        "12. 2019.",
+        "2. Vaswani, A. (2017). Attention is all you need. In NeurIPS.",
+        "(3) Zhang, Y. (2020). Graph partitioning for sparse matrices. Networks.",
+    ])
+    refs = split_into_references(text)
+    assert len(refs) == 3
+    assert refs[0].endswith("12. 2019.")
+    assert [parse_reference_rules(r)["paper_title"] for r in refs] == [
+        "Learning to match citations at scale",
+        "Attention is all you need",
+        "Graph partitioning for sparse matrices",
+    ]
+
+
+def test_bracketed_entries_keep_author_lines():
+    text = "\n".join([
+        "[Hill '79] Hill, R. (1979). A first title of a reference. Some",
+        "Journal, Keller, T., & Others, 3(1).",
+        "[2] Doe, J. 2001. Another title here. Venue.",
+    ])
+    assert len(split_into_references(text)) == 2
+
+
+@pytest.mark.parametrize("ref, title, year, n_authors", [
+    ("[Hill '79] Hill, R., & Keller, T. (1979). A first title of a reference. Some Journal, 3(1), 1-9.",
+     "A first title of a reference", 1979, 2),
+    ("12. Smith, J. A., Doe, B. (2019). Learning to match citations at scale. Journal of Data Science, 12(3), 45-67.",
+     "Learning to match citations at scale", 2019, 2),
+    ("Vaswani, A., Shazeer, N., & Parmar, N. (2017). Attention is all you need. In Advances in Neural "
+     "Information Processing Systems (pp. 5998-6008).",
+     "Attention is all you need", 2017, 3),
+    ("[3] Ashish Vaswani, Noam Shazeer, and Niki Parmar. 2017. Attention is all you need. In Proceedings of "
+     "NeurIPS. 5998-6008.",
+     "Attention is all you need", 2017, 3),
+    ('[4] A. Vaswani, N. Shazeer and N. Parmar, "Attention is all you need," in Proc. NeurIPS, 2017, pp. 5998-6008.',
+     "Attention is all you need", 2017, 3),
+])
+def test_supported_styles_parse_with_confidence(ref, title, year, n_authors):
+    parsed = parse_reference_rules(ref)
+    assert (parsed["paper_title"], parsed["year"], len(parsed["authors"])) == (title, year, n_authors)
+    assert parsed["confidence"] >= RULE_PARSER_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("ref", [
+    "[3] Smith, J. (2010). Springer, p. 45.",  # title cut at "p."
+    "[4] Doe, J. (1999). LII. Journal of Things, 3(1), 1-9.",
+    "[Olsen '02] Olsen, Lena. Regression inference embedding sparse representation retrieval. Proceedings of the "
+    "International Conference on Machine Learning 10.2 (2002): 1-20. https://doi.org/10.5555/bench.9",
+    "Some notes on a talk given at a workshop, no authors or year here.",
+])
+def test_misparses_stay_below_the_threshold(ref):
+    assert parse_reference_rules(ref)["confidence"] < RULE_PARSER_MIN_CONFIDENCE
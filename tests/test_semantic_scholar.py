@@ -0,0 +1,170 @@
+import threading
+
+import pytest
+
+import cache
+import concurrency
+import config
+import http_client
+import pipeline
+import rate_limit
+import semantic_scholar_client
+from semantic_scholar_client import fetch_semantic_scholar_batch, resolve_semantic_scholar_bulk
+
+
+def _paper(n, name="Ada Lovelace", affiliation="Analytical Society"):
+    return {"paperId": f"P{n}", "title": f"Paper {n}", "year": 2017,
+            "authors": [{"name": name, "affiliations": [affiliation]}], "venue": "dropped"}
+
+
+@pytest.fixture
+def s2(monkeypatch):
+    """Stub _s2_request: /paper/batch answers from `batch` (absent ids -> None), /search/match from `match`."""
+    batch, match, calls = {}, {}, []
+
+    def request(url, params, json_body=None):
+        calls.append((url.rsplit("/graph/v1", 1)[-1], json_body["ids"] if json_body else params["query"]))
+        if url.endswith("/paper/batch"):
+            return [batch.get(pid) for pid in json_body["ids"]]
+        if url.endswith("/paper/search/match"):
+            return {"data": [match[params["query"]]]} if params["query"] in match else {}
+        raise AssertionError(url)
+
+    monkeypatch.setattr(semantic_scholar_client, "_s2_request", request)
+    cache.configure_response_cache(enabled=False)
+    yield batch, match, calls
+    cache.configure_response_cache()
+
+
+def test_batch_maps_papers_back_to_their_ids(s2):
+    batch, _, calls = s2
+    batch.update({"DOI:10.1/a": _paper(1), "DOI:10.1/c": _paper(3)})
+    ids = ["DOI:10.1/a", "DOI:10.1/b", "DOI:10.1/c", "DOI:10.1/a", "DOI:10.1/d"]
+    papers = fetch_semantic_scholar_batch(ids, batch_size=2)
+    assert [p and p["paperId"] for p in papers] == ["P1", None, "P3", "P1", None]
+    assert "venue" not in papers[0]  # compacted
+    assert [c[1] for c in calls] == [["DOI:10.1/a", "DOI:10.1/b"], ["DOI:10.1/c", "DOI:10.1/d"]]
+
+
+def test_rate_limited_batch_leaves_ids_unresolved(monkeypatch):
+    monkeypatch.setattr(semantic_scholar_client, "_s2_request", lambda *args, **kwargs: {"rate_limited": True})
+    cache.configure_response_cache(enabled=False)
+    try:
+        assert fetch_semantic_scholar_batch(["DOI:10.1/a", "DOI:10.1/b"]) == [None, None]
+    finally:
+        cache.configure_response_cache()
+
+
+def test_bulk_resolves_dois_then_titles(s2):
+    batch, match, calls = s2
+    batch["DOI:10.1/a"] = _paper(1)
+    match.update({"Title of B": _paper(2), "Title of C": _paper(3)})
+    parsed = [
+        {"paper_title": "Title of A", "doi": "10.1/a"},
+        {"paper_title": "Title of B", "doi": "10.1/b"},  # None in the batch response: falls back to the title
+        {"paper_title": "Title of C", "year": 2017},
+        {"paper_title": "Title of D"},
+        {"paper_title": ""},
+    ]
+    resolved = resolve_semantic_scholar_bulk(parsed)
+    assert [p and p["paperId"] for p in resolved] == ["P1", "P2", "P3", None, None]
+    assert calls == [
+        ("/paper/batch", ["DOI:10.1/a", "DOI:10.1/b"]),
+        ("/paper/search/match", "Title of B"),
+        ("/paper/search/match", "Title of C"),
+        ("/paper/search/match", "Title of D"),
+    ]
+
+
+WORK = {
+    "id": "https://openalex.org/W1",
+    "title": "Attention is all you need",
+    "publication_year": 2017,
+    "type": "journal-article",
+    "authorships": [{"author": {"display_name": "Ashish Vaswani"}, "institutions": []}],
+}
+REF = "[1] Vaswani, A. (2017). Attention is all you need. Journal of Things, 1(1), 1-9."
+
+
+@pytest.fixture
+def speculative(monkeypatch):
+    release = threading.Event()
+    started = threading.Event()
+    lookups = []
+
+    def s2_search(title, year=None):
+        lookups.append(title)
+        started.set()
+        release.wait(5)
+        return [_paper(9, "S2 Author", "S2 Institute")]
+
+    monkeypatch.setattr(pipeline, "fetch_semantic_scholar_candidates", s2_search)
+    yield lookups, started, release
+    release.set()
+
+
+def test_speculative_s2_is_ignored_when_openalex_matches(monkeypatch, speculative):
+    lookups, started, _ = speculative
+    monkeypatch.setattr(pipeline, "local_candidates", lambda parsed: [WORK])
+    record = pipeline.process_single_reference(REF, parser="rules", s2_mode="speculative")
+    assert "Matched to https://openalex.org/W1" in record["notes"]
+    assert "Semantic Scholar" not in record["notes"]
+    assert record["first_author_name"] == "Ashish Vaswani"
+    assert started.wait(5) and lookups == ["Attention is all you need"]  # started early, result never awaited
+
+
+def test_speculative_s2_fills_in_when_openalex_does_not_match(monkeypatch, speculative):
+    _, _, release = speculative
+    monkeypatch.setattr(pipeline, "local_candidates", lambda parsed: [])
+    monkeypatch.setattr(pipeline, "fetch_openalex_candidates", lambda *args, **kwargs: [])
+    release.set()
+    record = pipeline.process_single_reference(REF, parser="rules", s2_mode="speculative")
+    assert "Filled from Semantic Scholar fallback." in record["notes"]
+    assert record["first_author_affiliations"] == "S2 Institute"
+
+
+def test_speculative_lookup_survives_a_pool_resize(monkeypatch):
+    caps = iter([1, 2, 3, 4])
+    monkeypatch.setattr(pipeline, "get_limits", lambda: {"semantic_scholar": next(caps)})
+    futures = [pipeline._submit_s2(lambda n: n * 2, n) for n in range(4)]  # each call replaces the pool
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6]
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b'{"data": []}'
+
+    def raise_for_status(self):
+        pass
+
+
+def test_throttled_request_frees_its_slot_during_retry_after(monkeypatch):
+    concurrency.configure_limits(semantic_scholar=1)
+    sem = concurrency._slots["semantic_scholar"]
+    responses = [_Response(429, {"Retry-After": "5"}), _Response(200)]
+    held = []
+
+    def slot_taken():
+        if sem.acquire(blocking=False):
+            sem.release()
+            return False
+        return True
+
+    class Session:
+        def request(self, method, url, **kwargs):
+            held.append(("request", slot_taken()))
+            return responses.pop(0)
+
+    monkeypatch.setattr(http_client, "get_session", lambda: Session())
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: held.append(("sleep", slot_taken())))
+    rate_limit.reset_limiters()
+    try:
+        url = f"{config.SEMANTIC_SCHOLAR_BASE_URL}/paper/search"
+        assert semantic_scholar_client._s2_request(url, {}) == {"data": []}
+    finally:
+        rate_limit.reset_limiters()
+        concurrency.configure_limits(semantic_scholar=config.SEMANTIC_SCHOLAR_MAX_CONCURRENCY)
+    assert ("sleep", False) in held
+    assert [taken for kind, taken in held if kind == "request"] == [True, True]
@@ -0,0 +1,87 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import cache
+import pipeline
+import serve
+
+REF = "[1] Vaswani, A., & Shazeer, N. (2017). Attention is all you need. In Proceedings of NeurIPS, 5998-6008."
+BAD_REF = "[2] Doe, J. (2020). A reference that makes the index lookup fail. Journal of Things, 1(1), 1-9."
+WORK = {
+    "id": "https://openalex.org/W1",
+    "title": "Attention is all you need",
+    "publication_year": 2017,
+    "type": "proceedings-article",
+    "authorships": [
+        {"author": {"display_name": "Ashish Vaswani"}, "institutions": [{"display_name": "Google Brain"}]},
+        {"author": {"display_name": "Noam Shazeer"}, "institutions": [{"display_name": "Google Research"}]},
+    ],
+}
+
+
+def _local_candidates(parsed):
+    if "index lookup fail" in parsed["paper_title"]:
+        raise RuntimeError("index unavailable")
+    return [WORK]
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.setattr(pipeline, "local_candidates", _local_candidates)
+    monkeypatch.setattr(pipeline, "fetch_openalex_candidates", lambda *args, **kwargs: [])
+    monkeypatch.setattr(pipeline, "fetch_semantic_scholar_candidates", lambda *args, **kwargs: [])
+    httpd, service = serve.make_server(
+        port=0, workers=2, options={"parser": "rules", "s2_mode": "fallback"},
+        cache_dir=str(tmp_path), extract_options={"processes": 1}, warm=False,
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+    cache.configure_response_cache()
+    cache.configure_prediction_cache()
+
+
+def _request(url, data=None, content_type="application/json"):
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": content_type} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_reference_job_runs_through_submit_status_and_result(server):
+    status, job = _request(f"{server}/jobs?name=refs", json.dumps({"references": [REF, BAD_REF]}).encode())
+    assert status == 202
+    assert (job["kind"], job["name"], job["total"]) == ("references", "refs", 2)
+
+    status, described = _request(f"{server}/jobs/{job['id']}?wait=10")
+    assert status == 200
+    assert (described["status"], described["done"], described["errors"]) == ("done", 2, 1)
+
+    status, result = _request(f"{server}/jobs/{job['id']}/result")
+    assert status == 200
+    assert result["job"]["id"] == job["id"]
+    good, bad = result["records"]
+    assert good["paper_title"] == "Attention is all you need"
+    assert (good["first_author_name"], good["last_author_name"]) == ("Ashish Vaswani", "Noam Shazeer")
+    assert good["first_author_affiliations"] == "Google Brain"
+    assert "Matched to https://openalex.org/W1" in good["notes"]
+    assert bad == pipeline.error_record(BAD_REF, RuntimeError("index unavailable"))
+
+
+def test_plain_text_submission_and_unknown_jobs(server):
+    status, job = _request(f"{server}/jobs?parser=rules", f"{REF}\n\n".encode(), "text/plain")
+    assert (status, job["total"]) == (202, 1)
+    _, result = _request(f"{server}/jobs/{job['id']}/result?wait=10")
+    assert [r["reference_raw"] for r in result["records"]] == [REF]
+
+    assert _request(f"{server}/jobs/nope")[0] == 404
+    assert _request(f"{server}/jobs?parser=magic", b"[]")[0] == 400